@@ -1,9 +1,19 @@
 import praw
 import requests
 import os
+import io
+import shutil
 import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 from dotenv import load_dotenv
 from PIL import Image
+from requests.adapters import HTTPAdapter
+from disk_cache import content_hash
+from perceptual_hash import dhash
+from reddit_api import SharedRequestor
 
 # Load environment variables from .env file
 load_dotenv()
@@ -13,8 +23,16 @@ class RedditBot:
     A class to interact with Reddit API and download images from subreddits
     """
     
-    def __init__(self):
-        """Initialize the Reddit API connection using credentials from environment variables"""
+    def __init__(self, download_workers=8, downloads_per_host=4, image_cache=None, requestor_kwargs=None):
+        """Initialize the Reddit API connection using credentials from environment variables
+        
+        Args:
+            download_workers (int): Maximum number of images downloaded in parallel
+            downloads_per_host (int): Maximum number of parallel downloads against the same host
+            image_cache (DiskCache): Optional persistent cache of already converted images
+            requestor_kwargs (dict): Optional settings of the shared rate limiter and listing
+                cache (see reddit_api.SharedRequestor); None uses praw's own requestor
+        """
         try:
             # Get the credentials from environment variables
             client_id = os.getenv('ID')
@@ -30,6 +48,8 @@ class RedditBot:
                 client_id=client_id,
                 client_secret=client_secret,
                 user_agent=user_agent,
+                requestor_class=SharedRequestor if requestor_kwargs is not None else None,
+                requestor_kwargs=requestor_kwargs,
             )
             
             logging.info("Connected to Reddit API successfully")
@@ -40,8 +60,272 @@ class RedditBot:
         except Exception as e:
             logging.error(f"Error initializing RedditBot: {str(e)}")
             raise
+        
+        self.download_workers = max(1, int(download_workers))
+        self.downloads_per_host = max(1, int(downloads_per_host))
+        self.image_cache = image_cache
+        
+        # Shared keep-alive session so every download reuses the pooled connections
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.download_workers,
+                              pool_maxsize=self.download_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        
+        # One semaphore per host to bound the parallel fetches against it
+        self._host_slots = {}
+        self._host_slots_lock = threading.Lock()
+    
+    def _host_slot(self, url):
+        """Returns the semaphore that limits parallel downloads for the url's host"""
+        host = urlparse(url).netloc
+        with self._host_slots_lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.downloads_per_host)
+            return self._host_slots[host]
+    
+    def _fetch(self, url):
+        """Downloads a single url through the shared session and returns its content"""
+        with self._host_slot(url):
+            response = self.session.get(url, timeout=10)
+            response.raise_for_status()  # Raise exception for HTTP errors
+            return response.content
+    
+    def _fetch_image(self, post):
+        """
+        Returns a post's image as JPG, going through the image cache when available
+        
+        A cache hit by post id or url skips the download, and a download whose content
+        was already cached under another url skips the conversion.
+        
+        Returns:
+            tuple: (cached_path, jpg_bytes) where exactly one of them is set
+        """
+        url = post.url
+        keys = (f"post:{post.id}", f"url:{url}")
+        
+        if self.image_cache:
+            cached_path = self.image_cache.lookup(*keys)
+            if cached_path:
+                return cached_path, None
+        
+        content = self._fetch(url)
+        digest = content_hash(content)
+        
+        if self.image_cache:
+            cached_path = self.image_cache.get(digest, keys=keys)
+            if cached_path:
+                return cached_path, None
+        
+        # If the image is not a jpg but we need jpg for video creation, convert it
+        extension = url.split('.')[-1]
+        if extension != 'jpg':
+            img = Image.open(io.BytesIO(content))
+            img = img.convert('RGB')  # Convert to RGB to ensure compatibility
+            buffer = io.BytesIO()
+            img.save(buffer, format='JPEG')
+            content = buffer.getvalue()
+            logging.info(f"Converted {extension} to jpg: {url}")
+        
+        if self.image_cache:
+            return self.image_cache.store(digest, content, keys=keys), None
+        return None, content
+    
+    def read_image(self, post, cached_path, content):
+        """
+        Returns the JPG bytes of a result of _fetch_image
+        
+        Another process may evict a cached file (LRU) between the lookup and this
+        read; the image is then fetched again, which stores it back in the cache.
+        """
+        if not cached_path:
+            return content
+        try:
+            with open(cached_path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            logging.info(f"Cached image evicted before use, fetching it again: {post.url}")
+        cached_path, content = self._fetch_image(post)
+        if not cached_path:
+            return content
+        with open(cached_path, 'rb') as f:
+            return f.read()
+    
+    def _fetch_unseen_image(self, post, seen, sub_name):
+        """
+        Like _fetch_image, but claims the post in the seen-post index
+        
+        The image is identified by the hash of its JPG and by a perceptual hash, so
+        re-encoded or resized copies of an image already used are dropped too.
+        
+        Returns:
+            tuple: the value of _fetch_image, or None if the same (or a near-identical)
+            image was already used
+        """
+        cached_path, content = self._fetch_image(post)
+        data = self.read_image(post, cached_path, content)
+        if not seen.claim(post.id, content_hash(data), dhash(data), sub_name, post.url):
+            logging.info(f"Skipping image already used in a video: {post.url}")
+            return None
+        return cached_path, content
+    
+    def _download_in_order(self, posts, fetch=None, wanted=None):
+        """
+        Downloads the images of the given posts concurrently, yielding the results in the original order
+        
+        At most ``download_workers * 2`` downloads are kept in flight, so the listing is
+        consumed as the downloads progress instead of being walked up front. With
+        ``wanted``, no more posts are taken from the listing once the successful and
+        in-flight downloads add up to ``wanted``; a failed download makes room for the
+        next post.
+        
+        Yields:
+            tuple: (post, result) where result is the value of ``fetch`` (by default
+            _fetch_image), or None if the download failed
+        """
+        fetch = fetch or self._fetch_image
+        window = self.download_workers * 2
+        posts = iter(posts)
+        delivered = 0
+        with ThreadPoolExecutor(max_workers=self.download_workers) as executor:
+            in_flight = deque()
+            while True:
+                while len(in_flight) < window and (wanted is None or delivered + len(in_flight) < wanted):
+                    post = next(posts, None)
+                    if post is None:
+                        break
+                    in_flight.append((post, executor.submit(fetch, post)))
+                if not in_flight:
+                    break
+                post, result = self._collect(*in_flight.popleft())
+                if result is not None:
+                    delivered += 1
+                yield post, result
+    
+    @staticmethod
+    def _collect(post, future):
+        """Waits for a download future, logging failures"""
+        try:
+            return post, future.result()
+        except requests.exceptions.RequestException as e:
+            logging.warning(f"Failed to download image from {post.url}: {str(e)}")
+        except OSError as e:
+            logging.warning(f"Failed to convert image from {post.url}: {str(e)}")
+        return post, None
 
-    def get_images(self, sub_name='memes', limit=10, feed_type='hot'):
+    def iter_images(self, sub_name='memes', limit=10, feed_type='hot', progress=None, seen=None,
+                    max_posts=None):
+        """
+        Walks a subreddit listing and yields its images as soon as they are downloaded
+        
+        The listing is consumed lazily and only a bounded number of downloads is kept in
+        flight, so a slow consumer naturally slows down the listing and the downloads.
+        
+        With a seen-post index, posts already used in a video are skipped before any
+        download, images whose content was already used are dropped after it, and the
+        listing is walked (up to ``max_posts`` posts) until ``limit`` fresh images
+        were found.
+        
+        Args:
+            sub_name (str): The subreddit name to scrape images from
+            limit (int): Maximum number of posts to fetch, or of fresh images with ``seen``
+            feed_type (str): Type of feed to fetch ('hot', 'new', 'top', 'rising')
+            progress: Optional reporter whose emit(event, **fields) receives an
+                'image_downloaded' event per image and a final 'listing_finished'
+            seen (SeenPostIndex): Optional index of the posts already used in videos
+            max_posts (int): Maximum number of posts walked with ``seen`` (default: 10 × limit)
+        
+        Yields:
+            tuple: (post, cached_path, jpg_bytes) in listing order, where exactly one of
+            cached_path and jpg_bytes is set
+        """
+        # Get subreddit instance
+        sub = self.reddit.subreddit(sub_name)
+        
+        # Iterate through posts in the subreddit based on feed_type
+        logging.info(f"Fetching {feed_type} posts from r/{sub_name}...")
+        
+        # Select feed based on feed_type
+        listing_limit = limit if seen is None else (max_posts or limit * 10)
+        if feed_type == 'new':
+            posts = sub.new(limit=listing_limit)
+        elif feed_type == 'top':
+            posts = sub.top(limit=listing_limit)
+        elif feed_type == 'rising':
+            posts = sub.rising(limit=listing_limit)
+        else:  # Default to 'hot'
+            posts = sub.hot(limit=listing_limit)
+        
+        # Only image posts (JPG, PNG, JPEG) are downloaded
+        listed = 0
+        skipped = 0
+        
+        def image_posts():
+            nonlocal listed, skipped
+            for post in posts:
+                listed += 1
+                if not post.url.endswith(('.jpg', '.jpeg', '.png')):
+                    continue
+                if seen is not None and seen.seen(post.id):
+                    skipped += 1
+                    continue
+                yield post
+        
+        cache_before = self.image_cache.stats() if self.image_cache else None
+        
+        if seen is None:
+            downloads = self._download_in_order(image_posts())
+        else:
+            downloads = self._download_in_order(
+                image_posts(), lambda post: self._fetch_unseen_image(post, seen, sub_name), wanted=limit)
+        
+        downloaded = 0
+        for post, result in downloads:
+            if result is not None:
+                downloaded += 1
+                if progress:
+                    cached_path, content = result
+                    try:
+                        size = os.path.getsize(cached_path) if cached_path else len(content)
+                    except OSError:
+                        size = None
+                    progress.emit('image_downloaded', index=downloaded, posts_listed=listed,
+                                  url=post.url, cached=cached_path is not None,
+                                  converted=cached_path is None and not post.url.endswith(('.jpg', '.jpeg')),
+                                  bytes=size)
+                yield (post,) + result
+        
+        if progress:
+            progress.emit('listing_finished', posts_listed=listed, images=downloaded, skipped_seen=skipped)
+        if skipped:
+            logging.info(f"Skipped {skipped} posts of r/{sub_name} already used in videos")
+        
+        if self.image_cache:
+            cache_after = self.image_cache.stats()
+            logging.info(f"Image cache: {cache_after['hits'] - cache_before['hits']} hits, "
+                         f"{cache_after['misses'] - cache_before['misses']} misses")
+    
+    @staticmethod
+    def placeholder_image(sub_name):
+        """Creates the placeholder image used when a subreddit has no images"""
+        # Create a simple colored placeholder image
+        placeholder = Image.new('RGB', (800, 600), color=(33, 33, 33))
+        # Add text to the image
+        from PIL import ImageDraw, ImageFont
+        draw = ImageDraw.Draw(placeholder)
+        # Try to use a default font
+        try:
+            font = ImageFont.truetype("arial.ttf", 40)
+        except:
+            font = ImageFont.load_default()
+        
+        text = f"No images found in r/{sub_name}"
+        text_width = draw.textlength(text, font=font)
+        draw.text(((800-text_width)/2, 280), text, fill=(255, 255, 255), font=font)
+        return placeholder
+    
+    def get_images(self, sub_name='memes', limit=10, feed_type='hot', image_folder='images', progress=None,
+                   seen=None, max_posts=None):
         """
         Scrapes Reddit for memes and saves them in a folder
         
@@ -49,96 +333,61 @@ class RedditBot:
             sub_name (str): The subreddit name to scrape images from
             limit (int): Maximum number of posts to fetch
             feed_type (str): Type of feed to fetch ('hot', 'new', 'top', 'rising')
+            image_folder (str): Folder where the images are saved
+            progress: Optional progress reporter, see iter_images
+            seen (SeenPostIndex): Optional index of the posts already used in videos, see iter_images
+            max_posts (int): Maximum number of posts walked with ``seen``
             
         Returns:
             bool: True if images were downloaded successfully, False otherwise
         """
         try:
             # Create directory for images if it doesn't exist
-            if os.path.exists('images'):
+            if os.path.exists(image_folder):
                 logging.info("Images directory already exists, cleaning it up first")
-                for file in os.listdir('images'):
+                for file in os.listdir(image_folder):
                     if file.endswith('.jpg'):
-                        os.remove(os.path.join('images', file))
+                        os.remove(os.path.join(image_folder, file))
             else:
-                os.makedirs('images')
+                os.makedirs(image_folder)
                 logging.info("Created images directory")
             
-            # Get subreddit instance
-            sub = self.reddit.subreddit(sub_name)
-            
             # Counter for naming images and tracking successful downloads
             n = 1
             downloaded_count = 0
             
-            # Iterate through posts in the subreddit based on feed_type
-            logging.info(f"Fetching {feed_type} posts from r/{sub_name}...")
-            
-            # Select feed based on feed_type
-            if feed_type == 'new':
-                posts = sub.new(limit=limit)
-            elif feed_type == 'top':
-                posts = sub.top(limit=limit)
-            elif feed_type == 'rising':
-                posts = sub.rising(limit=limit)
-            else:  # Default to 'hot'
-                posts = sub.hot(limit=limit)
-                
-            for post in posts:
-                url = post.url
+            for post, cached_path, content in self.iter_images(sub_name, limit, feed_type, progress, seen, max_posts):
+                # Save the image, copying it out of the cache when it came from there
+                image_path = os.path.join(image_folder, f'img{n}.jpg')
                 
-                # Download images (JPG, PNG, JPEG)
-                if url.endswith(('.jpg', '.jpeg', '.png')):
+                if cached_path:
                     try:
-                        # Download the image
-                        response = requests.get(url, timeout=10)
-                        response.raise_for_status()  # Raise exception for HTTP errors
-                        
-                        # Extract extension and save the image
-                        extension = url.split('.')[-1]
-                        image_path = f'images/img{n}.{extension}'
-                        
-                        with open(image_path, 'wb') as handler:
-                            handler.write(response.content)
-                            logging.info(f"Downloaded image {n}: {url}")
-                            n += 1
-                            downloaded_count += 1
-                            
-                        # If the image is not a jpg but we need jpg for video creation, convert it
-                        if extension != 'jpg':
-                            img = Image.open(image_path)
-                            img = img.convert('RGB')  # Convert to RGB to ensure compatibility
-                            jpg_path = f'images/img{n-1}.jpg'
-                            img.save(jpg_path)
-                            logging.info(f"Converted {extension} to jpg: {jpg_path}")
-                            # Remove the original non-jpg file
-                            os.remove(image_path)
-                            
-                    except requests.exceptions.RequestException as e:
-                        logging.warning(f"Failed to download image from {url}: {str(e)}")
+                        shutil.copyfile(cached_path, image_path)
+                    except FileNotFoundError:
+                        # Evicted from the cache by another process after the lookup
+                        try:
+                            content = self.read_image(post, cached_path, None)
+                        except OSError as e:
+                            logging.warning(f"Failed to download image from {post.url}: {str(e)}")
+                            if seen is not None:
+                                seen.release_posts([post.id])
+                            continue
+                        cached_path = None
+                if not cached_path:
+                    with open(image_path, 'wb') as handler:
+                        handler.write(content)
+                logging.info(f"Downloaded image {n}: {post.url}")
+                n += 1
+                downloaded_count += 1
             
             # Check if we were able to download any images
             if downloaded_count == 0:
                 logging.warning(f"No images found in the first {limit} posts of r/{sub_name}")
                 # Create a placeholder image to avoid errors in video creation
-                placeholder_path = 'images/placeholder.jpg'
+                placeholder_path = os.path.join(image_folder, 'placeholder.jpg')
                 try:
-                    # Create a simple colored placeholder image
-                    placeholder = Image.new('RGB', (800, 600), color=(33, 33, 33))
-                    # Add text to the image
-                    from PIL import ImageDraw, ImageFont
-                    draw = ImageDraw.Draw(placeholder)
-                    # Try to use a default font
-                    try:
-                        font = ImageFont.truetype("arial.ttf", 40)
-                    except:
-                        font = ImageFont.load_default()
-                    
-                    text = f"No images found in r/{sub_name}"
-                    text_width = draw.textlength(text, font=font)
-                    draw.text(((800-text_width)/2, 280), text, fill=(255, 255, 255), font=font)
-                    
                     # Save the placeholder
+                    placeholder = self.placeholder_image(sub_name)
                     placeholder.save(placeholder_path)
                     logging.info(f"Created placeholder image: {placeholder_path}")
                     return True
@@ -1,7 +1,7 @@
 import os
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from models import db
+from models import db, ensure_schema
 from flask_cors import CORS
 
 # Criar a aplicação Flask
@@ -33,6 +33,7 @@ db.init_app(app)
 # Criar as tabelas no banco de dados
 with app.app_context():
     db.create_all()
+    ensure_schema(db.engine)
     
     # Adicionar alguns subreddits populares, se necessário
     from models import Subreddit
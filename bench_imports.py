@@ -0,0 +1,80 @@
+"""
+Mede o tempo de inicialização dos pontos de entrada com ``python -X importtime``
+
+Cada módulo é importado em um interpretador novo (inicialização a frio), algumas
+vezes, e o relatório mostra a mediana do tempo de importação, as dependências
+mais caras e quais bibliotecas pesadas foram carregadas.
+
+Uso:
+    python bench_imports.py                      # web (wsgi, main) e gerador
+    python bench_imports.py meme_generator --top 15 --runs 5
+"""
+import re
+import sys
+import argparse
+import statistics
+import subprocess
+
+# Pontos de entrada: workers do Gunicorn e processos do gerador
+DEFAULT_MODULES = ["wsgi", "main", "meme_generator", "worker"]
+
+# Bibliotecas que não deveriam ser carregadas sem necessidade
+HEAVY_MODULES = ["moviepy.editor", "numpy", "flask", "flask_sqlalchemy", "praw"]
+
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+def import_profile(module):
+    """
+    Importa o módulo em um interpretador novo e lê a saída do -X importtime
+    
+    Returns:
+        dict: módulos importados por ``module`` -> (tempo acumulado em µs, profundidade)
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Falha ao importar {module}:\n{result.stderr[-2000:]}")
+    
+    entries = []
+    for match in LINE.finditer(result.stderr):
+        _, cumulative, indent, name = match.groups()
+        entries.append((name, int(cumulative), (len(indent) - 1) // 2))
+    
+    # As dependências aparecem antes do módulo que as importou; as linhas anteriores
+    # à árvore do módulo são da inicialização do interpretador
+    end = max(i for i, (name, _, depth) in enumerate(entries) if name == module and depth == 0)
+    start = end
+    while start > 0 and entries[start - 1][2] > 0:
+        start -= 1
+    return {name: (cumulative, depth) for name, cumulative, depth in entries[start:end + 1]}
+
+def bench(module, runs=3, top=8):
+    profiles = [import_profile(module) for _ in range(runs)]
+    totals = [profile[module][0] for profile in profiles]
+    profile = profiles[totals.index(sorted(totals)[len(totals) // 2])]
+    
+    print(f"{module}: {statistics.median(totals) / 1000:.0f} ms "
+          f"(mín. {min(totals) / 1000:.0f} ms, {runs} execuções)")
+    
+    # Dependências diretas mais caras
+    children = [(cumulative, name) for name, (cumulative, depth) in profile.items() if depth == 1]
+    for cumulative, name in sorted(children, reverse=True)[:top]:
+        print(f"    {cumulative / 1000:8.1f} ms  {name}")
+    
+    loaded = [name for name in HEAVY_MODULES if name in profile]
+    print(f"    bibliotecas pesadas carregadas: {', '.join(loaded) or 'nenhuma'}")
+    return statistics.median(totals)
+
+def main():
+    parser = argparse.ArgumentParser(description='Tempo de importação dos pontos de entrada')
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES,
+                        help='Módulos a medir (padrão: %(default)s)')
+    parser.add_argument('--runs', type=int, default=3, help='Execuções por módulo (usa a mediana)')
+    parser.add_argument('--top', type=int, default=8, help='Dependências listadas por módulo')
+    args = parser.parse_args()
+    
+    for module in args.modules:
+        bench(module, args.runs, args.top)
+
+if __name__ == "__main__":
+    main()
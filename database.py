@@ -0,0 +1,211 @@
+import os
+import time
+import logging
+import datetime
+from sqlalchemy import (MetaData, Table, Column, Integer, String, DateTime, create_engine, inspect,
+                        insert, select, update, delete, text)
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DatabaseError
+
+logger = logging.getLogger(__name__)
+
+# Mesmo banco padrão do app.py
+DEFAULT_DATABASE_URL = "sqlite:///meme_videos.db"
+
+# Pasta "instance" do Flask: o Flask-SQLAlchemy cria ali os bancos SQLite de caminho relativo
+INSTANCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance")
+
+metadata = MetaData()
+
+# Colunas da tabela de vídeos usadas pelo gerador (o modelo completo é models.Video)
+videos = Table(
+    "video", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("filename", String(255), nullable=False),
+    Column("path", String(500), nullable=False, index=True),
+    Column("subreddit", String(100), nullable=False),
+    Column("created_at", DateTime),
+    Column("feed_type", String(20)),
+    Column("duration", Integer),
+    Column("size", Integer),
+    Column("post_count", Integer),
+    Column("poster_path", String(500)),
+    Column("preview_path", String(500)),
+    Column("hls_path", String(500)),
+    Column("output_format", String(50)),
+    Column("updated_at", DateTime)
+)
+
+# Posts que já entraram em algum vídeo (modelo completo: models.SeenPost)
+seen_posts = Table(
+    "seen_post", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("post_id", String(20), nullable=False, index=True),
+    Column("content_hash", String(64), index=True),
+    Column("phash", String(16)),
+    Column("subreddit", String(100)),
+    Column("url", String(500)),
+    Column("seen_at", DateTime, index=True)
+)
+
+# Chave do advisory lock do PostgreSQL que serializa as reservas de posts (seen_post)
+SEEN_POST_LOCK_KEY = 0x5EE9057
+
+_engine = None
+
+def database_url():
+    """
+    URL do banco de dados (variável DATABASE_URL ou o SQLite local)
+
+    Caminhos SQLite relativos são resolvidos na pasta instance, como o
+    Flask-SQLAlchemy faz, para que o gerador e a aplicação web usem o mesmo arquivo.
+    """
+    url = make_url(os.environ.get("DATABASE_URL") or DEFAULT_DATABASE_URL)
+    if url.get_backend_name() == "sqlite" and url.database and url.database != ":memory:" \
+            and not os.path.isabs(url.database):
+        os.makedirs(INSTANCE_PATH, exist_ok=True)
+        url = url.set(database=os.path.join(INSTANCE_PATH, url.database))
+    return url
+
+def get_engine():
+    """
+    Engine do SQLAlchemy deste processo, criado na primeira chamada
+
+    Usado pelo gerador no lugar do app Flask: registrar um vídeo não precisa
+    importar o Flask, as rotas da aplicação web nem o moviepy. Tabelas que
+    ainda não existem são criadas a partir de models.py; colunas novas são
+    adicionadas a bancos antigos com models.ensure_schema.
+    """
+    global _engine
+    if _engine is None:
+        engine = create_engine(database_url(), pool_recycle=300, pool_pre_ping=True)
+        inspector = inspect(engine)
+        if not all(inspector.has_table(table.name) for table in metadata.sorted_tables):
+            from models import db
+            for attempt in range(3):
+                try:
+                    db.metadata.create_all(engine)
+                    logger.info("Tabelas do banco de dados criadas")
+                    break
+                except DatabaseError:
+                    # Outro processo (por exemplo, do pool) cria as tabelas ao mesmo tempo:
+                    # a próxima tentativa pula as que já existem
+                    if attempt == 2:
+                        raise
+                    time.sleep(0.2)
+            inspector = inspect(engine)
+        if any(set(table.c.keys()) - {column["name"] for column in inspector.get_columns(table.name)}
+               for table in metadata.sorted_tables):
+            from models import ensure_schema
+            ensure_schema(engine)
+        _engine = engine
+    return _engine
+
+def _stamped(values):
+    """Colunas de um vídeo com updated_at no horário atual (versão da listagem da API)"""
+    return dict(values, updated_at=datetime.datetime.utcnow())
+
+def insert_video(**values):
+    """Insere um vídeo e retorna o seu id"""
+    with get_engine().begin() as conn:
+        result = conn.execute(insert(videos).values(**_stamped(values)))
+        return result.inserted_primary_key[0]
+
+def save_video(**values):
+    """
+    Registra um vídeo pelo caminho, sem duplicar registros
+
+    Se o caminho já está registrado (por exemplo, importado pelo reconciler antes
+    do fim da geração), o registro existente é atualizado, mantendo o created_at;
+    senão, um novo é inserido. A consulta e a escrita acontecem na mesma transação.
+
+    Returns:
+        tuple: (id do vídeo, True se o registro foi inserido)
+    """
+    with get_engine().begin() as conn:
+        video_id = conn.execute(select(videos.c.id).where(videos.c.path == values["path"])
+                                .order_by(videos.c.id).limit(1)).scalar()
+        if video_id is None:
+            return conn.execute(insert(videos).values(**_stamped(values))).inserted_primary_key[0], True
+        conn.execute(update(videos).where(videos.c.id == video_id)
+                     .values(**{k: v for k, v in _stamped(values).items() if k != "created_at"}))
+        return video_id, False
+
+def insert_videos(rows):
+    """Insere vários vídeos em uma única instrução (lista de dicts com as colunas)"""
+    if not rows:
+        return
+    with get_engine().begin() as conn:
+        conn.execute(insert(videos), [_stamped(row) for row in rows])
+
+def existing_paths(paths, chunk_size=500):
+    """Retorna o subconjunto de ``paths`` que já está registrado, com uma consulta por lote"""
+    found = set()
+    with get_engine().connect() as conn:
+        for start in range(0, len(paths), chunk_size):
+            chunk = paths[start:start + chunk_size]
+            found.update(conn.execute(select(videos.c.path).where(videos.c.path.in_(chunk))).scalars())
+    return found
+
+def video_paths():
+    """Lista (id, caminho) de todos os vídeos registrados"""
+    with get_engine().connect() as conn:
+        return conn.execute(select(videos.c.id, videos.c.path)).all()
+
+def delete_videos(video_ids, chunk_size=500):
+    """Remove os vídeos informados"""
+    with get_engine().begin() as conn:
+        for start in range(0, len(video_ids), chunk_size):
+            conn.execute(delete(videos).where(videos.c.id.in_(video_ids[start:start + chunk_size])))
+
+def get_video(video_id):
+    """Retorna as colunas de um vídeo como dict, ou None se ele não existir"""
+    with get_engine().connect() as conn:
+        row = conn.execute(select(videos).where(videos.c.id == video_id)).mappings().first()
+        return dict(row) if row else None
+
+def seen_post_rows(since, after_id=0):
+    """Registros de seen_post (id, post_id, content_hash, phash) desde ``since`` e com id maior que ``after_id``"""
+    with get_engine().connect() as conn:
+        return conn.execute(select(seen_posts.c.id, seen_posts.c.post_id, seen_posts.c.content_hash,
+                                   seen_posts.c.phash)
+                            .where(seen_posts.c.seen_at >= since, seen_posts.c.id > after_id)).all()
+
+def reserve_seen_post(row, after_id):
+    """
+    Registra um post usado e retorna os registros feitos por outros processos
+
+    A inserção e a consulta acontecem na mesma transação: os registros com id
+    entre ``after_id`` e o do novo registro foram feitos antes dele, então quem
+    chamou pode tratar o novo post como repetido se um deles tiver o mesmo
+    conteúdo.
+
+    As reservas são serializadas entre processos, para que os ids sigam a ordem
+    dos commits e nenhuma reserva fique abaixo da marca ``after_id`` de outro
+    processo: no SQLite o INSERT já trava o banco até o commit; no PostgreSQL,
+    onde os ids da sequência são entregues antes do commit e duas transações
+    simultâneas não enxergariam uma à outra, um advisory lock da transação faz
+    esse papel.
+
+    Returns:
+        tuple: (id do novo registro, registros com after_id < id < novo id)
+    """
+    with get_engine().begin() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": SEEN_POST_LOCK_KEY})
+        row_id = conn.execute(insert(seen_posts).values(**row)).inserted_primary_key[0]
+        earlier = conn.execute(select(seen_posts.c.id, seen_posts.c.post_id, seen_posts.c.content_hash,
+                                      seen_posts.c.phash)
+                               .where(seen_posts.c.id > after_id, seen_posts.c.id < row_id)).all()
+    return row_id, earlier
+
+def delete_seen_posts(row_ids, chunk_size=500):
+    """Remove os registros de seen_post informados"""
+    with get_engine().begin() as conn:
+        for start in range(0, len(row_ids), chunk_size):
+            conn.execute(delete(seen_posts).where(seen_posts.c.id.in_(row_ids[start:start + chunk_size])))
+
+def purge_seen_posts(before):
+    """Remove os registros de seen_post anteriores a ``before``"""
+    with get_engine().begin() as conn:
+        return conn.execute(delete(seen_posts).where(seen_posts.c.seen_at < before)).rowcount
@@ -0,0 +1,173 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+def content_hash(data):
+    """Retorna o hash SHA-256 (hex) de um bloco de bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+class DiskCache:
+    """
+    Cache persistente em disco endereçado por conteúdo
+    
+    Cada arquivo é guardado uma única vez com o nome igual ao hash do seu conteúdo.
+    Chaves arbitrárias (id do post, URL, ...) apontam para esse hash, de modo que
+    o mesmo conteúdo publicado sob URLs diferentes ocupa espaço uma única vez.
+    O índice fica em um banco SQLite dentro da pasta do cache, o que permite
+    compartilhá-lo entre execuções e entre processos. Quando o tamanho total passa
+    de ``max_bytes`` os arquivos usados há mais tempo são removidos (LRU).
+    """
+    
+    def __init__(self, root, max_bytes, extension='.jpg'):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.extension = extension
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+        
+        os.makedirs(self.root, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS blobs (
+                                digest TEXT PRIMARY KEY,
+                                size INTEGER NOT NULL,
+                                last_access REAL NOT NULL)""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS aliases (
+                                key TEXT PRIMARY KEY,
+                                digest TEXT NOT NULL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_blobs_last_access ON blobs (last_access)")
+    
+    @contextmanager
+    def _connect(self):
+        """Abre uma conexão com o índice (uma por operação, seguro entre threads e processos)"""
+        conn = sqlite3.connect(os.path.join(self.root, 'index.db'), timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+    
+    def path_for(self, digest):
+        """Caminho do arquivo correspondente a um hash de conteúdo"""
+        return os.path.join(self.root, digest[:2], digest + self.extension)
+    
+    def _count(self, hit):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+    
+    def lookup(self, *keys):
+        """
+        Procura uma entrada por qualquer uma das chaves informadas
+        
+        Returns:
+            str: caminho do arquivo em cache, ou None se nenhuma chave for encontrada
+        """
+        keys = [k for k in keys if k]
+        if keys:
+            placeholders = ','.join('?' * len(keys))
+            with self._connect() as conn:
+                row = conn.execute(f"SELECT digest FROM aliases WHERE key IN ({placeholders}) LIMIT 1",
+                                   keys).fetchone()
+            if row:
+                path = self.get(row[0], keys=keys)
+                if path:
+                    self._count(True)
+                    return path
+        self._count(False)
+        return None
+    
+    def get(self, digest, keys=()):
+        """Retorna o arquivo de um hash já armazenado, associando novas chaves a ele"""
+        path = self.path_for(digest)
+        if not os.path.exists(path):
+            return None
+        with self._connect() as conn:
+            updated = conn.execute("UPDATE blobs SET last_access = ? WHERE digest = ?",
+                                   (time.time(), digest)).rowcount
+            if not updated:
+                return None
+            conn.executemany("INSERT OR REPLACE INTO aliases (key, digest) VALUES (?, ?)",
+                             [(k, digest) for k in keys if k])
+        return path
+    
+    def store(self, digest, data, keys=()):
+        """
+        Armazena um conteúdo sob o hash informado e associa as chaves a ele
+        
+        Returns:
+            str: caminho do arquivo em cache
+        """
+        path = self.path_for(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        
+        # Escreve em um arquivo temporário e renomeia para nunca expor arquivos pela metade
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        return self._commit(digest, tmp_path, keys)
+    
+    def store_file(self, digest, src_path, keys=()):
+        """
+        Move para o cache um arquivo já gerado em disco (por exemplo pelo ffmpeg)
+        
+        O arquivo de origem deve estar no mesmo sistema de arquivos do cache.
+        
+        Returns:
+            str: caminho do arquivo em cache
+        """
+        os.makedirs(os.path.dirname(self.path_for(digest)), exist_ok=True)
+        return self._commit(digest, src_path, keys)
+    
+    def _commit(self, digest, src_path, keys):
+        """Publica um arquivo completo sob o hash informado e registra no índice"""
+        path = self.path_for(digest)
+        size = os.path.getsize(src_path)
+        os.replace(src_path, path)
+        
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO blobs (digest, size, last_access) VALUES (?, ?, ?)",
+                         (digest, size, time.time()))
+            conn.executemany("INSERT OR REPLACE INTO aliases (key, digest) VALUES (?, ?)",
+                             [(k, digest) for k in keys if k])
+        
+        self.evict()
+        return path
+    
+    def evict(self):
+        """Remove as entradas usadas há mais tempo até o cache caber no orçamento"""
+        with self._connect() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            
+            removed = 0
+            for digest, size in conn.execute("SELECT digest, size FROM blobs ORDER BY last_access").fetchall():
+                if total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+                conn.execute("DELETE FROM aliases WHERE digest = ?", (digest,))
+                try:
+                    os.remove(self.path_for(digest))
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+        
+        if removed:
+            logger.info(f"Cache {self.root}: {removed} arquivo(s) removido(s) por LRU")
+        return removed
+    
+    def stats(self):
+        """Retorna os contadores de acertos e falhas desta instância"""
+        with self._stats_lock:
+            return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,454 @@
+import os
+import re
+import shutil
+import logging
+import subprocess
+from fractions import Fraction
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Intervalo máximo (em segundos) entre keyframes, para permitir busca precisa no player
+KEYFRAME_INTERVAL = 2
+
+# Parâmetros do encoder de vídeo. A mesma lista identifica o "perfil" dos segmentos
+# em cache: segmentos só podem ser concatenados sem re-encoding se forem iguais.
+# Sem B-frames (-bf 0): cada quadro é uma imagem diferente, então eles quase não
+# ajudam, e o atraso que introduzem quebra a duração de vídeos concatenados
+VIDEO_CODEC_ARGS = ['-c:v', 'libx264', '-preset', 'medium', '-pix_fmt', 'yuv420p', '-bf', '0']
+
+# Timescale fixo do MP4, para que segmentos gerados separadamente tenham a mesma base de tempo
+VIDEO_TIMESCALE = 90000
+
+# Nome da playlist da prévia ao vivo, dentro da pasta informada ao FrameEncoder
+LIVE_PLAYLIST = 'index.m3u8'
+
+def codec_args(profile=None):
+    """
+    Parâmetros do encoder para um perfil de encoding (preset, crf e pix_fmt)
+
+    Sem perfil, retorna VIDEO_CODEC_ARGS. As threads do perfil não entram na lista:
+    elas mudam só a velocidade, não o formato do vídeo gerado.
+    """
+    if not profile:
+        return list(VIDEO_CODEC_ARGS)
+    args = ['-c:v', 'libx264', '-preset', profile.get("preset", "medium")]
+    if profile.get("crf") is not None:
+        args += ['-crf', str(profile["crf"])]
+    return args + ['-pix_fmt', profile.get("pix_fmt", "yuv420p"), '-bf', '0']
+
+def find_ffmpeg():
+    """Localiza o executável do ffmpeg (variável FFMPEG_BINARY, imageio-ffmpeg ou PATH)"""
+    binary = os.getenv("FFMPEG_BINARY")
+    if binary:
+        return binary
+    try:
+        # O imageio-ffmpeg é instalado junto com o moviepy e traz o próprio binário
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        return shutil.which("ffmpeg") or "ffmpeg"
+
+def list_images(image_folder):
+    """Lista os .jpg da pasta em ordem natural (img1, img2, ..., img10)"""
+    def natural_key(name):
+        return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+    return [os.path.join(image_folder, img)
+            for img in sorted(os.listdir(image_folder), key=natural_key)
+            if img.endswith(".jpg")]
+
+def compose_size(image_files):
+    """
+    Calcula o tamanho do quadro usado por concatenate_videoclips(method='compose')
+
+    O quadro tem a maior largura e a maior altura entre as imagens, arredondadas
+    para números pares (exigência do yuv420p). Apenas o cabeçalho de cada imagem é lido.
+    """
+    width = height = 0
+    for path in image_files:
+        with Image.open(path) as img:
+            width = max(width, img.width)
+            height = max(height, img.height)
+    return width + width % 2, height + height % 2
+
+def fit_on_canvas(img, size):
+    """Centraliza a imagem em um quadro preto do tamanho informado, como o modo 'compose'"""
+    img = img.convert('RGB')
+    if img.size == tuple(size):
+        return img
+    canvas = Image.new('RGB', tuple(size), (0, 0, 0))
+    canvas.paste(img, ((size[0] - img.width) // 2, (size[1] - img.height) // 2))
+    return canvas
+
+class FrameEncoder:
+    """
+    Envia quadros RGB crus para um processo ffmpeg através de um pipe
+
+    Cada imagem vira um único quadro com a duração ``duration_per_image``, em vez de
+    ``fps * duration`` quadros idênticos compostos em Python.
+
+    Com ``live_dir``, o mesmo stream codificado também é gravado como uma playlist
+    HLS em andamento (``live_dir``/index.m3u8), pelo muxer tee do ffmpeg: cada
+    imagem fica disponível em um segmento assim que a próxima chega ao encoder, e
+    o vídeo pode ser assistido enquanto ainda está sendo gerado. Para isso o
+    encoder não acumula quadros (sem lookahead) antes de emiti-los.
+
+    ``profile`` é um perfil de encoding (ver formats.py); sem ele são usados os
+    parâmetros de VIDEO_CODEC_ARGS.
+    """
+
+    def __init__(self, output_path, size, duration_per_image, live_dir=None, profile=None):
+        self.output_path = output_path
+        self.size = tuple(size)
+        self.live_dir = live_dir
+        self.frames = 0
+
+        frame_rate = 1 / Fraction(duration_per_image).limit_denominator(1000)
+        cmd = [find_ffmpeg(), '-y', '-loglevel', 'error']
+        if live_dir:
+            cmd += ['-probesize', '32']
+        cmd += [
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+            '-s', f'{self.size[0]}x{self.size[1]}',
+            '-framerate', str(frame_rate),
+            '-i', '-',
+            *codec_args(profile),
+            '-force_key_frames', f'expr:gte(t,n_forced*{KEYFRAME_INTERVAL})',
+        ]
+        if profile and profile.get("threads"):
+            cmd += ['-threads', str(profile["threads"])]
+        if live_dir:
+            os.makedirs(live_dir, exist_ok=True)
+            live = (f"[f=hls:hls_time={KEYFRAME_INTERVAL}:hls_list_size=0:hls_playlist_type=event:"
+                    f"hls_segment_filename={os.path.join(live_dir, 'seg_%05d.ts')}]"
+                    f"{os.path.join(live_dir, LIVE_PLAYLIST)}")
+            cmd += ['-x264-params', 'rc-lookahead=0:sync-lookahead=0', '-map', '0:v', '-f', 'tee',
+                    f"[video_track_timescale={VIDEO_TIMESCALE}]{output_path}|{live}"]
+        else:
+            cmd += ['-video_track_timescale', str(VIDEO_TIMESCALE), output_path]
+        self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    @property
+    def live_playlist(self):
+        """Caminho da playlist ao vivo, assim que o primeiro segmento foi gravado"""
+        if not self.live_dir:
+            return None
+        path = os.path.join(self.live_dir, LIVE_PLAYLIST)
+        return path if os.path.exists(path) else None
+
+    def write(self, img):
+        """Escreve uma imagem PIL (já no tamanho do quadro) como um quadro do vídeo"""
+        self.process.stdin.write(img.tobytes())
+        if self.live_dir:
+            self.process.stdin.flush()
+        self.frames += 1
+
+    def close(self):
+        """Finaliza o encoding e retorna True se o ffmpeg terminou sem erros"""
+        _, stderr = self.process.communicate()
+        if self.process.returncode != 0:
+            logger.error(f"ffmpeg falhou ao gerar {self.output_path}: {stderr.decode(errors='replace').strip()}")
+            return False
+        return True
+
+    def abort(self):
+        """Interrompe o ffmpeg e descarta a saída parcial"""
+        self.process.kill()
+        self.process.communicate()
+        if os.path.exists(self.output_path):
+            os.remove(self.output_path)
+        if self.live_dir:
+            shutil.rmtree(self.live_dir, ignore_errors=True)
+
+def probe_video(video_path):
+    """
+    Lê as propriedades de um vídeo a partir da saída de ``ffmpeg -i``
+
+    Returns:
+        dict: duration (s), width, height, codec, timescale e has_audio,
+        ou None se o arquivo não puder ser lido
+    """
+    result = subprocess.run([find_ffmpeg(), '-hide_banner', '-i', video_path], capture_output=True)
+    info = result.stderr.decode(errors='replace')
+
+    duration = re.search(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)', info)
+    video = re.search(r'Stream #\S+: Video: (\w+).*?, (\d+)x(\d+)', info)
+    if not duration or not video:
+        logger.error(f"Não foi possível ler as propriedades de {video_path}")
+        return None
+
+    timescale = re.search(r'(\d+(?:\.\d+)?)(k?) tbn', info)
+    hours, minutes, seconds = duration.groups()
+    return {
+        "duration": int(hours) * 3600 + int(minutes) * 60 + float(seconds),
+        "codec": video.group(1),
+        "width": int(video.group(2)),
+        "height": int(video.group(3)),
+        "timescale": (round(float(timescale.group(1)) * (1000 if timescale.group(2) else 1))
+                      if timescale else None),
+        "has_audio": re.search(r'Stream #\S+: Audio:', info) is not None,
+    }
+
+def media_duration(path):
+    """Duração (em segundos) de um arquivo de áudio ou vídeo, ou None se não puder ser lido"""
+    result = subprocess.run([find_ffmpeg(), '-hide_banner', '-i', path], capture_output=True)
+    duration = re.search(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)', result.stderr.decode(errors='replace'))
+    if not duration:
+        return None
+    hours, minutes, seconds = duration.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+def appendable_size(video_path):
+    """
+    Verifica se segmentos do FrameEncoder podem ser concatenados ao vídeo por cópia
+
+    O vídeo precisa ter sido gerado pelo FrameEncoder (H.264 com o mesmo timescale).
+    Só o vídeo é concatenado: a música de fundo, se houver, é descartada e pode
+    ser acrescentada de novo ao resultado (ver mux_audio).
+
+    Returns:
+        tuple: (largura, altura) do vídeo, ou None se ele não puder ser estendido
+    """
+    info = probe_video(video_path)
+    if info is None:
+        return None
+    if (info["codec"], info["timescale"]) != ('h264', VIDEO_TIMESCALE):
+        logger.error(f"{video_path} não pode ser estendido: codec {info['codec']}, "
+                     f"timescale {info['timescale']}")
+        return None
+    return info["width"], info["height"]
+
+def render_images(image_files, video_path, duration_per_image, size=None, on_frame=None, live_dir=None,
+                  profile=None):
+    """
+    Renderiza as imagens em um vídeo usando o ffmpeg diretamente
+
+    O resultado equivale ao de concatenate_videoclips(method='compose'): cada imagem
+    é centralizada sobre um fundo preto do tamanho da maior imagem, mas é preparada
+    uma única vez e enviada ao encoder como um único quadro. Se ``size`` for
+    informado, ele é usado como tamanho do quadro. ``on_frame(frames)`` é chamado
+    a cada quadro enviado ao encoder. Com ``live_dir`` o vídeo também é gravado
+    como HLS ao vivo (ver FrameEncoder), e ``profile`` escolhe o perfil de encoding.
+
+    Returns:
+        bool: True se o vídeo foi gerado com sucesso
+    """
+    size = size or compose_size(image_files)
+    encoder = FrameEncoder(video_path, size, duration_per_image, live_dir, profile)
+    try:
+        for path in image_files:
+            with Image.open(path) as img:
+                encoder.write(fit_on_canvas(img, size))
+            if on_frame:
+                on_frame(encoder.frames)
+    except Exception:
+        encoder.abort()
+        raise
+    return encoder.close()
+
+def concat_segments(segment_paths, video_path):
+    """
+    Junta segmentos MP4 já codificados em um único vídeo, sem re-encoding
+
+    Usa o demuxer concat do ffmpeg com cópia dos streams (-c copy); todos os
+    segmentos precisam ter o mesmo codec, resolução e timescale.
+
+    Returns:
+        bool: True se o vídeo foi gerado com sucesso
+    """
+    list_path = f"{video_path}.segments.txt"
+    with open(list_path, 'w') as f:
+        for path in segment_paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+    cmd = [
+        find_ffmpeg(), '-y', '-loglevel', 'error',
+        '-f', 'concat', '-safe', '0', '-i', list_path,
+        '-map', '0:v', '-c', 'copy', '-movflags', '+faststart',
+        video_path,
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True)
+    finally:
+        os.remove(list_path)
+    if result.returncode != 0:
+        logger.error(f"ffmpeg falhou ao juntar os segmentos de {video_path}: "
+                     f"{result.stderr.decode(errors='replace').strip()}")
+        return False
+    return True
+
+def append_images(image_files, base_video, video_path, duration_per_image, size, profile=None):
+    """
+    Gera ``video_path`` com as imagens acrescentadas ao final de ``base_video``
+
+    Apenas as imagens novas são codificadas; o vídeo existente é copiado sem
+    re-encoding. ``size`` deve ser a resolução de ``base_video``.
+
+    Returns:
+        bool: True se o vídeo foi gerado com sucesso
+    """
+    part_path = f"{video_path}.part.mp4"
+    try:
+        if not render_images(image_files, part_path, duration_per_image, size, profile=profile):
+            return False
+        return concat_segments([base_video, part_path], video_path)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+def extract_poster(video_path, poster_path, width=480, at=1.0):
+    """
+    Salva um quadro do vídeo como uma imagem JPEG pequena (poster do player)
+
+    Returns:
+        bool: True se a imagem foi gerada com sucesso
+    """
+    cmd = [
+        find_ffmpeg(), '-y', '-loglevel', 'error',
+        '-ss', f'{at:g}', '-i', video_path,
+        '-frames:v', '1', '-vf', f'scale={width}:-2', '-q:v', '5',
+        poster_path,
+    ]
+    result = subprocess.run(cmd, capture_output=True)
+    if result.returncode != 0 or not os.path.exists(poster_path):
+        logger.error(f"ffmpeg falhou ao extrair o poster de {video_path}: "
+                     f"{result.stderr.decode(errors='replace').strip()}")
+        return False
+    return True
+
+def extract_preview(video_path, preview_path, seconds=6, width=320):
+    """
+    Gera uma prévia curta e em baixa resolução do início do vídeo, sem áudio
+
+    Returns:
+        bool: True se a prévia foi gerada com sucesso
+    """
+    cmd = [
+        find_ffmpeg(), '-y', '-loglevel', 'error',
+        '-t', f'{seconds:g}', '-i', video_path,
+        '-an', '-vf', f'scale={width}:-2',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '30', '-pix_fmt', 'yuv420p',
+        '-movflags', '+faststart',
+        preview_path,
+    ]
+    result = subprocess.run(cmd, capture_output=True)
+    if result.returncode != 0:
+        logger.error(f"ffmpeg falhou ao gerar a prévia de {video_path}: "
+                     f"{result.stderr.decode(errors='replace').strip()}")
+        return False
+    return True
+
+def package_hls(video_path, hls_dir, renditions, segment_seconds=4):
+    """
+    Empacota um vídeo em HLS com várias qualidades, decodificando o original uma única vez
+
+    O vídeo decodificado é dividido (filtro split) e cada cópia é redimensionada e
+    codificada em uma qualidade. Os quadros-chave ficam alinhados a cada
+    ``segment_seconds`` em todas as qualidades, então o player pode trocar de
+    qualidade entre segmentos. Qualidades maiores que o original são ignoradas.
+
+    Args:
+        renditions: lista de dicts com height e bitrate (ex.: {"height": 480, "bitrate": "1000k"})
+
+    Returns:
+        str: caminho da playlist principal (master.m3u8), ou None em caso de falha
+    """
+    info = probe_video(video_path)
+    if info is None:
+        return None
+    renditions = [r for r in renditions if r["height"] <= info["height"]] or renditions[-1:]
+    if not renditions:
+        return None
+
+    split = f"[0:v]split={len(renditions)}" + ''.join(f"[s{i}]" for i in range(len(renditions)))
+    scales = [f"[s{i}]scale=-2:{r['height']}[v{i}]" for i, r in enumerate(renditions)]
+    cmd = [find_ffmpeg(), '-y', '-loglevel', 'error', '-i', video_path,
+           '-filter_complex', ';'.join([split] + scales)]
+
+    stream_map = []
+    for i, rendition in enumerate(renditions):
+        cmd += ['-map', f'[v{i}]']
+        if info["has_audio"]:
+            cmd += ['-map', '0:a:0']
+        kbps = int(str(rendition["bitrate"]).rstrip('k'))
+        cmd += [f'-b:v:{i}', f'{kbps}k', f'-maxrate:v:{i}', f'{kbps * 11 // 10}k',
+                f'-bufsize:v:{i}', f'{kbps * 2}k']
+        stream_map.append(f"v:{i}" + (f",a:{i}" if info["has_audio"] else "") + f",name:{rendition['height']}p")
+
+    cmd += ['-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p',
+            '-force_key_frames', f'expr:gte(t,n_forced*{segment_seconds:g})']
+    if info["has_audio"]:
+        cmd += ['-c:a', 'aac', '-b:a', '128k']
+    cmd += [
+        '-f', 'hls', '-hls_time', f'{segment_seconds:g}', '-hls_playlist_type', 'vod',
+        '-hls_flags', 'independent_segments',
+        '-hls_segment_filename', os.path.join(hls_dir, '%v', 'seg_%03d.ts'),
+        '-master_pl_name', 'master.m3u8',
+        '-var_stream_map', ' '.join(stream_map),
+        os.path.join(hls_dir, '%v', 'index.m3u8'),
+    ]
+
+    os.makedirs(hls_dir, exist_ok=True)
+    result = subprocess.run(cmd, capture_output=True)
+    master = os.path.join(hls_dir, 'master.m3u8')
+    if result.returncode != 0 or not os.path.exists(master):
+        logger.error(f"ffmpeg falhou ao empacotar {video_path} em HLS: "
+                     f"{result.stderr.decode(errors='replace').strip()}")
+        shutil.rmtree(hls_dir, ignore_errors=True)
+        return None
+    return master
+
+def normalize_audio(source_path, output_path, loudness=-16, bitrate='128k'):
+    """
+    Converte uma música para AAC com o volume normalizado (filtro loudnorm, EBU R128)
+
+    Feito uma única vez por faixa: o resultado fica em cache e é copiado para os
+    vídeos sem novo encoding (ver mux_audio).
+
+    Returns:
+        bool: True se a faixa foi convertida com sucesso
+    """
+    part_path = f"{output_path}.part.m4a"
+    cmd = [
+        find_ffmpeg(), '-y', '-loglevel', 'error', '-i', source_path,
+        '-vn', '-af', f'loudnorm=I={loudness}:TP=-1.5:LRA=11', '-ar', '44100',
+        '-c:a', 'aac', '-b:a', bitrate, '-movflags', '+faststart',
+        part_path,
+    ]
+    result = subprocess.run(cmd, capture_output=True)
+    if result.returncode != 0:
+        logger.error(f"ffmpeg falhou ao normalizar {source_path}: {result.stderr.decode(errors='replace').strip()}")
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        return False
+    os.replace(part_path, output_path)
+    return True
+
+def mux_audio(video_path, audio_path, output_path, duration):
+    """
+    Gera ``output_path`` com o vídeo e a faixa de áudio, sem re-encoding
+
+    A faixa (AAC, ver normalize_audio) é repetida enquanto for mais curta que o
+    vídeo e cortada em ``duration`` segundos; os dois streams são copiados, então
+    o custo é só o de reescrever o arquivo.
+
+    Returns:
+        bool: True se o vídeo foi gerado com sucesso
+    """
+    cmd = [
+        find_ffmpeg(), '-y', '-loglevel', 'error',
+        '-i', video_path, '-stream_loop', '-1', '-i', audio_path,
+        '-map', '0:v', '-map', '1:a', '-c', 'copy', '-t', f'{duration:g}',
+        '-movflags', '+faststart',
+        output_path,
+    ]
+    result = subprocess.run(cmd, capture_output=True)
+    if result.returncode != 0:
+        logger.error(f"ffmpeg falhou ao acrescentar a música a {video_path}: "
+                     f"{result.stderr.decode(errors='replace').strip()}")
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return False
+    return True
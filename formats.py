@@ -0,0 +1,155 @@
+import os
+import logging
+from PIL import Image
+from ffmpeg_render import FrameEncoder, compose_size
+from preprocess import normalize_image
+
+logger = logging.getLogger(__name__)
+
+# Perfis de encoding usados quando o config.json não define "encoding_profiles"
+DEFAULT_PROFILES = {
+    "fast": {"preset": "veryfast", "crf": 26},
+    "balanced": {"preset": "medium", "crf": 23},
+    "small": {"preset": "slow", "crf": 28}
+}
+
+def encoding_profile(config, name=None, parallel=1):
+    """
+    Perfil de encoding nomeado do config.json, com o número de threads resolvido
+    
+    Sem "threads" no perfil, os núcleos da máquina são divididos entre os
+    ``parallel`` encoders que rodam ao mesmo tempo, em vez de cada ffmpeg abrir
+    uma thread por núcleo e todos disputarem a CPU.
+    
+    Returns:
+        dict: preset, crf, pix_fmt e threads
+    """
+    profiles = config.get("encoding_profiles") or DEFAULT_PROFILES
+    name = name or config.get("encoding_profile", "balanced")
+    if name not in profiles:
+        logger.warning(f"Perfil de encoding desconhecido: {name}; usando os parâmetros padrão")
+    profile = dict(profiles.get(name, {}))
+    profile.setdefault("pix_fmt", "yuv420p")
+    if not profile.get("threads"):
+        profile["threads"] = max(1, (os.cpu_count() or 1) // max(1, parallel))
+    return profile
+
+def output_formats(config):
+    """
+    Formatos de saída de uma geração: o principal e os de "output_formats"
+    
+    O principal usa output_resolution, resize_mode e encoding_profile, e não tem
+    nome. Cada formato extra define name e, opcionalmente, resolution,
+    resize_mode e profile. As threads de cada perfil consideram todos os
+    encoders da geração: um por formato em cada processo de subreddit.
+    
+    Returns:
+        list: dicts com name, size (None = tamanho da maior imagem), mode e profile
+    """
+    extras = config.get("output_formats") or []
+    subreddits = config.get("subreddits") or ["memes"]
+    workers = config.get("subreddit_workers") or os.cpu_count() or 1
+    parallel = max(1, min(workers, len(subreddits))) * (1 + len(extras))
+    
+    main_size = config.get("output_resolution")
+    main_mode = config.get("resize_mode", "letterbox")
+    formats = [{
+        "name": None,
+        "size": tuple(main_size) if main_size else None,
+        "mode": main_mode,
+        "profile": encoding_profile(config, parallel=parallel)
+    }]
+    for extra in extras:
+        size = extra.get("resolution") or main_size
+        formats.append({
+            "name": extra["name"],
+            "size": tuple(size) if size else None,
+            "mode": extra.get("resize_mode", main_mode),
+            "profile": encoding_profile(config, extra.get("profile"), parallel)
+        })
+    return formats
+
+def format_path(video_path, output_format):
+    """Caminho do vídeo de um formato: <nome>_<formato>.mp4 ao lado do vídeo principal"""
+    if not output_format["name"]:
+        return video_path
+    stem, ext = os.path.splitext(video_path)
+    return f"{stem}_{output_format['name']}{ext}"
+
+class MultiFormatEncoder:
+    """
+    Codifica as mesmas imagens em vários formatos, decodificando cada uma uma única vez
+    
+    Tem a interface do FrameEncoder (write/close/abort/frames/live_playlist), mas
+    write recebe a imagem original já decodificada: cada formato a ajusta à sua
+    resolução e ao seu modo e a envia ao seu próprio ffmpeg. Os encoders rodam em
+    processos separados, então os formatos são codificados em paralelo. A prévia
+    ao vivo (``live_dir``) é a do formato principal.
+    """
+    
+    def __init__(self, video_path, formats, duration_per_image, live_dir=None):
+        self.outputs = []
+        try:
+            for output_format in formats:
+                path = format_path(video_path, output_format)
+                encoder = FrameEncoder(path, output_format["size"], duration_per_image,
+                                       live_dir if not output_format["name"] else None,
+                                       output_format["profile"])
+                self.outputs.append((output_format, path, encoder))
+        except Exception:
+            self.abort()
+            raise
+        self.frames = 0
+    
+    @property
+    def paths(self):
+        """Caminho do vídeo de cada formato, na ordem dos formatos"""
+        return [path for _, path, _ in self.outputs]
+    
+    @property
+    def live_playlist(self):
+        return self.outputs[0][2].live_playlist
+    
+    def write(self, img):
+        """Ajusta a imagem a cada formato e a escreve como um quadro de cada vídeo"""
+        for output_format, _, encoder in self.outputs:
+            encoder.write(normalize_image(img, output_format["size"], output_format["mode"]))
+        self.frames += 1
+    
+    def close(self):
+        """Finaliza todos os encoders; retorna True se todos os vídeos foram gerados"""
+        results = [encoder.close() for _, _, encoder in self.outputs]
+        return all(results)
+    
+    def abort(self):
+        """Interrompe todos os encoders e descarta as saídas parciais"""
+        for _, _, encoder in self.outputs:
+            encoder.abort()
+
+def render_formats(image_files, video_path, formats, duration_per_image, on_frame=None, live_dir=None):
+    """
+    Renderiza as imagens em todos os formatos com uma única decodificação de cada imagem
+    
+    Formatos sem resolução usam o tamanho da maior imagem, como render_images.
+    
+    Returns:
+        list: caminhos dos vídeos gerados (um por formato), ou None em caso de falha
+    """
+    largest = None
+    if any(output_format["size"] is None for output_format in formats):
+        largest = compose_size(image_files)
+    formats = [dict(output_format, size=output_format["size"] or largest) for output_format in formats]
+    
+    encoder = MultiFormatEncoder(video_path, formats, duration_per_image, live_dir)
+    try:
+        for path in image_files:
+            with Image.open(path) as img:
+                encoder.write(img.convert('RGB'))
+            if on_frame:
+                on_frame(encoder.frames)
+    except Exception:
+        encoder.abort()
+        raise
+    if not encoder.close():
+        return None
+    return encoder.paths
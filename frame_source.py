@@ -0,0 +1,147 @@
+import os
+import logging
+import resource
+import threading
+from collections import OrderedDict
+from PIL import Image
+from ffmpeg_render import compose_size, fit_on_canvas
+
+logger = logging.getLogger(__name__)
+
+class LazyImageSequence:
+    """
+    Fonte de quadros que decodifica cada imagem apenas quando o seu trecho é renderizado
+
+    Substitui a lista de ImageClip criada de uma vez (que mantém todas as imagens
+    decodificadas na memória durante todo o encoding). Apenas os quadros que cabem
+    em ``memory_budget`` bytes ficam guardados; os mais antigos são liberados.
+    """
+
+    def __init__(self, image_files, duration_per_image, memory_budget):
+        self.image_files = list(image_files)
+        self.duration_per_image = duration_per_image
+        self.size = compose_size(self.image_files)
+
+        frame_bytes = self.size[0] * self.size[1] * 3
+        self.capacity = max(1, int(memory_budget // frame_bytes))
+        self._frames = OrderedDict()
+
+    @property
+    def duration(self):
+        return len(self.image_files) * self.duration_per_image
+
+    def frame_at(self, t):
+        """Retorna o quadro (array RGB) exibido no instante t"""
+        # Importado aqui: só a renderização pelo moviepy precisa do numpy
+        import numpy as np
+
+        index = min(int(t / self.duration_per_image), len(self.image_files) - 1)
+        frame = self._frames.get(index)
+        if frame is None:
+            with Image.open(self.image_files[index]) as img:
+                frame = np.asarray(fit_on_canvas(img, self.size))
+            self._frames[index] = frame
+            # Libera os quadros que não cabem mais no orçamento
+            while len(self._frames) > self.capacity:
+                self._frames.popitem(last=False)
+        else:
+            self._frames.move_to_end(index)
+        return frame
+
+def lazy_image_clip(image_files, duration_per_image, memory_budget_mb=256):
+    """
+    Cria um clip do moviepy equivalente a concatenate_videoclips(method='compose'),
+    mas com as imagens decodificadas sob demanda
+    """
+    from moviepy.editor import VideoClip
+
+    source = LazyImageSequence(image_files, duration_per_image, memory_budget_mb * 1024 * 1024)
+    return VideoClip(source.frame_at, duration=source.duration)
+
+def _rss_bytes(pid):
+    """Memória residente atual de um processo, lida de /proc"""
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def _children(pid):
+    """PIDs dos processos filhos diretos (por exemplo o ffmpeg)"""
+    children = []
+    for tid in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{tid}/children") as f:
+            children.extend(int(c) for c in f.read().split())
+    return children
+
+class PeakRSSMonitor:
+    """
+    Mede o pico de memória residente durante um bloco de código
+
+    Amostra periodicamente o RSS deste processo e dos seus filhos (o ffmpeg) em
+    /proc. Em sistemas sem /proc usa o pico de toda a vida do processo informado
+    por getrusage.
+    """
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.peak_self = 0
+        self.peak_children = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        pid = os.getpid()
+        while True:
+            try:
+                self.peak_self = max(self.peak_self, _rss_bytes(pid))
+                children = 0
+                for child in _children(pid):
+                    try:
+                        children += _rss_bytes(child)
+                    except OSError:
+                        pass
+                self.peak_children = max(self.peak_children, children)
+            except OSError:
+                # Sem /proc: usa o pico informado pelo sistema
+                self.peak_self = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+                return
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+    def summary(self):
+        """Texto com os picos medidos, em MB"""
+        return (f"pico de RSS: {self.peak_self / (1024 * 1024):.1f} MB no gerador, "
+                f"{self.peak_children / (1024 * 1024):.1f} MB no ffmpeg")
+
+def frame_progress_logger(on_frame, frames_per_image):
+    """
+    Logger do proglog para o write_videofile do moviepy que chama
+    on_frame(imagens codificadas) sempre que o encoder termina uma imagem
+
+    Exceções de on_frame (por exemplo, JobCancelled) interrompem o encoding.
+    """
+    from proglog import ProgressBarLogger
+
+    class FrameProgressLogger(ProgressBarLogger):
+        def __init__(self):
+            super().__init__()
+            self.images = 0
+
+        def bars_callback(self, bar, attr, value, old_value=None):
+            # Barra 't': índice do próximo quadro enviado ao ffmpeg
+            if bar != 't' or attr != 'index':
+                return
+            images = int(value / frames_per_image)
+            if images > self.images:
+                self.images = images
+                on_frame(images)
+
+    return FrameProgressLogger()
@@ -0,0 +1,206 @@
+import os
+import json
+import socket
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from models import db, Job
+from progress import request_cancel
+
+logger = logging.getLogger(__name__)
+
+# Estados de um job que ainda não terminou
+ACTIVE_STATUSES = ('pending', 'running')
+
+def worker_id():
+    """Identificação do worker deste processo (host:pid), gravada nos jobs que ele executa"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def _worker_alive(worker):
+    """
+    Indica se o processo dono de um job ainda existe
+
+    Só é possível verificar processos da mesma máquina; os de outras máquinas são
+    considerados vivos (para eles vale apenas o heartbeat). O próprio processo
+    conta como morto: um job dele em execução é de uma encarnação anterior com o
+    mesmo pid (por exemplo, o pid 1 de um container reiniciado).
+    """
+    host, _, pid = (worker or '').rpartition(':')
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    if int(pid) == os.getpid():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def params_key(params):
+    """Hash estável dos parâmetros de um job (independente da ordem das chaves)"""
+    canonical = json.dumps(params or {}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+def _active_job(key):
+    """Job pendente ou em execução com o hash de parâmetros informado, ou None"""
+    return (Job.query
+            .filter(Job.params_key == key, Job.status.in_(ACTIVE_STATUSES))
+            .order_by(Job.id)
+            .first())
+
+def enqueue(params=None, source=None):
+    """
+    Coloca um job de geração de vídeos na fila
+
+    ``params`` são configurações que substituem as do config.json apenas neste job
+    (subreddits, posts_limit, feed_types, ...). Se já existe um job com os mesmos
+    parâmetros esperando ou em execução, nenhum job novo é criado e o existente é
+    retornado, então cliques repetidos não geram o mesmo vídeo várias vezes.
+    Pedidos simultâneos são desempatados pelo índice único parcial
+    ix_job_active_params_key: o INSERT perdedor falha e o job vencedor é retornado.
+
+    Deve ser chamado dentro de um app_context.
+
+    Returns:
+        tuple: (job, created) onde created indica se um job novo foi criado
+    """
+    params = params or {}
+    key = params_key(params)
+
+    existing = _active_job(key)
+    if existing:
+        logger.info(f"Pedido agrupado ao job {existing.id} ({existing.status})")
+        return existing, False
+
+    job = Job(params=json.dumps(params, sort_keys=True), params_key=key, source=source)
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Outro pedido igual criou o job entre a consulta e o INSERT
+        db.session.rollback()
+        existing = _active_job(key)
+        if existing is None:
+            raise
+        logger.info(f"Pedido agrupado ao job {existing.id} ({existing.status})")
+        return existing, False
+    logger.info(f"Job {job.id} criado ({source or 'desconhecido'}): {job.params}")
+    return job, True
+
+def claim_next(worker=None):
+    """
+    Marca o job pendente mais antigo como em execução e o retorna
+
+    A troca de estado é feita com um UPDATE condicional, então dois workers nunca
+    pegam o mesmo job. O job fica registrado em nome de ``worker`` (ver
+    worker_id), com o heartbeat iniciado.
+
+    Returns:
+        Job: o job reservado, ou None se a fila estiver vazia
+    """
+    while True:
+        job = Job.query.filter_by(status='pending').order_by(Job.id).first()
+        if job is None:
+            return None
+        claimed = (Job.query
+                   .filter_by(id=job.id, status='pending')
+                   .update({"status": 'running', "started_at": datetime.utcnow(),
+                            "worker": worker or worker_id(), "updated_at": datetime.utcnow()},
+                           synchronize_session=False))
+        db.session.commit()
+        if claimed:
+            db.session.refresh(job)
+            return job
+
+def finish(job_id, video_count=None, error=None, cancelled=False):
+    """Registra o fim de um job, com sucesso, cancelado ou com a mensagem de erro"""
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return
+    job.status = 'cancelled' if cancelled else 'failed' if error else 'done'
+    job.finished_at = datetime.utcnow()
+    job.video_count = video_count
+    job.error = error
+    db.session.commit()
+
+def cancel(job_id):
+    """
+    Cancela um job
+
+    Um job pendente é cancelado na hora (UPDATE condicional, então não há corrida
+    com um worker que o esteja reservando). Em um job em execução é feito um
+    pedido de cancelamento: a geração verifica o pedido a cada imagem, descarta
+    o vídeo em andamento e o worker registra o job como 'cancelled'.
+
+    Deve ser chamado dentro de um app_context.
+
+    Returns:
+        Job: o job (com o estado atual), ou None se não existir
+    """
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return None
+    if job.status == 'pending':
+        (Job.query
+         .filter_by(id=job_id, status='pending')
+         .update({"status": 'cancelled', "finished_at": datetime.utcnow()}, synchronize_session=False))
+        db.session.commit()
+        db.session.refresh(job)
+    if job.status == 'running':
+        request_cancel(job_id)
+        logger.info(f"Cancelamento do job {job_id} pedido")
+    return job
+
+def heartbeat(job_ids, worker=None):
+    """
+    Renova o sinal de vida dos jobs em execução por um worker
+
+    Returns:
+        int: número de jobs renovados (um job devolvido para a fila por outro
+        worker não é mais renovado)
+    """
+    if not job_ids:
+        return 0
+    count = (Job.query
+             .filter(Job.id.in_(list(job_ids)), Job.status == 'running',
+                     Job.worker == (worker or worker_id()))
+             .update({"updated_at": datetime.utcnow()}, synchronize_session=False))
+    db.session.commit()
+    return count
+
+def requeue_running(stale_seconds=300, keep=()):
+    """
+    Devolve para a fila os jobs cujo worker foi interrompido
+
+    Um job 'running' é devolvido quando o processo dono (da mesma máquina) não
+    existe mais ou quando o heartbeat está parado há mais de ``stale_seconds``
+    (worker travado ou de outra máquina). Jobs de outros workers ativos não
+    são tocados, então vários workers podem usar o mesmo banco. ``keep`` são os
+    ids dos jobs que o próprio processo está executando: os demais jobs em nome
+    dele são de uma encarnação anterior com o mesmo pid.
+
+    Returns:
+        int: número de jobs devolvidos para a fila
+    """
+    stale = datetime.utcnow() - timedelta(seconds=stale_seconds)
+    count = 0
+    keep = set(keep)
+    for job in Job.query.filter_by(status='running').all():
+        if job.id in keep and job.worker == worker_id():
+            continue
+        if job.updated_at is not None and job.updated_at >= stale and _worker_alive(job.worker):
+            continue
+        # UPDATE condicional: o heartbeat pode ter sido renovado desde a leitura
+        count += (Job.query
+                  .filter(Job.id == job.id, Job.status == 'running', Job.worker == job.worker,
+                          Job.updated_at == job.updated_at)
+                  .update({"status": 'pending', "started_at": None, "worker": None, "updated_at": None},
+                          synchronize_session=False))
+        logger.warning(f"Job {job.id} do worker {job.worker or 'desconhecido'} interrompido")
+    db.session.commit()
+    if count:
+        logger.warning(f"{count} job(s) interrompido(s) devolvido(s) para a fila")
+    return count
@@ -5,12 +5,11 @@
 # Importação para servidor web (usado pelo Gunicorn)
 from web_app import app
 
-# Importações para geração de vídeos
-from RedditBot import RedditBot
+# Importações para geração de vídeos (RedditBot e moviepy são importados apenas
+# quando o gerador roda, para não pesar na inicialização dos workers do Gunicorn)
 import os
 import shutil
 import logging
-from moviepy.editor import *
 
 # Configuração do logging
 logging.basicConfig(level=logging.INFO,
@@ -23,6 +22,8 @@ def create_video(duration_per_image=10, name='video', fps=30):
     # creating video
     image_folder='images'
     try:
+        from moviepy.editor import ImageClip, concatenate_videoclips
+        
         if not os.path.exists(image_folder):
             logger.error(f"Pasta {image_folder} não encontrada")
             return False
@@ -47,6 +48,8 @@ def create_video(duration_per_image=10, name='video', fps=30):
 
 def main():
     try:
+        from RedditBot import RedditBot
+        
         reddit = RedditBot()
         if reddit.get_images():
             create_video()
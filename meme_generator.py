@@ -1,12 +1,25 @@
 from RedditBot import RedditBot
+from disk_cache import DiskCache, content_hash
+from ffmpeg_render import (list_images, render_images, append_images, appendable_size, extract_poster,
+                           extract_preview, package_hls, mux_audio, media_duration, LIVE_PLAYLIST)
+from segment_cache import build_segment_cache, render_segments
+from pipeline import stream_video
+from formats import output_formats, format_path, render_formats
+from preprocess import preprocess_folder
+from frame_source import PeakRSSMonitor, lazy_image_clip, frame_progress_logger
+from progress import ProgressReporter, JobCancelled
+from music import MusicLibrary, music_library
+from reddit_api import reddit_requestor_kwargs
+from seen_posts import seen_post_index, NoNewPosts
+import database
 import os
 import shutil
 import json
 import logging
 import datetime
 import random
-import requests
-from moviepy.editor import *
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, 
@@ -31,61 +44,98 @@ def load_config():
         }
 
 # Função para baixar músicas de fundo de domínio público
-def download_background_music():
-    # Criar pasta de música se não existir
-    if not os.path.exists("music"):
-        os.makedirs("music")
-        logger.info("Pasta de música criada")
-    
-    # URLs de músicas de background de domínio público
-    music_urls = [
-        "https://www.chosic.com/wp-content/uploads/2021/05/Lofi-Study.mp3",
-        "https://www.chosic.com/wp-content/uploads/2020/05/The-Epic-Hero-Epic-Cinematic-Keys-of-Moon-Music.mp3",
-        "https://www.chosic.com/wp-content/uploads/2021/05/purrple-cat-equinox.mp3"
-    ]
-    
-    # Tentar baixar cada música
-    for i, url in enumerate(music_urls):
-        music_path = f"music/background_{i}.mp3"
-        
-        # Verificar se o arquivo já existe
-        if os.path.exists(music_path):
-            logger.info(f"Música {i} já existe, pulando download")
-            continue
-        
-        try:
-            logger.info(f"Baixando música de fundo {i} de {url}")
-            response = requests.get(url, timeout=30)
-            with open(music_path, 'wb') as f:
-                f.write(response.content)
-            logger.info(f"Música de fundo {i} salva em {music_path}")
-        except Exception as e:
-            logger.error(f"Erro ao baixar música {i}: {str(e)}")
+def download_background_music(config=None):
+    """
+    Atualiza a biblioteca de músicas de fundo e retorna uma faixa aleatória
     
-    # Retornar uma música aleatória da pasta
-    music_files = [os.path.join("music", f) for f in os.listdir("music") 
-                  if f.endswith((".mp3", ".ogg"))]
+    Apenas faixas novas ou alteradas são baixadas e normalizadas (ver music.py).
     
-    if music_files:
-        selected_music = random.choice(music_files)
-        logger.info(f"Música selecionada: {selected_music}")
-        return selected_music
-    else:
+    Returns:
+        str: caminho da versão normalizada da faixa, ou None se não houver músicas
+    """
+    library = music_library(config or load_config())
+    library.sync()
+    track = library.pick()
+    if track is None:
         logger.warning("Nenhuma música de fundo disponível")
         return None
+    logger.info(f"Música selecionada: {track['name']}")
+    return track["path"]
 
-def create_video(duration_per_image=3, output_folder=None, name='video', fps=30, add_music=True):
-    '''Cria vídeo a partir das imagens salvas na pasta'''
+def add_background_music(video_paths, library=None):
+    """
+    Acrescenta a mesma música de fundo aos vídeos, sem re-encoding
+    
+    A faixa já está normalizada em AAC na biblioteca; ela é repetida ou cortada na
+    duração de cada vídeo e os streams são copiados (ver ffmpeg_render.mux_audio),
+    então o custo é o de reescrever o arquivo, não o de um novo encoding. A
+    biblioteca precisa ter sido sincronizada antes (MusicLibrary.sync).
+    
+    Returns:
+        bool: True se a música foi acrescentada a todos os vídeos
+    """
+    track = (library or MusicLibrary()).pick()
+    if track is None:
+        logger.warning("Nenhuma música de fundo disponível; vídeo gerado sem áudio")
+        return False
+    for video_path in video_paths:
+        duration = media_duration(video_path)
+        music_path = f"{os.path.splitext(video_path)[0]}.music.mp4"
+        if not duration or not mux_audio(video_path, track["path"], music_path, duration):
+            return False
+        os.replace(music_path, video_path)
+    logger.info(f"Música {track['name']} acrescentada a {len(video_paths)} vídeo(s)")
+    return True
+
+def build_image_cache(config):
+    '''Cria o cache persistente de imagens, ou None se estiver desativado'''
+    max_mb = config.get("image_cache_max_mb", 512)
+    if not max_mb:
+        return None
+    return DiskCache(config.get("image_cache_dir", "cache/images"), max_mb * 1024 * 1024)
+
+def create_video(duration_per_image=3, output_folder=None, name='video', fps=30, add_music=True,
+                 engine='moviepy', image_folder='images', memory_budget_mb=256, segment_cache=None,
+                 segment_variant='', append_to=None, progress=None, live_dir=None, formats=None,
+                 music=None):
+    '''Cria vídeo a partir das imagens salvas na pasta
+    
+    O parâmetro engine escolhe o renderizador: 'moviepy' (composição quadro a quadro)
+    ou 'ffmpeg' (um único quadro por imagem enviado direto ao ffmpeg). No moviepy as
+    imagens são decodificadas sob demanda e no máximo memory_budget_mb de quadros
+    decodificados ficam na memória.
+    
+    Com o ffmpeg e um segment_cache (DiskCache de segmentos), cada imagem é
+    codificada uma única vez em um segmento próprio e o vídeo é montado por
+    concatenação sem re-encoding; imagens repetidas reaproveitam o segmento.
+    
+    Com append_to (caminho de um vídeo existente gerado pelo ffmpeg), apenas as
+    imagens da pasta são codificadas, na resolução desse vídeo, e acrescentadas ao
+    final dele por cópia dos streams; o custo é proporcional ao conteúdo novo.
+    
+    Com progress (um ProgressReporter), cada imagem codificada (pelo ffmpeg ou
+    pelo moviepy) gera um evento frame_encoded, e um pedido de cancelamento do
+    job interrompe o encoding.
+    
+    Com live_dir, o vídeo também é gravado como HLS ao vivo nessa pasta, para ser
+    assistido enquanto é gerado. Nesse modo o vídeo é sempre codificado pelo
+    ffmpeg em um único encoder contínuo (sem moviepy e sem cache de segmentos).
+    
+    formats (ver formats.output_formats) define o perfil de encoding do vídeo
+    (preset, crf, pix_fmt e threads). Com mais de um formato, cada imagem é
+    decodificada uma única vez e codificada pelo ffmpeg em todos eles ao mesmo
+    tempo, gerando <nome>_memes_<formato>.mp4 ao lado do vídeo principal.
+    
+    Com add_music, uma faixa da biblioteca de músicas (music, um MusicLibrary) é
+    acrescentada a cada vídeo gerado por cópia dos streams, sem re-encoding.
+    '''
     
-    image_folder='images'
     if not os.path.exists(image_folder):
         logger.error(f"Pasta de imagens {image_folder} não existe")
         return False
     
-    # Verificar se existem imagens na pasta
-    image_files = [os.path.join(image_folder, img) 
-                  for img in os.listdir(image_folder) 
-                  if img.endswith(".jpg")]
+    # Verificar se existem imagens na pasta (em ordem natural: img1, img2, ..., img10)
+    image_files = list_images(image_folder)
     
     if not image_files:
         logger.error(f"Nenhuma imagem encontrada na pasta {image_folder}")
@@ -94,14 +144,6 @@ def create_video(duration_per_image=3, output_folder=None, name='video', fps=30,
     logger.info(f"Criando vídeo com {len(image_files)} imagens, {duration_per_image}s por imagem")
     
     try:
-        # Criar os frames do vídeo
-        frames = [ImageClip(f, duration=duration_per_image) for f in image_files]
-        clip = concatenate_videoclips(frames, method='compose')
-        
-        # Adicionar música de fundo foi desativado temporariamente
-        # porque está causando erros
-        add_music = False
-        
         # Criar pasta de saída se fornecida
         video_path = f"{name}.mp4"
         if output_folder:
@@ -109,9 +151,80 @@ def create_video(duration_per_image=3, output_folder=None, name='video', fps=30,
                 os.makedirs(output_folder)
             video_path = os.path.join(output_folder, f"{name}_memes.mp4")
         
-        # Gerar o vídeo
-        clip.write_videofile(video_path, fps=fps)
-        logger.info(f"Vídeo salvo em {video_path}")
+        if append_to and os.path.abspath(append_to) == os.path.abspath(video_path):
+            logger.error(f"O vídeo estendido precisa de um caminho diferente de {append_to}")
+            return False
+        
+        live_playlist = os.path.join(live_dir, LIVE_PLAYLIST) if live_dir else None
+        profile = formats[0]["profile"] if formats else None
+        
+        def on_frame(frames):
+            if progress:
+                progress.check_cancelled()
+                progress.emit('frame_encoded', frames=frames, total=len(image_files),
+                              bytes=os.path.getsize(video_path) if os.path.exists(video_path) else 0,
+                              live_playlist=live_playlist if live_playlist and os.path.exists(live_playlist) else None)
+        
+        with PeakRSSMonitor() as memory:
+            if append_to:
+                # Apenas as imagens novas são codificadas, na resolução do vídeo existente
+                size = appendable_size(append_to)
+                if size is None:
+                    return False
+                if segment_cache is not None:
+                    ok = render_segments(image_files, video_path, duration_per_image, segment_cache,
+                                         segment_variant, size=size, base_video=append_to, profile=profile)
+                else:
+                    ok = append_images(image_files, append_to, video_path, duration_per_image, size, profile)
+                if not ok:
+                    return False
+            elif formats and len(formats) > 1:
+                # Uma decodificação por imagem, um encoder por formato
+                if not render_formats(image_files, video_path, formats, duration_per_image,
+                                      on_frame=on_frame, live_dir=live_dir):
+                    return False
+            elif live_dir:
+                # Um único encoder contínuo, que grava o MP4 e a playlist ao vivo
+                if not render_images(image_files, video_path, duration_per_image, on_frame=on_frame,
+                                     live_dir=live_dir, profile=profile):
+                    return False
+            elif engine == 'ffmpeg' and segment_cache is not None:
+                # Apenas imagens nunca vistas passam pelo encoder
+                if not render_segments(image_files, video_path, duration_per_image,
+                                       segment_cache, segment_variant, on_frame=on_frame, profile=profile):
+                    return False
+            elif engine == 'ffmpeg':
+                # Cada imagem é preparada uma vez e vira um único quadro no ffmpeg
+                if not render_images(image_files, video_path, duration_per_image, on_frame=on_frame,
+                                     profile=profile):
+                    return False
+            else:
+                if progress:
+                    progress.check_cancelled()
+                # Criar os frames do vídeo, decodificados apenas durante o seu trecho
+                clip = lazy_image_clip(image_files, duration_per_image, memory_budget_mb)
+            
+                # Gerar o vídeo com os parâmetros do perfil de encoding
+                encoding = {}
+                if profile:
+                    ffmpeg_params = ['-pix_fmt', profile.get("pix_fmt", "yuv420p")]
+                    if profile.get("crf") is not None:
+                        ffmpeg_params += ['-crf', str(profile["crf"])]
+                    encoding = {
+                        "codec": "libx264",
+                        "preset": profile.get("preset", "medium"),
+                        "threads": profile.get("threads"),
+                        "ffmpeg_params": ffmpeg_params
+                    }
+                # O logger do moviepy informa o progresso e atende aos cancelamentos
+                if progress:
+                    encoding["logger"] = frame_progress_logger(on_frame, fps * duration_per_image)
+                clip.write_videofile(video_path, fps=fps, audio=False, **encoding)
+        logger.info(f"Vídeo salvo em {video_path} ({memory.summary()})")
+        
+        if add_music:
+            add_background_music([format_path(video_path, output_format) for output_format in formats or [{"name": None}]],
+                                 music)
         
         # Limpar a pasta de imagens
         shutil.rmtree(image_folder)
@@ -119,80 +232,454 @@ def create_video(duration_per_image=3, output_folder=None, name='video', fps=30,
         
         return True
         
+    except JobCancelled:
+        logger.info(f"Criação de {video_path} cancelada")
+        return False
     except Exception as e:
         logger.error(f"Erro ao criar vídeo: {str(e)}")
         return False
 
-def main():
-    # Carregar configurações
-    config = load_config()
-    subreddits = config.get("subreddits", ["memes"])
-    posts_limit = config.get("posts_limit", 10)
+def create_thumbnails(video_path, config, duration=None):
+    """
+    Gera o poster (e, com "video_preview", uma prévia curta) de um vídeo
+    
+    Os arquivos ficam ao lado do vídeo: <nome>.jpg e <nome>.preview.mp4. A página
+    inicial exibe o poster sem baixar nada do vídeo até o usuário dar play.
+    
+    Returns:
+        dict: poster_path e preview_path (None para o que não foi gerado)
+    """
+    thumbnails = {"poster_path": None, "preview_path": None}
+    if not config.get("video_posters", True):
+        return thumbnails
+    
+    stem = os.path.splitext(video_path)[0]
+    # Um quadro do início, mas nunca depois do meio de um vídeo curto
+    at = min(config.get("poster_time", 1.0), (duration or 2) / 2)
+    if extract_poster(video_path, f"{stem}.jpg", config.get("poster_width", 480), at):
+        thumbnails["poster_path"] = f"{stem}.jpg"
+    
+    if config.get("video_preview", False):
+        if extract_preview(video_path, f"{stem}.preview.mp4", config.get("preview_seconds", 6),
+                           config.get("preview_width", 320)):
+            thumbnails["preview_path"] = f"{stem}.preview.mp4"
+    return thumbnails
+
+# Qualidades padrão do HLS: altura em pixels e bitrate de vídeo
+DEFAULT_HLS_RENDITIONS = [
+    {"height": 720, "bitrate": "2500k"},
+    {"height": 480, "bitrate": "1000k"},
+    {"height": 240, "bitrate": "400k"}
+]
+
+def create_hls(video_path, config):
+    """
+    Empacota o vídeo em HLS (com "hls_enabled") para entrega adaptativa em segmentos
+    
+    As playlists e os segmentos ficam em <nome>_hls/, ao lado do MP4, que continua
+    sendo o arquivo principal (download, compartilhamento e players sem HLS).
+    
+    Returns:
+        dict: hls_path (caminho da master.m3u8, ou None se não foi gerado)
+    """
+    if not config.get("hls_enabled", False):
+        return {"hls_path": None}
+    hls_dir = f"{os.path.splitext(video_path)[0]}_hls"
+    shutil.rmtree(hls_dir, ignore_errors=True)
+    master = package_hls(video_path, hls_dir, config.get("hls_renditions", DEFAULT_HLS_RENDITIONS),
+                         config.get("hls_segment_seconds", 4))
+    return {"hls_path": master}
+
+# Bot do Reddit reaproveitado entre os jobs executados no mesmo processo
+_reddit_bot = None
+    
+def get_reddit_bot(config):
+    """Retorna o RedditBot deste processo, criando-o na primeira chamada"""
+    global _reddit_bot
+    if _reddit_bot is None:
+        _reddit_bot = RedditBot(
+            download_workers=config.get("download_workers", 8),
+            downloads_per_host=config.get("downloads_per_host", 4),
+            image_cache=build_image_cache(config),
+            requestor_kwargs=reddit_requestor_kwargs(config)
+        )
+    return _reddit_bot
+    
+def process_subreddit(subreddit, feed_type, config, timestamp, progress=None):
+    """
+    Baixa as imagens e renderiza o vídeo de um subreddit
+    
+    Executado em um processo do pool. Cada job usa a própria pasta temporária de
+    imagens, então vários subreddits podem ser processados ao mesmo tempo. Com
+    "pipeline": "streaming" as imagens não passam pelo disco: download,
+    decodificação e encoding acontecem ao mesmo tempo (ver pipeline.py).
+    
+    Em um job da fila (com "live_preview"), o vídeo em andamento também é gravado
+    como HLS ao vivo em <pasta>/<subreddit>_live/, anunciado nos eventos
+    frame_encoded (live_playlist) e removido quando o vídeo termina.
+    
+    Posts que já entraram em vídeos nos últimos "seen_posts_days" dias são pulados
+    (ver seen_posts.py); os posts usados só são registrados se o vídeo for gerado.
+    Sem nenhum post novo, o subreddit é pulado (evento subreddit_skipped).
+    
+    Returns:
+        dict: informações do vídeo gerado, ou None em caso de falha
+    """
     image_duration = config.get("image_duration", 3)
-    fps = config.get("fps", 30)
-    add_music = config.get("add_music", True)
-    feed_types = config.get("feed_types", ["hot"])
+    logger.info(f"Processando subreddit: {subreddit}, feed: {feed_type}")
+    progress = (progress or ProgressReporter()).bind(subreddit=subreddit, feed_type=feed_type)
+    progress.emit('subreddit_started')
     
-    # Inicializar o bot do Reddit
+    live_dir = None
+    seen = None
     try:
-        reddit = RedditBot()
+        progress.check_cancelled()
+        reddit = get_reddit_bot(config)
+        
+        # Criar pasta de saída para este subreddit
+        output_folder = f"output_{subreddit}_{timestamp}"
+        os.makedirs(output_folder, exist_ok=True)
+        video_path = f"{output_folder}/{subreddit}_memes.mp4"
+        if config.get("live_preview", False) and progress.job_id is not None:
+            live_dir = f"{output_folder}/{subreddit}_live"
+        
+        seen = seen_post_index(config)
+        if config.get("pipeline", "batch") == "streaming":
+            post_count = stream_video(reddit, subreddit, feed_type, video_path, config, progress, live_dir, seen)
+            if post_count and config.get("add_music", True):
+                add_background_music([format_path(video_path, output_format)
+                                      for output_format in output_formats(config)], music_library(config))
+        else:
+            post_count = render_from_folder(reddit, subreddit, feed_type, output_folder, config, timestamp,
+                                            progress, live_dir, seen)
+        if progress.cancelled():
+            progress.emit('subreddit_cancelled')
+            return None
+        if not post_count:
+            progress.emit('subreddit_failed')
+            return None
+        if seen is not None:
+            seen.commit()
+        
+        progress.emit('video_written', path=video_path, frames=post_count,
+                      bytes=os.path.getsize(video_path))
+        
+        result = {
+            "subreddit": subreddit,
+            "feed_type": feed_type,
+            "path": video_path,
+            "duration": image_duration * post_count,
+            "post_count": post_count
+        }
+        result.update(create_thumbnails(video_path, config, result["duration"]))
+        result.update(create_hls(video_path, config))
+        
+        # Os demais formatos, gerados na mesma passagem, viram vídeos próprios
+        result["formats"] = []
+        for output_format in output_formats(config)[1:]:
+            path = format_path(video_path, output_format)
+            if not os.path.exists(path):
+                continue
+            progress.emit('video_written', path=path, frames=post_count, bytes=os.path.getsize(path),
+                          output_format=output_format["name"])
+            extra = dict(result, path=path, output_format=output_format["name"], hls_path=None, formats=[])
+            extra.update(create_thumbnails(path, config, result["duration"]))
+            result["formats"].append(extra)
+        return result
+    except JobCancelled:
+        logger.info(f"Processamento de r/{subreddit} cancelado")
+        progress.emit('subreddit_cancelled')
+        return None
+    except NoNewPosts:
+        logger.info(f"Nenhum post novo em r/{subreddit}; nenhum vídeo gerado")
+        progress.emit('subreddit_skipped', reason='no_new_posts')
+        return None
     except Exception as e:
-        logger.error(f"Erro ao inicializar RedditBot: {str(e)}")
-        return
+        logger.error(f"Erro ao processar subreddit {subreddit}: {str(e)}")
+        progress.emit('subreddit_failed', error=str(e))
+        return None
+    finally:
+        # A prévia ao vivo só serve enquanto o vídeo final não existe
+        if live_dir:
+            shutil.rmtree(live_dir, ignore_errors=True)
+        # Sem vídeo, os posts reservados voltam a ser candidatos
+        if seen is not None:
+            seen.release()
+
+def preprocess_images(image_folder, size, config, seen=None):
+    """
+    Ajusta as imagens da pasta à resolução informada (ver preprocess_folder)
+    
+    As imagens descartadas por não poderem ser decodificadas não entram no vídeo:
+    com o índice de posts já usados, as suas reservas são desfeitas pelo hash do
+    conteúdo, para que não sejam confirmadas junto com as demais.
+    """
+    image_files = list_images(image_folder)
+    hashes = {}
+    if seen is not None:
+        for path in image_files:
+            with open(path, 'rb') as f:
+                hashes[path] = content_hash(f.read())
+    processed = preprocess_folder(image_files, size, mode=config.get("resize_mode", "letterbox"),
+                                  workers=config.get("preprocess_workers", 4))
+    dropped = [digest for path, digest in hashes.items() if path not in processed]
+    if dropped:
+        seen.release_posts(content_hashes=dropped)
+
+def render_from_folder(reddit, subreddit, feed_type, output_folder, config, timestamp, progress=None,
+                       live_dir=None, seen=None):
+    """
+    Baixa todas as imagens para uma pasta temporária e depois renderiza o vídeo
+    
+    Returns:
+        int: número de imagens no vídeo (0 em caso de falha)
+    """
+    # Pasta de trabalho exclusiva deste job
+    work_root = config.get("work_dir", "work")
+    os.makedirs(work_root, exist_ok=True)
+    image_folder = tempfile.mkdtemp(prefix=f"{subreddit}_{timestamp}_", dir=work_root)
+    
+    try:
+        # Baixar imagens do subreddit usando o feed selecionado
+        if not reddit.get_images(sub_name=subreddit, limit=config.get("posts_limit", 10),
+                                 feed_type=feed_type, image_folder=image_folder, progress=progress,
+                                 seen=seen, max_posts=config.get("posts_scan_limit")):
+            logger.warning(f"Falha ao obter imagens do subreddit {subreddit} usando feed {feed_type}")
+            return 0
+        # Só posts já usados: nada de vídeo com a imagem de aviso
+        if seen is not None and os.path.exists(os.path.join(image_folder, 'placeholder.jpg')):
+            raise NoNewPosts(subreddit)
+        if progress:
+            progress.check_cancelled()
+        
+        # Ajustar todas as imagens à resolução de saída antes de renderizar; com
+        # vários formatos, cada um ajusta a imagem original à sua resolução
+        formats = output_formats(config)
+        output_resolution = config.get("output_resolution")
+        if output_resolution and len(formats) == 1:
+            preprocess_images(image_folder, output_resolution, config, seen)
+        
+        post_count = len(list_images(image_folder))
+        
+        # Criar vídeo para este subreddit
+        if not create_video(
+            duration_per_image=config.get("image_duration", 3),
+            output_folder=output_folder,
+            name=subreddit,
+            fps=config.get("fps", 30),
+            add_music=config.get("add_music", True),
+            music=music_library(config),
+            engine=config.get("render_engine", "moviepy"),
+            image_folder=image_folder,
+            memory_budget_mb=config.get("render_memory_mb", 256),
+            segment_cache=build_segment_cache(config),
+            segment_variant=config.get("resize_mode", "letterbox"),
+            progress=progress,
+            live_dir=live_dir,
+            formats=formats
+        ):
+            return 0
+        return post_count
+    finally:
+        shutil.rmtree(image_folder, ignore_errors=True)
+
+def append_to_video(video_id, config=None):
+    """
+    Estende um vídeo já registrado com as imagens novas do seu subreddit
+    
+    Baixa as imagens do mesmo subreddit e feed do vídeo original, codifica apenas
+    elas e as acrescenta ao final do arquivo existente sem re-encoding. O resultado
+    é salvo em uma nova pasta de saída e registrado como um novo Video, com
+    duração, tamanho e número de posts atualizados.
+    
+    Returns:
+        dict: informações do vídeo gerado, ou None em caso de falha
+    """
+    config = config or load_config()
+    base = database.get_video(video_id)
+    if base is None:
+        logger.error(f"Vídeo {video_id} não encontrado")
+        return None
+    subreddit, feed_type, base_path = base["subreddit"], base["feed_type"] or "hot", base["path"]
+    base_duration, base_posts = base["duration"] or 0, base["post_count"] or 0
+    
+    size = appendable_size(base_path)
+    if size is None:
+        return None
+    
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_folder = f"output_{subreddit}_{timestamp}"
+    suffix = 1
+    while os.path.exists(os.path.join(output_folder, f"{subreddit}_memes.mp4")):
+        # Nunca sobrescrever um vídeo existente (inclusive o próprio vídeo base)
+        suffix += 1
+        output_folder = f"output_{subreddit}_{timestamp}_{suffix}"
+    os.makedirs(output_folder, exist_ok=True)
+    
+    work_root = config.get("work_dir", "work")
+    os.makedirs(work_root, exist_ok=True)
+    image_folder = tempfile.mkdtemp(prefix=f"{subreddit}_{timestamp}_", dir=work_root)
+    
+    seen = None
+    try:
+        # Com o índice de posts já usados, as imagens do vídeo base não voltam
+        reddit = get_reddit_bot(config)
+        seen = seen_post_index(config)
+        if not reddit.get_images(sub_name=subreddit, limit=config.get("posts_limit", 10),
+                                 feed_type=feed_type, image_folder=image_folder,
+                                 seen=seen, max_posts=config.get("posts_scan_limit")) or \
+                os.path.exists(os.path.join(image_folder, 'placeholder.jpg')):
+            logger.warning(f"Nenhuma imagem nova para estender o vídeo {video_id}")
+            return None
+        
+        # As imagens novas precisam ter exatamente a resolução do vídeo existente
+        preprocess_images(image_folder, size, config, seen)
+        new_posts = len(list_images(image_folder))
+        duration_per_image = config.get("image_duration", 3)
+        
+        # O vídeo estendido recebe a música de novo, na sua nova duração
+        add_music = config.get("add_music", True)
+        music = music_library(config)
+        if add_music:
+            music.sync()
+        
+        if not create_video(
+            duration_per_image=duration_per_image,
+            output_folder=output_folder,
+            name=subreddit,
+            add_music=add_music,
+            music=music,
+            image_folder=image_folder,
+            segment_cache=build_segment_cache(config),
+            segment_variant=config.get("resize_mode", "letterbox"),
+            append_to=base_path,
+            formats=output_formats(config)[:1]
+        ):
+            return None
+        if seen is not None:
+            seen.commit()
+    finally:
+        shutil.rmtree(image_folder, ignore_errors=True)
+        if seen is not None:
+            seen.release()
+    
+    result = {
+        "subreddit": subreddit,
+        "feed_type": feed_type,
+        "path": os.path.join(output_folder, f"{subreddit}_memes.mp4"),
+        "duration": base_duration + duration_per_image * new_posts,
+        "post_count": base_posts + new_posts
+    }
+    result.update(create_thumbnails(result["path"], config, result["duration"]))
+    result.update(create_hls(result["path"], config))
+    record_video(result)
+    return result
+
+def record_video(result):
+    """
+    Registra no banco de dados um vídeo gerado por process_subreddit
+    
+    Usa a conexão direta do database.py em vez do app Flask, que carregaria a
+    aplicação web inteira só para inserir uma linha. Um vídeo que o reconciler já
+    importou pelo caminho tem o registro atualizado, em vez de duplicado.
+    """
+    try:
+        video_path = result["path"]
+        video_size = os.path.getsize(video_path) if os.path.exists(video_path) else 0
+        
+        # Cria o registro no banco de dados, ou completa o importado pelo reconciler
+        video_id, created = database.save_video(
+            filename=os.path.basename(video_path),
+            path=video_path,
+            subreddit=result["subreddit"],
+            created_at=datetime.datetime.now(),
+            feed_type=result["feed_type"],
+            duration=result["duration"],
+            size=video_size,
+            post_count=result["post_count"],
+            poster_path=result.get("poster_path"),
+            preview_path=result.get("preview_path"),
+            hls_path=result.get("hls_path"),
+            output_format=result.get("output_format")
+        )
+        if created:
+            logger.info(f"Vídeo registrado no banco de dados com ID: {video_id}")
+        else:
+            logger.info(f"Registro {video_id} do vídeo (já importado) atualizado no banco de dados")
+    except Exception as db_error:
+        logger.error(f"Erro ao registrar vídeo no banco de dados: {str(db_error)}")
+            
+def main(overrides=None, executor=None, progress=None):
+    """
+    Gera um vídeo para cada subreddit configurado
+    
+    overrides substitui chaves do config.json apenas nesta execução (usado pelos
+    jobs da fila). Com executor (um ProcessPoolExecutor já iniciado, como o do
+    worker.py) os subreddits são processados nele em vez de em um pool novo.
+    progress (um ProgressReporter) recebe os eventos de progresso do job.
+    
+    Returns:
+        int: número de vídeos gerados
+    """
+    # Carregar configurações
+    config = load_config()
+    config.update(overrides or {})
+    subreddits = config.get("subreddits", ["memes"])
+    
+    if executor is not None:
+        return generate_videos(config, subreddits, executor, progress)
+    
+    # Um processo por subreddit, limitado ao número de núcleos da máquina
+    max_workers = config.get("subreddit_workers") or os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(subreddits)))
+    logger.info(f"Processando {len(subreddits)} subreddit(s) com {max_workers} processo(s)")
+    
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return generate_videos(config, subreddits, executor, progress)
+        
+def generate_videos(config, subreddits, executor, progress=None):
+    """Distribui os subreddits no pool de processos e registra os vídeos gerados"""
+    feed_types = config.get("feed_types", ["hot"])
     
     # Data/hora atual para organização das pastas
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     
-    # Processar cada subreddit
+    # Downloads e normalização das músicas acontecem uma vez, antes dos jobs;
+    # os processos do pool apenas escolhem uma faixa já pronta
+    if config.get("add_music", True):
+        music_library(config).sync()
+    
+    jobs = {}
     for subreddit in subreddits:
         # Escolher um tipo de feed aleatoriamente para ter variedade
         feed_type = random.choice(feed_types)
-        logger.info(f"Processando subreddit: {subreddit}, feed: {feed_type}")
-        
-        # Criar pasta de saída para este subreddit
-        output_folder = f"output_{subreddit}_{timestamp}"
-        os.makedirs(output_folder, exist_ok=True)
-        
-        # Baixar imagens do subreddit usando o feed selecionado
-        if reddit.get_images(sub_name=subreddit, limit=posts_limit, feed_type=feed_type):
-            # Criar vídeo para este subreddit
-            create_video(
-                duration_per_image=image_duration,
-                output_folder=output_folder,
-                name=subreddit,
-                fps=fps,
-                add_music=add_music
-            )
-            
-            # Registrar vídeo no banco de dados
-            try:
-                from app import app, db
-                from models import Video
-                
-                video_path = f"{output_folder}/{subreddit}_memes.mp4"
-                video_size = os.path.getsize(video_path) if os.path.exists(video_path) else 0
-                
-                with app.app_context():
-                    # Cria um novo registro no banco de dados
-                    video = Video(
-                        filename=f"{subreddit}_memes.mp4",
-                        path=video_path,
-                        subreddit=subreddit,
-                        created_at=datetime.datetime.now(),
-                        feed_type=feed_type,
-                        duration=image_duration * posts_limit,
-                        size=video_size,
-                        post_count=posts_limit
-                    )
-                    db.session.add(video)
-                    db.session.commit()
-                    logger.info(f"Vídeo registrado no banco de dados com ID: {video.id}")
-            except Exception as db_error:
-                logger.error(f"Erro ao registrar vídeo no banco de dados: {str(db_error)}")
-        else:
-            logger.warning(f"Falha ao obter imagens do subreddit {subreddit} usando feed {feed_type}")
+        job = executor.submit(process_subreddit, subreddit, feed_type, config, timestamp, progress)
+        jobs[job] = subreddit
+    
+    # Registrar cada vídeo assim que o job correspondente terminar
+    video_count = 0
+    for job in as_completed(jobs):
+        try:
+            result = job.result()
+        except Exception as e:
+            logger.error(f"Erro no processamento do subreddit {jobs[job]}: {str(e)}")
+            continue
+        if result:
+            for video in [result] + result.get("formats", []):
+                record_video(video)
+                video_count += 1
     
     logger.info("Processamento concluído para todos os subreddits")
+    return video_count
 
 if __name__=='__main__':
-    main()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description='Gerador de vídeos de memes do Reddit')
+    parser.add_argument('--append', type=int, metavar='VIDEO_ID',
+                        help='Estende o vídeo informado com as imagens novas do seu subreddit')
+    args = parser.parse_args()
+    
+    if args.append:
+        raise SystemExit(0 if append_to_video(args.append) else 1)
+    else:
+        main()
\ No newline at end of file
@@ -1,5 +1,11 @@
+import json
+import logging
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
 
 db = SQLAlchemy()
 
@@ -7,13 +13,25 @@ class Video(db.Model):
     """Modelo para armazenar informações sobre os vídeos gerados"""
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
-    path = db.Column(db.String(500), nullable=False)
+    path = db.Column(db.String(500), nullable=False, index=True)
     subreddit = db.Column(db.String(100), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     feed_type = db.Column(db.String(20), nullable=True)
     duration = db.Column(db.Integer, nullable=True)  # duração em segundos
     size = db.Column(db.Integer, nullable=True)  # tamanho em bytes
     post_count = db.Column(db.Integer, nullable=True)  # número de posts incluídos
+    poster_path = db.Column(db.String(500), nullable=True)  # imagem exibida antes do play
+    preview_path = db.Column(db.String(500), nullable=True)  # prévia curta em baixa resolução
+    hls_path = db.Column(db.String(500), nullable=True)  # playlist principal (master.m3u8) do HLS
+    output_format = db.Column(db.String(50), nullable=True)  # formato extra (ex.: vertical); None = principal
+    updated_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)  # última alteração do registro
+    
+    # Índices da listagem: ordem (created_at, id) decrescente, com ou sem filtro
+    __table_args__ = (
+        db.Index('ix_video_created_id', 'created_at', 'id'),
+        db.Index('ix_video_subreddit_created_id', 'subreddit', 'created_at', 'id'),
+        db.Index('ix_video_feed_type_created_id', 'feed_type', 'created_at', 'id'),
+    )
     
     def __repr__(self):
         return f"<Video {self.filename} - r/{self.subreddit}>"
@@ -39,6 +57,86 @@ class Video(db.Model):
             return self.created_at.strftime("%d/%m/%Y %H:%M:%S")
         return "Data desconhecida"
 
+def ensure_schema(engine):
+    """
+    Cria em bancos já existentes as colunas e os índices adicionados aos modelos
+    
+    O db.create_all() só cria tabelas novas; em tabelas que já existem, as colunas
+    que faltam (sempre opcionais) são adicionadas com ALTER TABLE e os índices com
+    CREATE INDEX apenas se ainda não existirem.
+    """
+    inspector = inspect(engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                column_type = column.type.compile(dialect=engine.dialect)
+                with engine.begin() as conn:
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+        for index in table.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except IntegrityError as e:
+                # Índice único sobre dados antigos que já o violam: fica para depois da limpeza
+                logger.warning(f"Índice {index.name} não criado: {str(e.orig)}")
+
+class Job(db.Model):
+    """Modelo para a fila de jobs de geração de vídeos"""
+    id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)  # pending, running, done, failed, cancelled
+    params = db.Column(db.Text, nullable=False, default='{}')  # configurações do job (JSON)
+    params_key = db.Column(db.String(64), nullable=False, index=True)  # hash dos parâmetros, para agrupar pedidos iguais
+    source = db.Column(db.String(20), nullable=True)  # origem do pedido: web, scheduler, ...
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    video_count = db.Column(db.Integer, nullable=True)  # vídeos gerados pelo job
+    error = db.Column(db.Text, nullable=True)
+    worker = db.Column(db.String(100), nullable=True)  # worker que executa o job (host:pid)
+    updated_at = db.Column(db.DateTime, nullable=True)  # último sinal de vida do worker
+    
+    # No máximo um job ativo (pendente ou em execução) com os mesmos parâmetros;
+    # índice parcial, disponível no SQLite e no PostgreSQL
+    __table_args__ = (
+        db.Index('ix_job_active_params_key', 'params_key', unique=True,
+                 sqlite_where=text("status IN ('pending', 'running')"),
+                 postgresql_where=text("status IN ('pending', 'running')")).ddl_if(dialect=('sqlite', 'postgresql')),
+    )
+    
+    def __repr__(self):
+        return f"<Job {self.id} - {self.status}>"
+    
+    def to_dict(self):
+        """Retorna o job em formato serializável para a API"""
+        return {
+            "id": self.id,
+            "status": self.status,
+            "params": json.loads(self.params or '{}'),
+            "source": self.source,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "video_count": self.video_count,
+            "error": self.error,
+            "worker": self.worker,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class SeenPost(db.Model):
+    """Modelo dos posts do Reddit que já entraram em algum vídeo (ver seen_posts.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    post_id = db.Column(db.String(20), nullable=False, index=True)  # id do post no Reddit
+    content_hash = db.Column(db.String(64), nullable=True, index=True)  # SHA-256 do JPG usado no vídeo
+    phash = db.Column(db.String(16), nullable=True)  # hash perceptual (dHash de 64 bits, em hex)
+    subreddit = db.Column(db.String(100), nullable=True)
+    url = db.Column(db.String(500), nullable=True)
+    seen_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f"<SeenPost {self.post_id} - r/{self.subreddit}>"
+
 class Subreddit(db.Model):
     """Modelo para armazenar informações sobre os subreddits populares"""
     id = db.Column(db.Integer, primary_key=True)
@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import fcntl
+import random
+import hashlib
+import logging
+import requests
+from ffmpeg_render import normalize_audio, media_duration
+
+logger = logging.getLogger(__name__)
+
+# URLs de músicas de background de domínio público
+DEFAULT_MUSIC_URLS = [
+    "https://www.chosic.com/wp-content/uploads/2021/05/Lofi-Study.mp3",
+    "https://www.chosic.com/wp-content/uploads/2020/05/The-Epic-Hero-Epic-Cinematic-Keys-of-Moon-Music.mp3",
+    "https://www.chosic.com/wp-content/uploads/2021/05/purrple-cat-equinox.mp3"
+]
+
+# Formatos de áudio aceitos na pasta de músicas
+AUDIO_EXTENSIONS = ('.mp3', '.ogg', '.wav', '.m4a', '.flac')
+
+MANIFEST_NAME = 'manifest.json'
+
+# Intervalo mínimo entre tentativas de baixar de novo uma URL que falhou
+DOWNLOAD_RETRY_SECONDS = 24 * 3600
+
+def file_sha256(path):
+    """Hash SHA-256 (hex) do conteúdo de um arquivo, lido em blocos"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class MusicLibrary:
+    """
+    Biblioteca local de músicas de fundo, com versões normalizadas em cache
+    
+    O arquivo music/manifest.json registra, para cada faixa, a origem (URL, se foi
+    baixada), o SHA-256, o tamanho e o mtime do arquivo, e a versão normalizada:
+    AAC com volume padronizado (loudnorm) em ``cache_dir`` e a sua duração. URLs
+    que falharam só são tentadas de novo depois de DOWNLOAD_RETRY_SECONDS.
+    
+    ``sync`` baixa apenas as faixas que ainda não existem, confere a integridade
+    apenas dos arquivos que mudaram (tamanho ou mtime diferentes do manifesto) e
+    normaliza cada conteúdo novo uma única vez. Sem mudanças, custa um stat por
+    faixa. ``pick`` só lê o manifesto, então pode ser usado pelos processos do pool
+    sem tocar na rede nem no ffmpeg.
+    """
+    
+    def __init__(self, folder='music', cache_dir='cache/music', urls=None, loudness=-16):
+        self.folder = folder
+        self.cache_dir = cache_dir
+        self.urls = DEFAULT_MUSIC_URLS if urls is None else urls
+        self.loudness = loudness
+        self.manifest_path = os.path.join(folder, MANIFEST_NAME)
+    
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+        manifest.setdefault("tracks", {})
+        manifest.setdefault("failed_downloads", {})
+        return manifest
+    
+    def _save_manifest(self, manifest):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+    
+    def _download(self, url, path):
+        """Baixa uma faixa para ``path`` (via arquivo temporário); retorna o SHA-256 ou None"""
+        part_path = f"{path}.part"
+        digest = hashlib.sha256()
+        try:
+            with requests.get(url, timeout=30, stream=True) as response:
+                response.raise_for_status()
+                size = 0
+                with open(part_path, 'wb') as f:
+                    for block in response.iter_content(64 * 1024):
+                        digest.update(block)
+                        f.write(block)
+                        size += len(block)
+                expected = response.headers.get('Content-Length')
+                if expected and int(expected) != size and not response.headers.get('Content-Encoding'):
+                    raise IOError(f"download incompleto ({size} de {expected} bytes)")
+        except Exception as e:
+            logger.error(f"Erro ao baixar a música {url}: {str(e)}")
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            return None
+        os.replace(part_path, path)
+        logger.info(f"Música de fundo salva em {path}")
+        return digest.hexdigest()
+    
+    def sync(self):
+        """
+        Atualiza a biblioteca: downloads, conferência de integridade e normalização
+        
+        Várias gerações ao mesmo tempo esperam umas pelas outras (flock), então
+        cada faixa é baixada e normalizada uma única vez.
+        
+        Returns:
+            int: número de faixas prontas para uso
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(os.path.join(self.folder, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            manifest = self._load_manifest()
+            tracks, failed = manifest["tracks"], manifest["failed_downloads"]
+            changed = False
+            
+            # Faixas configuradas por URL que ainda não foram baixadas
+            downloaded = {entry.get("url") for entry in tracks.values()}
+            for i, url in enumerate(self.urls):
+                name = f"background_{i}{os.path.splitext(url.split('?')[0])[1] or '.mp3'}"
+                path = os.path.join(self.folder, name)
+                if url in downloaded and os.path.exists(path):
+                    continue
+                if time.time() - failed.get(url, 0) < DOWNLOAD_RETRY_SECONDS:
+                    continue
+                sha256 = self._download(url, path)
+                if sha256:
+                    tracks[name] = {"url": url, "sha256": sha256}
+                    failed.pop(url, None)
+                else:
+                    failed[url] = time.time()
+                changed = True
+            
+            # Faixas da pasta: novas, alteradas ou removidas
+            names = {name for name in os.listdir(self.folder) if name.lower().endswith(AUDIO_EXTENSIONS)}
+            for name in set(tracks) - names:
+                del tracks[name]
+                changed = True
+            for name in sorted(names):
+                if self._refresh(name, tracks.setdefault(name, {})):
+                    changed = True
+            
+            if changed:
+                self._save_manifest(manifest)
+        return len(self.tracks(manifest))
+    
+    def _refresh(self, name, entry):
+        """Confere e normaliza uma faixa se o arquivo mudou; retorna True se o registro mudou"""
+        path = os.path.join(self.folder, name)
+        stat = os.stat(path)
+        normalized = entry.get("normalized")
+        if (entry.get("size"), entry.get("mtime")) == (stat.st_size, stat.st_mtime) and \
+                entry.get("loudness") == self.loudness and (normalized is None or os.path.exists(normalized)):
+            return False
+        
+        sha256 = file_sha256(path)
+        if entry.get("url") and entry.get("sha256") and entry["sha256"] != sha256:
+            # Arquivo baixado corrompido ou alterado: baixa de novo no próximo sync
+            logger.warning(f"Música {name} não confere com o download original; removendo")
+            os.remove(path)
+            entry.clear()
+            return True
+        
+        entry.update(sha256=sha256, size=stat.st_size, mtime=stat.st_mtime, loudness=self.loudness,
+                     normalized=None, duration=None)
+        target = os.path.join(self.cache_dir, f"{sha256[:32]}_{self.loudness}.m4a")
+        if os.path.exists(target) or normalize_audio(path, target, self.loudness):
+            duration = media_duration(target)
+            if duration:
+                entry.update(normalized=target, duration=round(duration, 3))
+                logger.info(f"Música {name} pronta ({entry['duration']}s)")
+        return True
+    
+    def tracks(self, manifest=None):
+        """Faixas prontas para uso: dicts com name, path (versão normalizada) e duration"""
+        manifest = self._load_manifest() if manifest is None else manifest
+        return [{"name": name, "path": entry["normalized"], "duration": entry["duration"]}
+                for name, entry in sorted(manifest["tracks"].items())
+                if entry.get("normalized") and entry.get("duration") and os.path.exists(entry["normalized"])]
+    
+    def pick(self):
+        """Escolhe uma faixa pronta aleatoriamente, ou None se a biblioteca estiver vazia"""
+        tracks = self.tracks()
+        return random.choice(tracks) if tracks else None
+
+def music_library(config):
+    """Cria a biblioteca de músicas com as pastas, URLs e volume da configuração"""
+    return MusicLibrary(folder=config.get("music_dir", "music"),
+                        cache_dir=config.get("music_cache_dir", "cache/music"),
+                        urls=config.get("music_urls"),
+                        loudness=config.get("music_loudness", -16))
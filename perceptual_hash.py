@@ -0,0 +1,101 @@
+import io
+from PIL import Image
+
+# Lado da grade do dHash: HASH_SIZE × HASH_SIZE bits (64)
+HASH_SIZE = 8
+
+# Contraste mínimo (em níveis de cinza) da imagem reduzida para o hash ser útil
+MIN_CONTRAST = 8
+
+def dhash(source):
+    """
+    Hash perceptual (dHash) de 64 bits de uma imagem
+    
+    A imagem é reduzida para 9×8 em tons de cinza e cada bit indica se um pixel é
+    mais claro que o vizinho da direita. Re-encodings, redimensionamentos e
+    pequenas mudanças de cor quase não alteram os bits, então a mesma imagem
+    repostada gera hashes a poucos bits de distância. Em JPEGs, o draft do PIL
+    decodifica a imagem já reduzida, sem processar a resolução original.
+    
+    Imagens praticamente uniformes (contraste abaixo de MIN_CONTRAST) não têm
+    hash: os bits seriam ruído e todas elas pareceriam iguais entre si.
+    
+    Args:
+        source: bytes da imagem, caminho do arquivo ou imagem do PIL
+    
+    Returns:
+        int: o hash, entre 0 e 2**64 - 1, ou None para imagens uniformes
+    """
+    # Importado aqui: o numpy fica fora da importação do gerador (ver bench_imports.py)
+    import numpy as np
+    
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    img = source if isinstance(source, Image.Image) else Image.open(source)
+    try:
+        img.draft('L', (HASH_SIZE * 8, HASH_SIZE * 8))
+        small = img.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS)
+    finally:
+        if img is not source:
+            img.close()
+    pixels = np.asarray(small, dtype=np.int16)
+    if pixels.max() - pixels.min() < MIN_CONTRAST:
+        return None
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+def hamming(a, b):
+    """Número de bits diferentes entre dois hashes"""
+    return (a ^ b).bit_count()
+
+class BKTree:
+    """
+    Árvore BK para buscar hashes por distância de Hamming
+    
+    Cada nó guarda os filhos pela distância até ele; pela desigualdade triangular,
+    uma busca com raio ``r`` só desce nos filhos com distância entre d - r e
+    d + r, então a maior parte da árvore não é visitada. Inserção e busca custam
+    O(log n) comparações em média.
+    """
+    
+    def __init__(self):
+        self.root = None
+        self.size = 0
+    
+    def add(self, value, item=None):
+        """Insere um hash, associado a ``item`` (por exemplo, o id do post)"""
+        node = [value, item, {}]
+        self.size += 1
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = hamming(value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+    
+    def find(self, value, max_distance):
+        """
+        Itens cujo hash está a no máximo ``max_distance`` bits de ``value``
+        
+        Returns:
+            list: pares (distância, item), do mais próximo ao mais distante
+        """
+        found = []
+        pending = [self.root] if self.root is not None else []
+        while pending:
+            node = pending.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance:
+                found.append((distance, node[1]))
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    pending.append(child)
+        return sorted(found, key=lambda pair: pair[0])
+    
+    def __len__(self):
+        return self.size
@@ -0,0 +1,230 @@
+import io
+import os
+import queue
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from PIL import Image
+from disk_cache import content_hash
+from ffmpeg_render import FrameEncoder
+from formats import MultiFormatEncoder, output_formats
+from frame_source import PeakRSSMonitor
+from preprocess import load_image, normalize_image
+from progress import JobCancelled
+from seen_posts import NoNewPosts
+from segment_cache import SegmentAssembler, build_segment_cache
+
+logger = logging.getLogger(__name__)
+
+# Marca o fim do fluxo em uma fila
+_DONE = object()
+
+def _put(q, item, stop):
+    """Coloca um item na fila esperando por espaço, desistindo se o pipeline for interrompido"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _get(q, stop):
+    """Retira um item da fila, retornando _DONE se o pipeline for interrompido"""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.5)
+        except queue.Empty:
+            continue
+    return _DONE
+
+def _download_stage(reddit, subreddit, limit, feed_type, out_q, stop, errors, progress=None, seen=None,
+                    max_posts=None):
+    """Percorre a listagem e baixa as imagens, em ordem, para a fila de downloads"""
+    try:
+        for post, cached_path, content in reddit.iter_images(subreddit, limit, feed_type, progress, seen,
+                                                             max_posts):
+            # Lido já aqui: o arquivo em cache pode ser removido (LRU) por outro processo
+            try:
+                content = reddit.read_image(post, cached_path, content)
+            except OSError as e:
+                logger.warning(f"Imagem ignorada ({post.url}): {str(e)}")
+                if seen is not None:
+                    seen.release_posts([post.id])
+                continue
+            if not _put(out_q, (post, content), stop):
+                break
+    except Exception as e:
+        errors.append(e)
+    finally:
+        _put(out_q, _DONE, stop)
+
+def _open_image(source):
+    """Decodifica uma imagem inteira, sem ajustá-la a nenhuma resolução"""
+    with Image.open(source) as img:
+        return img.convert('RGB')
+
+def _decode_stage(in_q, out_q, size, mode, workers, stop, segments=None, resize=True, seen=None):
+    """
+    Decodifica as imagens baixadas e as ajusta ao tamanho do quadro do vídeo
+
+    As imagens são processadas por um pool de threads, mas entregues ao encoder na
+    ordem em que chegaram, com no máximo ``workers`` decodificações em andamento.
+    Cada quadro segue acompanhado do hash da imagem; se ``segments`` (um
+    SegmentAssembler) já tem o segmento codificado da imagem, ela nem é decodificada
+    e o quadro segue como None. Com ``resize=False`` a imagem segue no tamanho
+    original (o MultiFormatEncoder a ajusta a cada formato). Imagens que não
+    podem ser decodificadas têm a reserva desfeita em ``seen``.
+    """
+    def emit(post, digest, future):
+        try:
+            frame = future.result()
+        except OSError as e:
+            logger.warning(f"Imagem ignorada ({post.url}): {str(e)}")
+            if seen is not None:
+                seen.release_posts([post.id])
+            return True
+        return _put(out_q, (digest, frame), stop)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        while True:
+            item = _get(in_q, stop)
+            if item is _DONE:
+                break
+            post, content = item
+            digest = content_hash(content)
+            if segments is not None and segments.cached(digest):
+                future = Future()
+                future.set_result(None)
+            elif resize:
+                future = executor.submit(load_image, io.BytesIO(content), size, mode)
+            else:
+                future = executor.submit(_open_image, io.BytesIO(content))
+            in_flight.append((post, digest, future))
+            if len(in_flight) >= workers and not emit(*in_flight.popleft()):
+                break
+        while in_flight and emit(*in_flight.popleft()):
+            pass
+    _put(out_q, _DONE, stop)
+
+def stream_video(reddit, subreddit, feed_type, video_path, config, progress=None, live_dir=None, seen=None):
+    """
+    Gera o vídeo de um subreddit com os estágios sobrepostos
+
+    listagem -> download -> decodificação/redimensionamento -> encoder
+
+    Com o cache de segmentos ativo, o encoder é um SegmentAssembler: imagens já
+    codificadas em vídeos anteriores não são decodificadas nem re-codificadas.
+
+    Cada estágio roda em sua própria thread e se comunica com o seguinte por uma
+    fila limitada, então o encoding da primeira imagem começa enquanto as próximas
+    ainda estão sendo baixadas, e um estágio lento segura os anteriores. A memória
+    usada não depende de ``posts_limit``. Com ``progress`` (um ProgressReporter)
+    cada imagem baixada e cada quadro codificado geram um evento, e um pedido de
+    cancelamento do job interrompe o pipeline.
+
+    Com ``live_dir`` o encoder também grava o vídeo como HLS ao vivo nessa pasta
+    (ver FrameEncoder); nesse modo o cache de segmentos não é usado. Com vários
+    formatos de saída ("output_formats"), cada imagem é decodificada uma vez e
+    codificada em todos eles por um MultiFormatEncoder, também sem o cache.
+
+    Com ``seen`` (um SeenPostIndex), posts já usados em vídeos são pulados e a
+    listagem é percorrida até juntar ``posts_limit`` imagens novas; se não houver
+    nenhuma, NoNewPosts é levantada em vez de gerar o vídeo com a imagem de aviso.
+
+    Returns:
+        int: número de imagens no vídeo (0 em caso de falha)
+    """
+    size = tuple(config.get("output_resolution") or (1280, 720))
+    resize_mode = config.get("resize_mode", "letterbox")
+    queue_size = config.get("pipeline_queue_size", 4)
+    duration = config.get("image_duration", 3)
+
+    downloaded = queue.Queue(maxsize=queue_size)
+    frames = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors = []
+
+    formats = output_formats(config)
+    multi = len(formats) > 1
+    segment_cache = None if live_dir or multi else build_segment_cache(config)
+    if multi:
+        formats = [dict(output_format, size=output_format["size"] or size) for output_format in formats]
+        encoder = MultiFormatEncoder(video_path, formats, duration, live_dir)
+    elif segment_cache is not None:
+        encoder = SegmentAssembler(segment_cache, video_path, size, duration, variant=resize_mode,
+                                   profile=formats[0]["profile"])
+    else:
+        encoder = FrameEncoder(video_path, size, duration, live_dir, formats[0]["profile"])
+
+    stages = [
+        threading.Thread(target=_download_stage, daemon=True,
+                         args=(reddit, subreddit, config.get("posts_limit", 10), feed_type,
+                               downloaded, stop, errors, progress, seen, config.get("posts_scan_limit"))),
+        threading.Thread(target=_decode_stage, daemon=True,
+                         args=(downloaded, frames, size, resize_mode,
+                               max(1, config.get("preprocess_workers", 4)), stop,
+                               encoder if segment_cache is not None else None, not multi, seen)),
+    ]
+    with PeakRSSMonitor() as memory:
+        for stage in stages:
+            stage.start()
+
+        def write(frame, digest):
+            if segment_cache is not None:
+                encoder.write(frame, digest)
+            else:
+                encoder.write(frame)
+
+        try:
+            while True:
+                item = _get(frames, stop)
+                if item is _DONE:
+                    break
+                digest, frame = item
+                if progress:
+                    progress.check_cancelled()
+                write(frame, digest)
+                if progress:
+                    progress.emit('frame_encoded', frames=encoder.frames,
+                                  bytes=os.path.getsize(video_path) if os.path.exists(video_path) else 0,
+                                  live_playlist=encoder.live_playlist if live_dir else None)
+
+            if errors:
+                raise errors[0]
+
+            # Subreddit sem imagens: gera o vídeo com a imagem de aviso
+            if encoder.frames == 0 and seen is not None:
+                raise NoNewPosts(subreddit)
+            if encoder.frames == 0:
+                logger.warning(f"Nenhuma imagem encontrada em r/{subreddit}, usando imagem de aviso")
+                placeholder = reddit.placeholder_image(subreddit)
+                frame = placeholder.convert('RGB') if multi else normalize_image(placeholder, size, resize_mode)
+                write(frame, content_hash(frame.tobytes()))
+        except JobCancelled:
+            logger.info(f"Pipeline de r/{subreddit} cancelado")
+            stop.set()
+            encoder.abort()
+            return 0
+        except NoNewPosts:
+            stop.set()
+            encoder.abort()
+            raise
+        except Exception as e:
+            logger.error(f"Erro no pipeline de r/{subreddit}: {str(e)}")
+            stop.set()
+            encoder.abort()
+            return 0
+        finally:
+            stop.set()
+            for stage in stages:
+                stage.join()
+
+        ok = encoder.close()
+
+    if not ok:
+        return 0
+    logger.info(f"Vídeo salvo em {video_path} ({encoder.frames} imagens, {memory.summary()})")
+    return encoder.frames
@@ -0,0 +1,87 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from ffmpeg_render import fit_on_canvas
+
+logger = logging.getLogger(__name__)
+
+# Modos de ajuste das imagens à resolução de saída
+#   letterbox: amplia ou reduz até caber no quadro e preenche as sobras de preto
+#   fit: apenas reduz imagens maiores que o quadro; as menores ficam no tamanho original
+#   fill: amplia ou reduz até cobrir o quadro inteiro e corta o excesso
+RESIZE_MODES = ('letterbox', 'fit', 'fill')
+
+def scaled_size(image_size, size, mode='letterbox'):
+    """Calcula o tamanho que a imagem deve ter antes de ser posicionada no quadro"""
+    width, height = image_size
+    if mode == 'fill':
+        scale = max(size[0] / width, size[1] / height)
+    else:
+        scale = min(size[0] / width, size[1] / height)
+        if mode == 'fit':
+            scale = min(scale, 1.0)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def normalize_image(img, size, mode='letterbox'):
+    """
+    Ajusta uma imagem PIL à resolução de saída de acordo com o modo
+    
+    Se a imagem ainda não foi decodificada, o modo draft do Pillow é usado para que
+    JPEGs grandes sejam decodificados já reduzidos (1/2, 1/4 ou 1/8 do tamanho),
+    o que é muito mais barato do que decodificar tudo e redimensionar depois.
+    
+    Returns:
+        Image: imagem RGB com exatamente o tamanho ``size``
+    """
+    size = tuple(size)
+    target = scaled_size(img.size, size, mode)
+    if img.format == 'JPEG' and target[0] < img.width:
+        img.draft('RGB', target)
+    img = img.convert('RGB')
+    
+    if img.size != target:
+        img = img.resize(target, Image.LANCZOS, reducing_gap=3.0)
+    
+    if mode == 'fill':
+        left = (img.width - size[0]) // 2
+        top = (img.height - size[1]) // 2
+        return img.crop((left, top, left + size[0], top + size[1]))
+    return fit_on_canvas(img, size)
+
+def load_image(source, size, mode='letterbox'):
+    """Abre uma imagem (caminho ou arquivo em memória) já ajustada à resolução de saída"""
+    with Image.open(source) as img:
+        return normalize_image(img, size, mode)
+
+def _normalize_file(path, size, mode):
+    img = load_image(path, size, mode)
+    img.save(path, format='JPEG', quality=95)
+
+def preprocess_folder(image_files, size, mode='letterbox', workers=4):
+    """
+    Ajusta, no lugar, todas as imagens à resolução de saída usando um pool de threads
+    
+    A decodificação e o redimensionamento do Pillow liberam o GIL, então as imagens
+    são processadas de fato em paralelo.
+    
+    Returns:
+        list: imagens que foram ajustadas com sucesso, na ordem original
+    """
+    if mode not in RESIZE_MODES:
+        logger.warning(f"Modo de redimensionamento desconhecido '{mode}', usando 'letterbox'")
+        mode = 'letterbox'
+    
+    processed = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [executor.submit(_normalize_file, path, size, mode) for path in image_files]
+        for path, future in zip(image_files, futures):
+            try:
+                future.result()
+                processed.append(path)
+            except OSError as e:
+                logger.warning(f"Imagem ignorada ({path}): {str(e)}")
+                os.remove(path)
+    
+    logger.info(f"{len(processed)} imagens ajustadas para {size[0]}x{size[1]} ({mode})")
+    return processed
@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Pasta com um arquivo de eventos (JSON lines) por job
+PROGRESS_DIR = 'progress'
+
+# Evento que encerra o arquivo de um job
+FINISHED_EVENT = 'job_finished'
+
+def progress_path(job_id, folder=PROGRESS_DIR):
+    """Caminho do arquivo de eventos de um job"""
+    return os.path.join(folder, f"{int(job_id)}.jsonl")
+
+def cancel_path(job_id, folder=PROGRESS_DIR):
+    """Caminho do arquivo que pede o cancelamento de um job em execução"""
+    return os.path.join(folder, f"{int(job_id)}.cancel")
+
+class JobCancelled(Exception):
+    """Interrompe a geração de um job cancelado pelo usuário"""
+
+def request_cancel(job_id, folder=PROGRESS_DIR):
+    """
+    Pede o cancelamento de um job em execução
+    
+    O pedido é um arquivo vazio ao lado do arquivo de eventos, visível para o
+    worker e para os processos do pool sem consultar o banco.
+    """
+    os.makedirs(folder, exist_ok=True)
+    with open(cancel_path(job_id, folder), 'a'):
+        pass
+
+def clear_cancel(job_id, folder=PROGRESS_DIR):
+    """Remove o pedido de cancelamento de um job, se existir"""
+    try:
+        os.remove(cancel_path(job_id, folder))
+    except FileNotFoundError:
+        pass
+
+class ProgressReporter:
+    """
+    Registra eventos de progresso de um job em progress/<job_id>.jsonl
+    
+    Cada evento é uma linha JSON acrescentada com O_APPEND em uma única escrita,
+    então o worker, suas threads e os processos do pool podem escrever no mesmo
+    arquivo sem lock. O objeto só guarda o id do job e o contexto, então pode ser
+    enviado para os processos do pool. Sem job_id (execução fora da fila) os
+    eventos são descartados.
+    """
+    
+    def __init__(self, job_id=None, folder=PROGRESS_DIR, **context):
+        self.job_id = job_id
+        self.folder = folder
+        self.context = context
+    
+    def bind(self, **context):
+        """Retorna um reporter que acrescenta os campos informados a todos os eventos"""
+        return ProgressReporter(self.job_id, self.folder, **dict(self.context, **context))
+    
+    def cancelled(self):
+        """Indica se o cancelamento do job foi pedido"""
+        return self.job_id is not None and os.path.exists(cancel_path(self.job_id, self.folder))
+    
+    def check_cancelled(self):
+        """Lança JobCancelled se o cancelamento do job foi pedido"""
+        if self.cancelled():
+            raise JobCancelled(f"Job {self.job_id} cancelado")
+    
+    def emit(self, event, **fields):
+        """Acrescenta um evento ao arquivo do job; falhas nunca interrompem a geração"""
+        if self.job_id is None:
+            return
+        record = {"time": round(time.time(), 3), "job_id": self.job_id, "event": event}
+        record.update(self.context)
+        record.update(fields)
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8')
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            fd = os.open(progress_path(self.job_id, self.folder), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            logger.debug(f"Não foi possível registrar o progresso do job {self.job_id}: {str(e)}")
+
+def read_events(job_id, offset=0, folder=PROGRESS_DIR):
+    """
+    Lê os eventos de um job a partir de uma posição do arquivo
+    
+    Apenas linhas completas são lidas, então a leitura pode acontecer enquanto
+    o job ainda escreve.
+    
+    Returns:
+        tuple: (lista de (posição_final, evento), nova posição)
+    """
+    try:
+        with open(progress_path(job_id, folder), 'rb') as f:
+            # Arquivo recriado (job devolvido para a fila): recomeça do início
+            if offset > os.fstat(f.fileno()).st_size:
+                offset = 0
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return [], offset
+    
+    events = []
+    position = offset
+    for line in data.splitlines(keepends=True):
+        if not line.endswith(b"\n"):
+            break
+        position += len(line)
+        try:
+            events.append((position, json.loads(line)))
+        except ValueError:
+            continue
+    return events, position
+
+def summarize(events):
+    """Resume uma lista de eventos nos contadores exibidos pela API"""
+    summary = {
+        "posts_listed": 0,
+        "images_downloaded": 0,
+        "images_converted": 0,
+        "frames_encoded": 0,
+        "bytes_written": 0,
+        "videos": 0,
+        "live_playlists": {},
+        "last_event": None
+    }
+    # Bytes por (subreddit, formato): cada formato extra é um arquivo próprio
+    listed, frames, written = {}, {}, {}
+    for event in events:
+        name = event.get("event")
+        subreddit = event.get("subreddit")
+        if name == 'image_downloaded':
+            summary["images_downloaded"] += 1
+            summary["images_converted"] += 1 if event.get("converted") else 0
+            listed[subreddit] = max(listed.get(subreddit, 0), event.get("posts_listed", 0))
+        elif name == 'listing_finished':
+            listed[subreddit] = event.get("posts_listed", 0)
+        elif name == 'frame_encoded':
+            frames[subreddit] = event.get("frames", 0)
+            written[(subreddit, None)] = event.get("bytes", 0)
+            if event.get("live_playlist"):
+                summary["live_playlists"][subreddit] = event["live_playlist"]
+        elif name == 'video_written':
+            frames[subreddit] = event.get("frames", frames.get(subreddit, 0))
+            written[(subreddit, event.get("output_format"))] = event.get("bytes", 0)
+            summary["live_playlists"].pop(subreddit, None)
+            summary["videos"] += 1
+        summary["last_event"] = event
+    summary["posts_listed"] = sum(listed.values())
+    summary["frames_encoded"] = sum(frames.values())
+    summary["bytes_written"] = sum(written.values())
+    return summary
@@ -0,0 +1,253 @@
+import os
+import re
+import json
+import time
+import fcntl
+import logging
+import datetime
+import threading
+import database
+
+logger = logging.getLogger(__name__)
+
+# Estado do reconciliador (watermark da última varredura)
+STATE_FILE = "reconciler_state.json"
+
+# output_<subreddit>_<AAAAMMDD_HHMMSS>[_<n>]
+OUTPUT_FOLDER = re.compile(r"^output_(.+)_(\d{8}_\d{6})(?:_\d+)?$")
+
+# Arquivos .mp4 das pastas de saída que não são vídeos (prévias e partes temporárias)
+AUXILIARY_SUFFIXES = (".preview.mp4", ".part.mp4", ".music.mp4")
+
+def parse_output_folder(name):
+    """
+    Extrai o subreddit e a data de uma pasta de saída
+
+    Returns:
+        tuple: (subreddit, datetime), ou None se o nome não for de uma pasta de saída
+    """
+    match = OUTPUT_FOLDER.match(name)
+    if not match:
+        return None
+    subreddit, timestamp = match.groups()
+    try:
+        return subreddit, datetime.datetime.strptime(timestamp, "%Y%m%d_%H%M%S")
+    except ValueError:
+        return subreddit, datetime.datetime.utcnow()
+
+class Reconciler:
+    """
+    Mantém a tabela de vídeos em sincronia com as pastas output_* do disco
+
+    A varredura é incremental: só as pastas modificadas depois da última varredura
+    (watermark pelo mtime da pasta, que muda quando um arquivo é criado, renomeado
+    ou removido) são listadas. Os caminhos encontrados são verificados no banco em
+    lote e os que faltam são inseridos de uma vez, sem uma consulta por arquivo.
+
+    Arquivos modificados há menos de ``settle_seconds`` são ignorados até a
+    próxima varredura: podem estar sendo escritos, e o gerador os registra sozinho
+    ao terminar. Um lock de arquivo garante uma única varredura por vez, mesmo com
+    vários processos (workers do Gunicorn e o scheduler).
+    """
+
+    def __init__(self, root=".", state_file=STATE_FILE, settle_seconds=60):
+        self.root = root
+        self.state_file = state_file
+        self.settle_seconds = settle_seconds
+
+    def _load_watermark(self):
+        try:
+            with open(self.state_file, "r") as f:
+                return json.load(f).get("watermark", 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _save_watermark(self, watermark, stats):
+        state = dict(stats, watermark=watermark,
+                     updated_at=datetime.datetime.now().isoformat(timespec='seconds'))
+        tmp_path = f"{self.state_file}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, self.state_file)
+
+    def run(self, full=False, prune=False):
+        """
+        Executa uma varredura
+
+        Args:
+            full: lista todas as pastas de saída, ignorando o watermark
+            prune: remove do banco os vídeos cujo arquivo não existe mais
+
+        Returns:
+            dict: estatísticas da varredura, ou None se outra varredura estava em andamento
+        """
+        with open(f"{self.state_file}.lock", "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.info("Outra varredura já está em andamento")
+                return None
+            return self._run(full, prune)
+
+    def _run(self, full, prune):
+        started = time.time()
+        watermark = 0 if full else self._load_watermark()
+        cutoff = started - self.settle_seconds
+        new_watermark = cutoff
+        stats = {"folders": 0, "files": 0, "inserted": 0, "pruned": 0}
+
+        candidates = {}
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if not entry.name.startswith("output_") or not entry.is_dir():
+                    continue
+                folder_mtime = entry.stat().st_mtime
+                if folder_mtime <= watermark:
+                    continue
+                info = parse_output_folder(entry.name)
+                if info is None:
+                    continue
+                stats["folders"] += 1
+                settled = self._scan_folder(entry, info, cutoff, candidates)
+                if not settled:
+                    # Pasta com arquivos recentes: será listada de novo na próxima varredura
+                    new_watermark = min(new_watermark, folder_mtime - 1)
+
+        stats["files"] = len(candidates)
+        existing = database.existing_paths(list(candidates))
+        rows = [row for path, row in candidates.items() if path not in existing]
+        database.insert_videos(rows)
+        stats["inserted"] = len(rows)
+
+        if prune:
+            missing = [video_id for video_id, path in database.video_paths()
+                       if not os.path.exists(os.path.join(self.root, path))]
+            database.delete_videos(missing)
+            stats["pruned"] = len(missing)
+
+        stats["seconds"] = round(time.time() - started, 3)
+        self._save_watermark(max(watermark, new_watermark), stats)
+        if stats["inserted"] or stats["pruned"]:
+            logger.info(f"Reconciliação: {stats['inserted']} vídeo(s) importado(s), "
+                        f"{stats['pruned']} removido(s) ({stats['folders']} pasta(s) verificada(s))")
+        return stats
+
+    def _scan_folder(self, folder, info, cutoff, candidates):
+        """Acrescenta os vídeos prontos da pasta; retorna False se algum ainda é recente"""
+        subreddit, created_at = info
+        settled = True
+        with os.scandir(folder.path) as files:
+            all_entries = list(files)
+        entries = [entry for entry in all_entries if entry.is_file()]
+        names = {entry.name for entry in all_entries}
+        for entry in entries:
+            if not entry.name.endswith(".mp4") or entry.name.endswith(AUXILIARY_SUFFIXES):
+                continue
+            file_stat = entry.stat()
+            if file_stat.st_mtime > cutoff:
+                settled = False
+                continue
+            # Mesmo formato de caminho registrado pelo gerador
+            path = f"{folder.name}/{entry.name}"
+            candidates[path] = {
+                "filename": entry.name,
+                "path": path,
+                "subreddit": subreddit,
+                "created_at": created_at,
+                "size": file_stat.st_size,
+                "poster_path": self._sibling(folder.name, names, entry.name, ".jpg"),
+                "preview_path": self._sibling(folder.name, names, entry.name, ".preview.mp4"),
+                "hls_path": self._hls_master(folder, names, entry.name)
+            }
+        return settled
+
+    @staticmethod
+    def _sibling(folder_name, names, video_name, suffix):
+        """Caminho do poster ou da prévia gerados junto com o vídeo, se existirem"""
+        name = os.path.splitext(video_name)[0] + suffix
+        return f"{folder_name}/{name}" if name in names else None
+
+    @staticmethod
+    def _hls_master(folder, names, video_name):
+        """Caminho da master.m3u8 do pacote HLS do vídeo, se o empacotamento terminou"""
+        hls_dir = os.path.splitext(video_name)[0] + "_hls"
+        if hls_dir not in names or not os.path.exists(os.path.join(folder.path, hls_dir, "master.m3u8")):
+            return None
+        return f"{folder.name}/{hls_dir}/master.m3u8"
+
+def reconciler_from_config(config):
+    """Cria o Reconciler com o arquivo de estado e a espera definidos na configuração"""
+    return Reconciler(state_file=config.get("reconcile_state_file", STATE_FILE),
+                      settle_seconds=config.get("reconcile_settle_seconds", 60))
+
+def run_forever(config, stop_event=None):
+    """
+    Loop de reconciliação em segundo plano
+
+    Faz uma varredura completa (com remoção dos vídeos apagados) ao iniciar e a
+    cada reconcile_full_interval_minutes; entre elas, varreduras incrementais a
+    cada reconcile_interval_seconds.
+    """
+    stop_event = stop_event or threading.Event()
+    reconciler = reconciler_from_config(config)
+    interval = config.get("reconcile_interval_seconds", 60)
+    full_interval = config.get("reconcile_full_interval_minutes", 60) * 60
+    prune = config.get("reconcile_prune", True)
+
+    last_full = 0
+    while not stop_event.is_set():
+        full = time.time() - last_full >= full_interval
+        try:
+            reconciler.run(full=full, prune=full and prune)
+            if full:
+                last_full = time.time()
+        except Exception as e:
+            logger.error(f"Erro na reconciliação: {str(e)}")
+        stop_event.wait(interval)
+
+def start_background(config, stop_event=None):
+    """Inicia o loop de reconciliação em uma thread daemon"""
+    thread = threading.Thread(target=run_forever, args=(config, stop_event),
+                              name='reconciler', daemon=True)
+    thread.start()
+    return thread
+
+_once_started = False
+_once_lock = threading.Lock()
+
+def reconcile_once_in_background(config):
+    """Dispara uma única varredura em segundo plano por processo (usado pela página inicial)"""
+    global _once_started
+    with _once_lock:
+        if _once_started:
+            return
+        _once_started = True
+
+    def run():
+        try:
+            reconciler_from_config(config).run()
+        except Exception as e:
+            logger.error(f"Erro na reconciliação: {str(e)}")
+
+    threading.Thread(target=run, name='reconciler-once', daemon=True).start()
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Sincroniza a tabela de vídeos com as pastas de saída')
+    parser.add_argument('--full', action='store_true', help='Verifica todas as pastas, ignorando o watermark')
+    parser.add_argument('--prune', action='store_true', help='Remove do banco os vídeos apagados do disco')
+    parser.add_argument('--watch', action='store_true', help='Continua rodando em segundo plano')
+    args = parser.parse_args()
+
+    with open('config.json', 'r') as f:
+        config = json.load(f)
+    if args.watch:
+        try:
+            run_forever(config)
+        except KeyboardInterrupt:
+            pass
+    else:
+        print(json.dumps(reconciler_from_config(config).run(full=args.full, prune=args.prune)))
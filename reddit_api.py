@@ -0,0 +1,274 @@
+import os
+import re
+import json
+import time
+import fcntl
+import random
+import sqlite3
+import hashlib
+import logging
+import requests
+from contextlib import contextmanager
+from prawcore.exceptions import RequestException
+from prawcore.requestor import Requestor
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+# Respostas que valem uma nova tentativa, depois de esperar
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Listagens de subreddit que podem ser compartilhadas pelo cache
+LISTING_PATH = re.compile(r'/r/[^/]+/(hot|new|top|rising)/?$')
+
+# Número de arquivos de trava das listagens (cada chave usa um deles)
+LOCK_STRIPES = 64
+
+@contextmanager
+def _transaction(path):
+    """Transação exclusiva no banco de estado da API (uma conexão por operação)"""
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+class SharedRateLimiter:
+    """
+    Token bucket da cota da API do Reddit, compartilhado entre processos
+    
+    O estado (fichas disponíveis, taxa de reposição e horário da última
+    atualização) fica em um banco SQLite, então o scheduler, o /run da interface
+    web e os processos do pool consomem a mesma cota. Cada requisição consome uma
+    ficha; sem fichas, ``acquire`` espera a reposição. A taxa começa em
+    ``requests_per_minute`` e é recalculada a cada resposta a partir dos
+    cabeçalhos X-Ratelimit-Remaining e X-Ratelimit-Reset, espalhando as
+    requisições restantes até o fim da janela da cota. ``burst`` limita quantas
+    requisições podem sair de uma vez.
+    """
+    
+    def __init__(self, path, requests_per_minute=100, burst=10):
+        self.path = path
+        self.default_rate = max(requests_per_minute, 1) / 60
+        self.burst = max(1, burst)
+        
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with _transaction(path) as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS rate_limit (
+                                id INTEGER PRIMARY KEY CHECK (id = 1),
+                                tokens REAL NOT NULL,
+                                rate REAL NOT NULL,
+                                updated REAL NOT NULL)""")
+            conn.execute("INSERT OR IGNORE INTO rate_limit VALUES (1, ?, ?, ?)",
+                         (self.burst, self.default_rate, time.time()))
+    
+    def _refill(self, conn):
+        """Lê o estado e repõe as fichas acumuladas desde a última atualização"""
+        tokens, rate, updated = conn.execute("SELECT tokens, rate, updated FROM rate_limit").fetchone()
+        now = time.time()
+        return min(self.burst, tokens + max(0, now - updated) * rate), rate, now
+    
+    def acquire(self):
+        """
+        Consome uma ficha, esperando se a cota estiver esgotada
+        
+        Returns:
+            float: segundos esperados
+        """
+        waited = 0
+        while True:
+            with _transaction(self.path) as conn:
+                tokens, rate, now = self._refill(conn)
+                wait = 0 if tokens >= 1 else (1 - tokens) / rate
+                if not wait:
+                    tokens -= 1
+                conn.execute("UPDATE rate_limit SET tokens = ?, updated = ?", (tokens, now))
+            if not wait:
+                if waited:
+                    logger.info(f"Cota da API do Reddit: {waited:.1f}s de espera")
+                return waited
+            # Espera em partes, para perceber atualizações feitas por outros processos
+            wait = min(wait, 5)
+            time.sleep(wait)
+            waited += wait
+    
+    def update(self, headers):
+        """Ajusta as fichas e a taxa pelos cabeçalhos X-Ratelimit-* de uma resposta"""
+        remaining, reset = headers.get('x-ratelimit-remaining'), headers.get('x-ratelimit-reset')
+        if remaining is None or reset is None:
+            return
+        try:
+            remaining, reset = float(remaining), max(1.0, float(reset))
+        except ValueError:
+            return
+        with _transaction(self.path) as conn:
+            tokens, _, now = self._refill(conn)
+            # Sem cota restante, a próxima ficha só aparece quando a janela reinicia
+            rate = max(remaining, 1) / reset
+            conn.execute("UPDATE rate_limit SET tokens = ?, rate = ?, updated = ?",
+                         (min(tokens, max(remaining, 0)), rate, now))
+
+class ListingCache:
+    """
+    Cache de curta duração das respostas de listagens (hot, new, top, rising)
+    
+    As respostas ficam no mesmo banco SQLite do limitador por ``ttl`` segundos.
+    Pedidos simultâneos da mesma listagem, no mesmo processo ou em processos
+    diferentes, esperam uns pelos outros (flock), então a listagem é buscada uma
+    única vez e os demais pedidos usam a resposta em cache.
+    """
+    
+    def __init__(self, path, ttl=60):
+        self.path = path
+        self.ttl = ttl
+        self.lock_dir = os.path.join(os.path.dirname(path) or '.', 'locks')
+        
+        os.makedirs(self.lock_dir, exist_ok=True)
+        with _transaction(path) as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS listings (
+                                key TEXT PRIMARY KEY,
+                                url TEXT NOT NULL,
+                                body BLOB NOT NULL,
+                                headers TEXT NOT NULL,
+                                fetched_at REAL NOT NULL)""")
+    
+    @staticmethod
+    def key(method, url, params):
+        """Chave de uma requisição de listagem, ou None se a requisição não é uma listagem"""
+        if method.upper() != 'GET' or not LISTING_PATH.search(url.split('?')[0]):
+            return None
+        params = sorted((str(k), str(v)) for k, v in dict(params or {}).items())
+        return hashlib.sha256(json.dumps([url, params]).encode()).hexdigest()
+    
+    @contextmanager
+    def lock(self, key):
+        """Trava a listagem entre threads e processos enquanto ela é buscada"""
+        stripe = int(key[:8], 16) % LOCK_STRIPES
+        with open(os.path.join(self.lock_dir, f"listing-{stripe}.lock"), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+    
+    def get(self, key):
+        """Resposta em cache ainda válida, ou None"""
+        with _transaction(self.path) as conn:
+            row = conn.execute("SELECT url, body, headers FROM listings WHERE key = ? AND fetched_at > ?",
+                               (key, time.time() - self.ttl)).fetchone()
+        if row is None:
+            return None
+        response = requests.Response()
+        response.status_code = 200
+        response.url = row[0]
+        response._content = row[1]
+        response.headers = CaseInsensitiveDict(json.loads(row[2]))
+        response.encoding = 'utf-8'
+        return response
+    
+    def put(self, key, response):
+        """Guarda uma resposta bem-sucedida e descarta as expiradas"""
+        # Os cabeçalhos da cota valem só para a resposta original
+        headers = {k: v for k, v in response.headers.items()
+                   if not k.lower().startswith('x-ratelimit') and k.lower() != 'set-cookie'}
+        now = time.time()
+        with _transaction(self.path) as conn:
+            conn.execute("DELETE FROM listings WHERE fetched_at <= ?", (now - self.ttl,))
+            conn.execute("INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?, ?)",
+                         (key, response.url, response.content, json.dumps(headers), now))
+
+class SharedRequestor(Requestor):
+    """
+    Requestor do prawcore que passa pelo limitador compartilhado
+    
+    Usado com praw.Reddit(requestor_class=SharedRequestor, requestor_kwargs=...).
+    As requisições à API (oauth_url) consomem uma ficha do ``limiter`` e
+    atualizam a cota pelos cabeçalhos da resposta; as listagens passam pelo
+    ``listing_cache``. Respostas 429 e 5xx e erros de conexão são repetidos até
+    ``max_retries`` vezes, com espera exponencial (com jitter) ou, quando o
+    Reddit informa, até o fim da janela da cota (limitada a ``max_backoff``).
+    """
+    
+    def __init__(self, *args, limiter=None, listing_cache=None, max_retries=4, backoff=1.0,
+                 max_backoff=120, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limiter = limiter
+        self.listing_cache = listing_cache
+        self.max_retries = max(0, max_retries)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+    
+    def request(self, *args, timeout=None, **kwargs):
+        method = kwargs.get('method', args[0] if args else 'GET')
+        url = kwargs.get('url', args[1] if len(args) > 1 else '')
+        key = self.listing_cache.key(method, url, kwargs.get('params')) if self.listing_cache else None
+        if key is None:
+            return self._send(url, args, kwargs, timeout)
+        
+        cached = self.listing_cache.get(key)
+        if cached is None:
+            with self.listing_cache.lock(key):
+                # Outro pedido pode ter buscado a listagem enquanto esperávamos
+                cached = self.listing_cache.get(key)
+                if cached is None:
+                    response = self._send(url, args, kwargs, timeout)
+                    if response.status_code == 200:
+                        self.listing_cache.put(key, response)
+                    return response
+        logger.debug(f"Listagem em cache: {url}")
+        return cached
+    
+    def _send(self, url, args, kwargs, timeout):
+        """Envia a requisição respeitando a cota, com novas tentativas"""
+        limited = self.limiter is not None and url.startswith(self.oauth_url)
+        for attempt in range(self.max_retries + 1):
+            if limited:
+                self.limiter.acquire()
+            try:
+                response = super().request(*args, timeout=timeout, **kwargs)
+            except RequestException as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"Erro na requisição ao Reddit ({str(e)}); nova tentativa em {delay:.1f}s")
+            else:
+                if limited:
+                    self.limiter.update(response.headers)
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    return response
+                delay = self._retry_after(response) or self._backoff(attempt)
+                logger.warning(f"Reddit respondeu {response.status_code}; nova tentativa em {delay:.1f}s")
+            time.sleep(delay)
+    
+    def _backoff(self, attempt):
+        return min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1)
+    
+    def _retry_after(self, response):
+        """Espera indicada pelo Reddit (Retry-After ou fim da janela da cota), se houver"""
+        for header in ('retry-after', 'x-ratelimit-reset'):
+            try:
+                return min(self.max_backoff, max(0.0, float(response.headers[header])))
+            except (KeyError, ValueError):
+                continue
+        return None
+
+def reddit_requestor_kwargs(config):
+    """
+    Parâmetros do SharedRequestor a partir do config.json
+    
+    Returns:
+        dict: requestor_kwargs para o praw.Reddit, ou None se o limitador estiver desativado
+    """
+    if not config.get("reddit_shared_rate_limit", True):
+        return None
+    path = os.path.join(config.get("reddit_state_dir", "cache/reddit"), 'api.db')
+    ttl = config.get("reddit_listing_ttl", 60)
+    return {
+        "limiter": SharedRateLimiter(path, config.get("reddit_requests_per_minute", 100),
+                                     config.get("reddit_burst", 10)),
+        "listing_cache": ListingCache(path, ttl) if ttl else None,
+        "max_retries": config.get("reddit_max_retries", 4)
+    }
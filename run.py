@@ -61,12 +61,51 @@ def run_scheduler():
     """Inicia o programador que executará o gerador periodicamente"""
     logger.info("Iniciando programador...")
     try:
-        subprocess.run(["python", "scheduler.py"], check=True)
+        import scheduler
+        scheduler.main()
         return True
     except Exception as e:
         logger.error(f"Erro ao executar programador: {str(e)}")
         return False
 
+def run_worker():
+    """Inicia o worker que executa os jobs da fila (pedidos da web e do agendador)"""
+    logger.info("Iniciando worker...")
+    try:
+        import worker
+        worker.main()
+        return True
+    except Exception as e:
+        logger.error(f"Erro ao executar worker: {str(e)}")
+        return False
+
+def run_append(video_id):
+    """Estende um vídeo existente com as imagens novas do seu subreddit"""
+    logger.info(f"Estendendo o vídeo {video_id}...")
+    try:
+        subprocess.run(["python", "meme_generator.py", "--append", str(video_id)], check=True)
+        return True
+    except Exception as e:
+        logger.error(f"Erro ao estender vídeo: {str(e)}")
+        return False
+
+def run_reconcile():
+    """Sincroniza a tabela de vídeos com as pastas de saída (varredura completa)"""
+    logger.info("Sincronizando vídeos do disco com o banco de dados...")
+    try:
+        import json
+        import reconciler
+        
+        with open("config.json", "r") as f:
+            config = json.load(f)
+        stats = reconciler.reconciler_from_config(config).run(full=True, prune=config.get("reconcile_prune", True))
+        if stats:
+            logger.info(f"{stats['inserted']} vídeo(s) importado(s), {stats['pruned']} removido(s)")
+        return True
+    except Exception as e:
+        logger.error(f"Erro ao sincronizar vídeos: {str(e)}")
+        return False
+
 def parse_arguments():
     """Processa os argumentos da linha de comando"""
     parser = argparse.ArgumentParser(
@@ -77,6 +116,9 @@ def parse_arguments():
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument('--once', action='store_true', help='Executa o gerador uma vez')
     group.add_argument('--scheduler', action='store_true', help='Inicia o programador que executará o gerador periodicamente')
+    group.add_argument('--worker', action='store_true', help='Inicia o worker que executa os jobs da fila')
+    group.add_argument('--append', type=int, metavar='VIDEO_ID', help='Estende um vídeo existente com as imagens novas do seu subreddit')
+    group.add_argument('--reconcile', action='store_true', help='Importa para o banco os vídeos das pastas de saída')
     
     return parser.parse_args()
 
@@ -94,6 +136,12 @@ def main():
         success = run_once()
     elif args.scheduler:
         success = run_scheduler()
+    elif args.worker:
+        success = run_worker()
+    elif args.append:
+        success = run_append(args.append)
+    elif args.reconcile:
+        success = run_reconcile()
     
     # Retornar código de saída apropriado
     sys.exit(0 if success else 1)
@@ -1,8 +1,11 @@
 import time
 import json
+import heapq
+import random
 import logging
 import datetime
-import subprocess
+import itertools
+import threading
 import os
 
 # Configurar logging
@@ -10,6 +13,9 @@ logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Arquivo com as próximas execuções, lido pela API de monitoramento
+STATE_FILE = "scheduler_state.json"
+
 def load_config():
     """Carrega as configurações do arquivo config.json"""
     try:
@@ -28,19 +34,292 @@ def load_config():
             "feed_types": ["hot", "new", "top", "rising"]
         }
 
-def run_meme_generator():
-    """Executa o gerador de memes como um processo separado"""
-    logger.info("Iniciando gerador de memes...")
+class CronExpression:
+    """
+    Expressão cron de 5 campos: minuto hora dia-do-mês mês dia-da-semana
+    
+    Aceita '*', valores, intervalos (1-5), listas (1,15) e passos (*/15, 0-30/10).
+    No dia da semana, 0 e 7 são domingo. Como no cron, se o dia do mês e o dia da
+    semana forem restritos, basta um dos dois coincidir.
+    """
+    
+    FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+    
+    def __init__(self, expression):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"Expressão cron inválida (são necessários 5 campos): '{expression}'")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            self._parse(part, low, high) for part, (low, high) in zip(parts, self.FIELDS))
+        if 7 in self.weekdays:
+            self.weekdays = (self.weekdays - {7}) | {0}
+        self._any_day = parts[2] == '*'
+        self._any_weekday = parts[4] == '*'
+    
+    @staticmethod
+    def _parse(field, low, high):
+        values = set()
+        for part in field.split(','):
+            step = 1
+            if '/' in part:
+                part, step = part.split('/')
+                step = int(step)
+            if part == '*':
+                start, end = low, high
+            elif '-' in part:
+                start, end = (int(v) for v in part.split('-'))
+            else:
+                start = int(part)
+                end = high if step > 1 else start
+            if start < low or end > high or start > end or step < 1:
+                raise ValueError(f"Campo cron fora do intervalo {low}-{high}: '{field}'")
+            values.update(range(start, end + 1, step))
+        return values
+    
+    def _day_matches(self, moment):
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._any_day and self._any_weekday:
+            return True
+        if self._any_day:
+            return weekday
+        if self._any_weekday:
+            return day
+        return day or weekday
+    
+    def next_after(self, moment):
+        """Primeiro minuto depois de ``moment`` (datetime local) que satisfaz a expressão"""
+        moment = moment.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        limit = moment + datetime.timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + datetime.timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + datetime.timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += datetime.timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"A expressão cron '{self.expression}' nunca é satisfeita")
+
+class ScheduledJob:
+    """
+    Um item da agenda: um ou mais subreddits com intervalo ou expressão cron próprios
+    
+    Cada execução vira um job da fila com os subreddits e feeds do item; as chaves
+    de "config" substituem as do config.json apenas nesses jobs.
+    """
+    
+    def __init__(self, spec, config):
+        self.subreddits = list(spec.get("subreddits") or [spec["subreddit"]])
+        if spec.get("feed_type"):
+            self.feed_types = [spec["feed_type"]]
+        else:
+            self.feed_types = list(spec.get("feed_types") or config.get("feed_types", ["hot"]))
+        self.name = spec.get("name") or f"{','.join(self.subreddits)}/{','.join(self.feed_types)}"
+        
+        self.cron = CronExpression(spec["cron"]) if spec.get("cron") else None
+        self.interval = spec.get("interval_minutes", config.get("run_interval_minutes", 60)) * 60
+        self.jitter = spec.get("jitter_seconds", config.get("schedule_jitter_seconds", 30))
+        self.overlap = spec.get("overlap", config.get("schedule_overlap", "skip"))
+        self.run_on_start = spec.get("run_on_start", self.cron is None)
+        self.overrides = spec.get("config", {})
+        
+        self.next_run = None
+        self.retry_at = None
+        self.last_run = None
+        self.last_result = None
+        self.last_job_id = None
+    
+    def describe(self):
+        if self.cron:
+            return f"cron {self.cron.expression}"
+        return f"a cada {self.interval / 60:g} min"
+    
+    def next_time(self, now):
+        """Próxima execução depois de ``now`` (timestamp), já com o atraso aleatório"""
+        if self.cron:
+            due = self.cron.next_after(datetime.datetime.fromtimestamp(now)).timestamp()
+        else:
+            due = now + self.interval
+        return due + random.uniform(0, self.jitter)
+    
+    def params(self):
+        """Configurações do job gerado por este item"""
+        params = dict(self.overrides)
+        params["subreddits"] = self.subreddits
+        params["feed_types"] = self.feed_types
+        return params
+    
+    def to_dict(self):
+        def iso(timestamp):
+            if not timestamp:
+                return None
+            return datetime.datetime.fromtimestamp(timestamp).isoformat(timespec='seconds')
+        
+        return {
+            "name": self.name,
+            "subreddits": self.subreddits,
+            "feed_types": self.feed_types,
+            "schedule": self.describe(),
+            "overlap": self.overlap,
+            "next_run": iso(self.next_run),
+            "retry_at": iso(self.retry_at),
+            "last_run": iso(self.last_run),
+            "last_result": self.last_result,
+            "last_job_id": self.last_job_id
+        }
+
+def build_schedule(config):
+    """
+    Monta os itens da agenda a partir de "schedules" no config.json
+    
+    Sem "schedules", todos os subreddits formam um único item executado a cada
+    run_interval_minutes, como antes.
+    """
+    specs = config.get("schedules") or [{"name": "padrão", "subreddits": config.get("subreddits", ["memes"])}]
+    return [ScheduledJob(spec, config) for spec in specs]
+
+def enqueue_job(params):
+    """
+    Coloca na fila um job de geração de vídeos
+    
+    Se um job com os mesmos parâmetros ainda está na fila ou em execução, nenhum
+    job novo é criado.
+    
+    Returns:
+        tuple: (id do job, True se um job novo foi criado)
+    """
+    from app import app
+    from jobs import enqueue
+    
+    with app.app_context():
+        job, created = enqueue(params, source='scheduler')
+        return job.id, created
+
+def read_state(path=STATE_FILE):
+    """Lê o arquivo de estado do scheduler, ou None se ele não existir"""
     try:
-        subprocess.run(["python", "meme_generator.py"], check=True)
-        logger.info("Gerador de memes executado com sucesso")
-        return True
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Erro ao executar gerador de memes: {str(e)}")
-        return False
-    except Exception as e:
-        logger.error(f"Erro inesperado: {str(e)}")
-        return False
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+        
+class Scheduler:
+    """
+    Agenda baseada em heap: dorme até a próxima execução em vez de verificar o relógio
+    
+    Cada item tem seu intervalo ou expressão cron e um atraso aleatório (jitter),
+    para que vários subreddits não disparem no mesmo segundo. Se a execução
+    anterior do mesmo item ainda está na fila ou rodando, a nova é pulada
+    ("overlap": "skip") ou adiada até a anterior terminar ("coalesce"), nunca
+    empilhada.
+    """
+    
+    def __init__(self, config, dispatch=enqueue_job):
+        self.entries = build_schedule(config)
+        self.dispatch = dispatch
+        self.retry_seconds = config.get("schedule_retry_seconds", 30)
+        self.state_file = config.get("scheduler_state_file", STATE_FILE)
+        self._heap = []
+        self._seq = itertools.count()
+        self._wake = threading.Event()
+        self._stopped = False
+    
+    def _push(self, when, entry, retry=False):
+        heapq.heappush(self._heap, (when, next(self._seq), entry, retry))
+        if retry:
+            entry.retry_at = when
+        else:
+            entry.next_run = when
+    
+    def start(self, now=None):
+        """Calcula a primeira execução de cada item"""
+        now = now or time.time()
+        for entry in self.entries:
+            if entry.run_on_start:
+                first = now + random.uniform(0, entry.jitter)
+            else:
+                first = entry.next_time(now)
+            self._push(first, entry)
+            logger.info(f"Agenda '{entry.name}' ({entry.describe()}): primeira execução em "
+                        f"{datetime.datetime.fromtimestamp(first):%d/%m/%Y %H:%M:%S}")
+        self.write_state()
+    
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+    
+    def run_due(self, now=None):
+        """
+        Executa os itens vencidos
+        
+        Returns:
+            float: segundos até a próxima execução, ou None se a agenda estiver vazia
+        """
+        now = now or time.time()
+        while self._heap and self._heap[0][0] <= now:
+            _, _, entry, retry = heapq.heappop(self._heap)
+            if retry:
+                entry.retry_at = None
+                self._run_entry(entry, now)
+                continue
+            # Uma execução adiada ainda esperando já cobre esta
+            if entry.retry_at is None:
+                self._run_entry(entry, now)
+            self._push(entry.next_time(now), entry)
+        self.write_state()
+        return self._heap[0][0] - now if self._heap else None
+    
+    def _run_entry(self, entry, now):
+        try:
+            job_id, created = self.dispatch(entry.params())
+        except Exception as e:
+            logger.error(f"Erro ao enfileirar '{entry.name}': {str(e)}")
+            entry.last_result = 'error'
+            return
+        
+        entry.last_job_id = job_id
+        if created:
+            entry.last_run = now
+            entry.last_result = 'dispatched'
+            logger.info(f"Agenda '{entry.name}': job {job_id} enfileirado")
+        elif entry.overlap == 'coalesce':
+            entry.last_result = 'coalesced'
+            self._push(now + self.retry_seconds, entry, retry=True)
+            logger.info(f"Agenda '{entry.name}': job {job_id} ainda ativo, execução adiada")
+        else:
+            entry.last_result = 'skipped'
+            logger.info(f"Agenda '{entry.name}': job {job_id} ainda ativo, execução pulada")
+    
+    def write_state(self):
+        """Grava as próximas execuções no arquivo de estado (escrita atômica)"""
+        state = {
+            "updated_at": datetime.datetime.now().isoformat(timespec='seconds'),
+            "entries": [entry.to_dict() for entry in self.entries]
+        }
+        tmp_path = f"{self.state_file}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.state_file)
+        except OSError as e:
+            logger.warning(f"Não foi possível gravar o estado do scheduler: {str(e)}")
+    
+    def run_forever(self):
+        """Loop principal: dorme até o próximo item vencer"""
+        self.start()
+        while not self._stopped:
+            delay = self.run_due()
+            if delay is None:
+                logger.warning("Nenhum item na agenda")
+                return
+            # Acorda ao menos a cada minuto para acompanhar ajustes no relógio
+            self._wake.wait(min(max(delay, 0), 60))
+            self._wake.clear()
 
 def main():
     """Função principal que executa o scheduler"""
@@ -48,45 +327,38 @@ def main():
     
     # Carregar configuração
     config = load_config()
-    interval_minutes = config.get("run_interval_minutes", 60)
-    
-    # Converter para segundos
-    interval_seconds = interval_minutes * 60
     
     # Criar pasta de log se não existir
     if not os.path.exists("logs"):
         os.makedirs("logs")
         logger.info("Pasta de logs criada")
     
-    # Execução inicial
-    run_meme_generator()
-    last_run = datetime.datetime.now()
+    # Worker no mesmo processo: os jobs rodam no pool já iniciado, sem subprocessos.
+    # Desative com "scheduler_worker": false se um worker dedicado estiver rodando.
+    worker = None
+    if config.get("scheduler_worker", True):
+        from worker import Worker
+        worker = Worker(config)
+        threading.Thread(target=worker.run_forever, name='worker', daemon=True).start()
     
-    # Loop do scheduler
-    try:
-        while True:
-            # Calcular o tempo desde a última execução
-            current_time = datetime.datetime.now()
-            elapsed = (current_time - last_run).total_seconds()
-            
-            # Verificar se é hora de executar novamente
-            if elapsed >= interval_seconds:
-                logger.info(f"Intervalo de {interval_minutes} minutos atingido. Executando novamente...")
-                run_meme_generator()
-                last_run = current_time
-            
-            # Mostrar tempo restante a cada 5 minutos
-            if int(elapsed) % 300 == 0:
-                remaining = interval_seconds - elapsed
-                logger.info(f"Próxima execução em {int(remaining / 60)} minutos e {int(remaining % 60)} segundos")
-            
-            # Aguardar um pouco para não sobrecarregar a CPU
-            time.sleep(10)
+    # Mantém a tabela de vídeos em sincronia com as pastas de saída
+    stop_reconciler = threading.Event()
+    if config.get("reconcile_interval_seconds", 60):
+        import reconciler
+        reconciler.start_background(config, stop_reconciler)
     
+    scheduler = Scheduler(config)
+    try:
+        scheduler.run_forever()
     except KeyboardInterrupt:
         logger.info("Scheduler interrompido pelo usuário")
     except Exception as e:
         logger.error(f"Erro no scheduler: {str(e)}")
+    finally:
+        scheduler.stop()
+        stop_reconciler.set()
+        if worker:
+            worker.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,193 @@
+import time
+import logging
+import datetime
+import threading
+import database
+from sqlalchemy.exc import SQLAlchemyError
+from perceptual_hash import BKTree
+
+logger = logging.getLogger(__name__)
+
+# Tentativas de registrar um post no banco antes de seguir só com o índice na memória
+CLAIM_ATTEMPTS = 3
+
+class NoNewPosts(Exception):
+    """Todos os posts da listagem já foram usados: não há vídeo novo a gerar"""
+
+class SeenPostIndex:
+    """
+    Índice dos posts do Reddit que já entraram em algum vídeo
+    
+    Os ids, os hashes de conteúdo e os hashes perceptuais (dHash) dos posts usados
+    nos últimos ``max_age_days`` dias são carregados do banco (tabela seen_post)
+    em conjuntos na memória e em uma árvore BK, então cada consulta é feita sem
+    acesso ao banco. O RedditBot consulta ``seen`` antes de baixar um post e
+    ``claim`` depois do download, para descartar também o mesmo conteúdo
+    publicado com outro id e, com ``max_distance``, as imagens quase idênticas
+    (re-encodings e redimensionamentos da mesma imagem, inclusive de outros
+    subreddits).
+    
+    ``claim`` registra o post no banco na hora, então os subreddits processados
+    ao mesmo tempo em outros processos também enxergam a imagem. Depois que o
+    vídeo é gerado, ``commit`` confirma os registros; se a geração falhar,
+    ``release`` os remove e os posts voltam a ser candidatos. Uma imagem
+    descartada depois do claim (por exemplo, que não pôde ser decodificada) tem a
+    reserva desfeita com ``release_posts`` antes do ``commit``.
+    """
+    
+    def __init__(self, max_age_days=30, max_distance=6):
+        self.max_age = datetime.timedelta(days=max_age_days)
+        self.max_distance = max_distance
+        self.post_ids = set()
+        self.content_hashes = set()
+        self.phashes = BKTree()
+        self._last_id = 0
+        # Reservas ainda não confirmadas: id do registro -> (post_id, content_hash)
+        self._claimed = {}
+        self._lock = threading.Lock()
+        self._load(database.seen_post_rows(datetime.datetime.utcnow() - self.max_age))
+        logger.info(f"Índice de posts já usados: {len(self.post_ids)} posts")
+    
+    def _load(self, rows):
+        """Acrescenta registros do banco ao índice na memória"""
+        for row in rows:
+            self._add(row.post_id, row.content_hash, int(row.phash, 16) if row.phash else None)
+            self._last_id = max(self._last_id, row.id)
+    
+    def _add(self, post_id, content_hash, phash):
+        self.post_ids.add(post_id)
+        if content_hash:
+            self.content_hashes.add(content_hash)
+        if phash is not None:
+            self.phashes.add(phash, post_id)
+    
+    def _duplicate_of(self, content_hash, phash):
+        """Descrição do post já usado com o mesmo conteúdo (ou quase), ou None"""
+        if content_hash in self.content_hashes:
+            return "conteúdo idêntico"
+        if phash is not None and self.max_distance is not None:
+            near = self.phashes.find(phash, self.max_distance)
+            if near:
+                distance, post_id = near[0]
+                return f"quase idêntico ao post {post_id} ({distance} bits de diferença)"
+        return None
+    
+    def seen(self, post_id):
+        """True se o post já foi usado em um vídeo (ou reservado para o vídeo atual)"""
+        return post_id in self.post_ids
+    
+    def claim(self, post_id, content_hash, phash=None, subreddit=None, url=None):
+        """
+        Reserva um post baixado para o vídeo em andamento
+        
+        Um post cujo conteúdo já foi usado (repostagem com outro id) também é
+        registrado, para ser pulado antes do download nas próximas execuções.
+        
+        Se o banco falhar (por exemplo, travado ou fora do ar) mesmo depois de
+        CLAIM_ATTEMPTS tentativas, o post é verificado e guardado apenas no índice
+        na memória: o vídeo não falha, mas outros processos e as próximas
+        execuções não ficam sabendo dele.
+        
+        Returns:
+            bool: False se o post ou o seu conteúdo (ou uma imagem quase idêntica) já foram usados
+        """
+        with self._lock:
+            if post_id in self.post_ids:
+                return False
+            row = {"post_id": post_id, "content_hash": content_hash,
+                   "phash": f"{phash:016x}" if phash is not None else None,
+                   "subreddit": subreddit, "url": url, "seen_at": datetime.datetime.utcnow()}
+            row_id, earlier = self._reserve(row)
+            
+            # Registros feitos por outros processos antes deste contam como anteriores
+            claimed = set(self._claimed)
+            self._load([other for other in earlier if other.id not in claimed])
+            duplicate_of = self._duplicate_of(content_hash, phash)
+            self._add(post_id, content_hash, phash)
+            if row_id is not None:
+                self._claimed[row_id] = (post_id, content_hash)
+                self._last_id = max(self._last_id, row_id)
+        if duplicate_of:
+            logger.info(f"Post {post_id} descartado: {duplicate_of}")
+            return False
+        return True
+    
+    def _reserve(self, row):
+        """
+        Registra o post no banco, com novas tentativas
+        
+        Returns:
+            tuple: o valor de database.reserve_seen_post, ou (None, []) se o banco falhou
+        """
+        for attempt in range(CLAIM_ATTEMPTS):
+            try:
+                return database.reserve_seen_post(row, self._last_id)
+            except SQLAlchemyError as e:
+                error = e
+                time.sleep(0.5 * 2 ** attempt)
+        logger.warning(f"Post {row['post_id']} não registrado no banco ({str(error)}); "
+                       f"usando apenas o índice na memória")
+        return None, []
+    
+    def commit(self):
+        """
+        Confirma os posts reservados e remove os registros expirados
+        
+        Returns:
+            int: número de posts confirmados
+        """
+        with self._lock:
+            count, self._claimed = len(self._claimed), {}
+        try:
+            database.purge_seen_posts(datetime.datetime.utcnow() - self.max_age)
+        except SQLAlchemyError as e:
+            logger.warning(f"Erro ao remover os posts expirados: {str(e)}")
+        logger.info(f"{count} posts registrados como já usados")
+        return count
+    
+    def release_posts(self, post_ids=(), content_hashes=()):
+        """
+        Desfaz as reservas de posts que não entraram no vídeo
+        
+        Os posts são identificados pelo id ou pelo hash do conteúdo (o mesmo do
+        claim, ou seja, do JPG salvo na pasta de imagens) e voltam a ser
+        candidatos. O hash perceptual continua na árvore BK até o fim da execução.
+        """
+        post_ids, content_hashes = set(post_ids), set(content_hashes)
+        with self._lock:
+            released = {row_id: claim for row_id, claim in self._claimed.items()
+                        if claim[0] in post_ids or claim[1] in content_hashes}
+            for row_id, (post_id, content_hash) in released.items():
+                del self._claimed[row_id]
+                self.post_ids.discard(post_id)
+                self.content_hashes.discard(content_hash)
+        if released:
+            self._delete(list(released))
+            logger.info(f"{len(released)} reservas de posts descartados removidas")
+    
+    def release(self):
+        """Remove as reservas ainda não confirmadas (o vídeo não foi gerado)"""
+        with self._lock:
+            row_ids, self._claimed = list(self._claimed), {}
+        if row_ids and self._delete(row_ids):
+            logger.info(f"{len(row_ids)} reservas de posts removidas")
+    
+    def _delete(self, row_ids):
+        """Remove registros do banco; retorna False se o banco falhou"""
+        try:
+            database.delete_seen_posts(row_ids)
+        except SQLAlchemyError as e:
+            logger.warning(f"Erro ao remover {len(row_ids)} reservas de posts: {str(e)}")
+            return False
+        return True
+
+def seen_post_index(config):
+    """Cria o índice de posts já usados, ou None se estiver desativado"""
+    max_age_days = config.get("seen_posts_days", 30)
+    if not max_age_days:
+        return None
+    try:
+        return SeenPostIndex(max_age_days, config.get("phash_max_distance", 6))
+    except Exception as e:
+        logger.error(f"Erro ao carregar o índice de posts já usados: {str(e)}")
+        return None
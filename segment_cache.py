@@ -0,0 +1,172 @@
+import os
+import shutil
+import hashlib
+import logging
+import tempfile
+import itertools
+import threading
+from PIL import Image
+from disk_cache import DiskCache, content_hash
+from ffmpeg_render import (FrameEncoder, VIDEO_TIMESCALE, codec_args, compose_size, concat_segments,
+                           fit_on_canvas)
+
+logger = logging.getLogger(__name__)
+
+def build_segment_cache(config):
+    """Cria o cache de segmentos codificados, ou None se estiver desativado"""
+    max_mb = config.get("segment_cache_max_mb", 1024)
+    if not max_mb:
+        return None
+    return DiskCache(config.get("segment_cache_dir", "cache/segments"), max_mb * 1024 * 1024,
+                     extension='.mp4')
+
+def segment_key(image_digest, duration_per_image, size, variant='', profile=None):
+    """
+    Chave de um segmento: a mesma imagem só reaproveita o segmento se a duração,
+    a resolução, o ajuste (variant) e os parâmetros do encoder (perfil) forem os mesmos
+    """
+    encoder = ' '.join(codec_args(profile) + ['-video_track_timescale', str(VIDEO_TIMESCALE)])
+    raw = f"{image_digest}|{duration_per_image}|{size[0]}x{size[1]}|{variant}|{encoder}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+class SegmentAssembler:
+    """
+    Monta um vídeo a partir de segmentos H.264 de uma imagem cada
+    
+    Cada imagem vira um segmento MP4 de um único quadro, guardado no cache de
+    segmentos. Imagens que já apareceram em outros vídeos (com a mesma duração,
+    resolução e perfil de encoding) não passam pelo encoder: o segmento em cache é
+    reaproveitado e o vídeo final é montado por concatenação com cópia dos streams.
+    
+    Tem a mesma interface do FrameEncoder (write/close/abort/frames), com o hash
+    da imagem como parâmetro extra de write. Com ``base_video`` os segmentos são
+    acrescentados ao final desse vídeo (também por cópia dos streams).
+    """
+    
+    def __init__(self, cache, output_path, size, duration_per_image, variant='', base_video=None,
+                 profile=None):
+        self.cache = cache
+        self.output_path = output_path
+        self.size = tuple(size)
+        self.duration_per_image = duration_per_image
+        self.variant = variant
+        self.profile = profile
+        self.frames = 0
+        self.reused = 0
+        self._segments = [base_video] if base_video else []
+        self._pinned = {}
+        self._names = itertools.count()
+        self._lock = threading.Lock()
+        
+        # Pasta de trabalho dentro do cache: os segmentos novos são movidos para o
+        # cache sem cópia e os reaproveitados são fixados com hard links
+        self._work_dir = tempfile.mkdtemp(prefix='assemble_', dir=self.cache.root)
+    
+    def _pin(self, path):
+        """Fixa um segmento do cache para que a remoção por LRU não o apague durante a montagem"""
+        pinned = os.path.join(self._work_dir, f"{next(self._names)}.mp4")
+        try:
+            os.link(path, pinned)
+        except OSError:
+            shutil.copyfile(path, pinned)
+        return pinned
+    
+    def cached(self, image_digest):
+        """
+        Verifica se já existe um segmento para a imagem, fixando-o para uso posterior
+        
+        Permite pular a decodificação de imagens cujo segmento já está em cache.
+        Pode ser chamado de outra thread (o estágio de decodificação do pipeline).
+        """
+        with self._lock:
+            if image_digest in self._pinned:
+                return True
+            key = segment_key(image_digest, self.duration_per_image, self.size, self.variant, self.profile)
+            path = self.cache.get(key)
+            if path is None:
+                return False
+            try:
+                self._pinned[image_digest] = self._pin(path)
+            except OSError:
+                # Removido por outro processo entre a consulta e o link
+                return False
+            return True
+    
+    def write(self, img, image_digest):
+        """
+        Adiciona a imagem ao vídeo, reaproveitando o segmento em cache se houver
+        
+        ``img`` pode ser None quando ``cached(image_digest)`` já retornou True.
+        """
+        if self.cached(image_digest):
+            self._segments.append(self._pinned[image_digest])
+            self.reused += 1
+        else:
+            if img is None:
+                raise ValueError(f"Segmento {image_digest} não está em cache e nenhuma imagem foi informada")
+            segment_path = os.path.join(self._work_dir, f"new_{len(self._segments)}.mp4")
+            encoder = FrameEncoder(segment_path, self.size, self.duration_per_image, profile=self.profile)
+            try:
+                encoder.write(img)
+            except Exception:
+                encoder.abort()
+                raise
+            if not encoder.close():
+                raise RuntimeError(f"Falha ao codificar o segmento de {image_digest}")
+            
+            key = segment_key(image_digest, self.duration_per_image, self.size, self.variant, self.profile)
+            pinned = self._pin(self.cache.store_file(key, segment_path))
+            with self._lock:
+                self._pinned[image_digest] = pinned
+            self._segments.append(pinned)
+        self.frames += 1
+    
+    def close(self):
+        """Junta os segmentos no vídeo final e retorna True em caso de sucesso"""
+        try:
+            if not self._segments:
+                logger.error(f"Nenhum segmento para gerar {self.output_path}")
+                return False
+            ok = concat_segments(self._segments, self.output_path)
+            if ok:
+                logger.info(f"Segmentos de {self.output_path}: {self.reused} reaproveitados do cache, "
+                            f"{self.frames - self.reused} codificados")
+            return ok
+        finally:
+            shutil.rmtree(self._work_dir, ignore_errors=True)
+    
+    def abort(self):
+        """Descarta a montagem e qualquer saída parcial"""
+        shutil.rmtree(self._work_dir, ignore_errors=True)
+        if os.path.exists(self.output_path):
+            os.remove(self.output_path)
+
+def render_segments(image_files, video_path, duration_per_image, cache, variant='', size=None,
+                    base_video=None, on_frame=None, profile=None):
+    """
+    Equivalente a render_images, mas montando o vídeo a partir do cache de segmentos
+    
+    Apenas as imagens nunca vistas (pelo hash do conteúdo) são codificadas. Com
+    ``base_video`` as imagens são acrescentadas ao final desse vídeo.
+    ``on_frame(frames)`` é chamado a cada imagem adicionada.
+    
+    Returns:
+        bool: True se o vídeo foi gerado com sucesso
+    """
+    size = size or compose_size(image_files)
+    assembler = SegmentAssembler(cache, video_path, size, duration_per_image, variant, base_video, profile)
+    try:
+        for path in image_files:
+            with open(path, 'rb') as f:
+                digest = content_hash(f.read())
+            if assembler.cached(digest):
+                assembler.write(None, digest)
+            else:
+                with Image.open(path) as img:
+                    assembler.write(fit_on_canvas(img, size), digest)
+            if on_frame:
+                on_frame(assembler.frames)
+    except Exception:
+        assembler.abort()
+        raise
+    return assembler.close()
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# Os módulos da aplicação ficam na raiz do repositório
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# O app.py cria as tabelas ao ser importado: os testes usam um SQLite temporário
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="auto_maker_tests_"), "test.db")
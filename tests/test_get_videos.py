@@ -0,0 +1,31 @@
+import datetime
+import pytest
+import database
+from app import app
+from models import db, Video
+
+@pytest.fixture
+def client():
+    """Cliente de teste com um vídeo registrado pelo gerador"""
+    with app.app_context():
+        Video.query.delete()
+        db.session.commit()
+    database.save_video(filename="memes_memes.mp4", path="output_memes_20250410_123045/memes_memes.mp4",
+                        subreddit="memes", created_at=datetime.datetime(2025, 4, 10, 12, 30, 45),
+                        feed_type="hot", poster_path="output_memes_20250410_123045/memes_poster.jpg")
+    return app.test_client()
+
+def test_etag_changes_when_a_video_is_updated_in_place(client):
+    first = client.get("/api/videos?limit=10")
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert client.get("/api/videos?limit=10", headers={"If-None-Match": etag}).status_code == 304
+    
+    # O gerador completa o registro já importado (mesmo caminho, mesmo created_at)
+    database.save_video(filename="memes_memes.mp4", path="output_memes_20250410_123045/memes_memes.mp4",
+                        subreddit="memes", created_at=datetime.datetime(2025, 4, 10, 12, 30, 45),
+                        feed_type="hot", poster_path=None)
+    
+    response = client.get("/api/videos?limit=10", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json[0]["poster_path"] is None
@@ -0,0 +1,52 @@
+import os
+import pytest
+import web_app
+from app import app
+
+VIDEO = "output_memes_20250410_123045/memes_memes.mp4"
+CONTENT = bytes(range(256)) * 4
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Cliente de teste servindo uma pasta de saída com um vídeo de 1024 bytes"""
+    path = tmp_path / VIDEO
+    path.parent.mkdir()
+    path.write_bytes(CONTENT)
+    (tmp_path / "output_memes_20250410_123045" / "notes.txt").write_text("texto")
+    (tmp_path / "secret.mp4").write_bytes(b"fora das pastas de saida")
+    
+    monkeypatch.setattr(app, "root_path", str(tmp_path))
+    monkeypatch.setattr(web_app, "load_config", lambda: {})
+    return app.test_client()
+
+def test_range_returns_partial_content(client):
+    response = client.get(f"/video/{VIDEO}", headers={"Range": "bytes=0-99"})
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes 0-99/{len(CONTENT)}"
+    assert response.data == CONTENT[:100]
+
+def test_suffix_range_returns_end_of_file(client):
+    response = client.get(f"/video/{VIDEO}", headers={"Range": "bytes=-100"})
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes {len(CONTENT) - 100}-{len(CONTENT) - 1}/{len(CONTENT)}"
+    assert response.data == CONTENT[-100:]
+
+def test_unsatisfiable_range(client):
+    response = client.get(f"/video/{VIDEO}", headers={"Range": f"bytes={len(CONTENT) + 10}-"})
+    assert response.status_code == 416
+
+def test_strong_etag_returns_not_modified(client):
+    etag = client.get(f"/video/{VIDEO}").headers["ETag"]
+    assert not etag.startswith("W/")
+    response = client.get(f"/video/{VIDEO}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+
+@pytest.mark.parametrize("path", [
+    "output_memes_20250410_123045/../secret.mp4",
+    "output_memes_20250410_123045/%2e%2e/secret.mp4",
+    "secret.mp4",
+    "output_memes_20250410_123045/notes.txt",
+])
+def test_rejects_paths_outside_outputs_and_other_files(client, path):
+    assert client.get(f"/video/{path}").status_code == 404
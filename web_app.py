@@ -1,11 +1,32 @@
 import os
 import json
-import glob
-from datetime import datetime
+import time
+import base64
+import hashlib
+import threading
 import urllib.parse
-from flask import render_template, send_from_directory, jsonify, request, redirect, url_for
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from markupsafe import Markup
+from flask import (render_template, send_file, jsonify, request, redirect, url_for, abort,
+                   Response, stream_with_context)
+from werkzeug.wsgi import wrap_file
+from sqlalchemy import and_, or_, func
 from app import app
-from models import db, Video, Subreddit
+from models import db, Video, Subreddit, Job
+from jobs import enqueue, cancel
+from progress import read_events, summarize, FINISHED_EVENT
+from scheduler import read_state
+from reconciler import reconcile_once_in_background
+
+# Transmissão de eventos (SSE): intervalo da releitura do status do job no banco,
+# tempo máximo sem eventos e duração máxima de uma conexão, em segundos
+EVENTS_STATUS_INTERVAL = 5
+EVENTS_IDLE_TIMEOUT = 300
+EVENTS_MAX_DURATION = 1800
+
+# Status de um job que já terminou
+FINISHED_STATUSES = ('done', 'failed', 'cancelled')
 
 # Adiciona filtro para URL encode
 @app.template_filter('urlencode')
@@ -31,103 +52,203 @@ def load_config():
 
 @app.route('/')
 def index():
-    """Página inicial que lista todos os vídeos gerados"""
+    """
+    Página inicial que lista todos os vídeos gerados
+    
+    Apenas lê o banco de dados. Os vídeos que estão no disco mas não no banco são
+    importados pelo reconciliador (reconciler.py), que roda junto com o scheduler;
+    se o banco estiver vazio, uma varredura é disparada em segundo plano.
+    """
     # Carrega configuração
     config = load_config()
     
     # Busca subreddits do banco de dados para sugestões
     db_subreddits = Subreddit.query.all()
     
-    # Verifica se há vídeos no banco de dados
-    db_videos = Video.query.order_by(Video.created_at.desc()).all()
+    # Busca apenas a página atual de vídeos (paginação por cursor, como na API)
+    cursor = request.args.get('cursor')
+    try:
+        position = decode_cursor(cursor) if cursor else None
+    except (ValueError, TypeError):
+        cursor, position = None, None
+    db_videos, next_cursor = query_video_page([], position, config.get("index_page_size", 24))
+    if not db_videos and not cursor:
+        reconcile_once_in_background(config)
     
-    # Se não houver vídeos no banco, importa os arquivos de vídeo existentes
-    if not db_videos:
-        # Encontra todas as pastas de saída
-        output_folders = sorted(glob.glob("output_*"), reverse=True)
-        
-        # Coleta informações sobre os vídeos
-        for folder in output_folders:
-            try:
-                # Extrai informações do nome da pasta
-                folder_name = os.path.basename(folder)
-                parts = folder_name.split('_')
-                if len(parts) >= 3:
-                    subreddit = parts[1]
-                    timestamp_str = '_'.join(parts[2:])
-                    
-                    # Converte timestamp para um objeto datetime
-                    try:
-                        timestamp = datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
-                    except ValueError:
-                        timestamp = datetime.utcnow()
-                    
-                    # Procura por arquivos de vídeo no diretório
-                    video_files = glob.glob(f"{folder}/*.mp4")
-                    for video_file in video_files:
-                        video_name = os.path.basename(video_file)
-                        
-                        # Verifica se o vídeo já existe no banco
-                        existing_video = Video.query.filter_by(path=video_file).first()
-                        if not existing_video:
-                            # Obtém o tamanho do arquivo
-                            try:
-                                size_bytes = os.path.getsize(video_file)
-                            except:
-                                size_bytes = 0
-                            
-                            # Cria um novo registro de vídeo
-                            video = Video(
-                                filename=video_name,
-                                path=video_file,
-                                subreddit=subreddit,
-                                created_at=timestamp,
-                                size=size_bytes
-                            )
-                            db.session.add(video)
-            except Exception as e:
-                print(f"Erro ao processar pasta {folder}: {str(e)}")
-        
-        # Salva as alterações no banco de dados
-        try:
-            db.session.commit()
-            print("Vídeos existentes importados para o banco de dados!")
-        except Exception as e:
-            db.session.rollback()
-            print(f"Erro ao salvar vídeos no banco: {str(e)}")
-        
-        # Busca os vídeos novamente
-        db_videos = Video.query.order_by(Video.created_at.desc()).all()
+    cards = [render_video_card(video) for video in db_videos]
+    return render_template("index.html", cards=cards, cursor=cursor, next_cursor=next_cursor,
+                           config=config, subreddits=db_subreddits)
+
+# Cache dos cards de vídeo já renderizados (por processo)
+VIDEO_CARD_CACHE_SIZE = 2048
+_video_cards = OrderedDict()
+_video_cards_lock = threading.Lock()
+
+def render_video_card(video):
+    """
+    HTML do card de um vídeo (templates/_video_card.html), renderizado uma única vez
+    
+    A chave do cache inclui todos os campos exibidos no card e a URL base dos links
+    de compartilhamento. Assim, um vídeo novo ou regravado (por exemplo, quando
+    ganha um poster) gera um fragmento novo, mesmo que tenha sido registrado por
+    outro processo, e as entradas antigas saem do cache por LRU.
+    """
+    key = (video.id, request.url_root, video.path, video.subreddit, video.created_at, video.size,
+           video.feed_type, video.post_count, video.poster_path, video.hls_path, video.output_format)
+    with _video_cards_lock:
+        html = _video_cards.get(key)
+        if html is not None:
+            _video_cards.move_to_end(key)
+            return html
+    
+    html = Markup(render_template("_video_card.html", video=video))
+    with _video_cards_lock:
+        _video_cards[key] = html
+        while len(_video_cards) > VIDEO_CARD_CACHE_SIZE:
+            _video_cards.popitem(last=False)
+    return html
+
+def resolve_output_file(relative_path, extensions):
+    """
+    Caminho absoluto de um arquivo dentro de uma pasta de saída (output_*)
+    
+    Retorna None para qualquer outro caminho: fora das pastas de saída, com
+    extensão não permitida, com '..' ou com um link simbólico que aponte para
+    fora da aplicação.
+    """
+    normalized = os.path.normpath(relative_path)
+    parts = normalized.split(os.sep)
+    if (os.path.isabs(normalized) or len(parts) < 2 or not parts[0].startswith("output_")
+            or '..' in parts or not normalized.lower().endswith(extensions)):
+        return None
     
-    return render_template("index.html", videos=db_videos, config=config, subreddits=db_subreddits)
+    root = os.path.realpath(app.root_path)
+    full_path = os.path.realpath(os.path.join(root, normalized))
+    if os.path.commonpath([root, full_path]) != root or not os.path.isfile(full_path):
+        return None
+    return full_path
+
+def ranged_sendfile_supported(environ):
+    """
+    Indica se o servidor envia um file_wrapper com sendfile respeitando o Content-Length
+    
+    O gunicorn faz isso: um arquivo posicionado no início do trecho é enviado
+    com os.sendfile limitado ao Content-Length, sem passar pelo Python.
+    """
+    wrapper = environ.get('wsgi.file_wrapper')
+    return wrapper is not None and getattr(wrapper, '__module__', '').startswith('gunicorn')
 
 @app.route('/video/<path:video_path>')
 def serve_video(video_path):
-    """Serve o arquivo de vídeo"""
-    # Divide o caminho para obter diretório e nome do arquivo
-    directory = os.path.dirname(video_path)
-    filename = os.path.basename(video_path)
+    """
+    Serve o arquivo de vídeo
+    
+    Apenas arquivos .mp4 das pastas de saída são servidos. As respostas aceitam
+    Range (206, usado pelo navegador ao buscar um trecho e para ler os metadados)
+    e requisições condicionais (ETag forte e Last-Modified, 304). O corpo é
+    enviado pelo file_wrapper do servidor (sendfile no gunicorn), inclusive nas
+    respostas parciais.
+    
+    Com "video_sendfile": "x-accel" (nginx) ou "x-sendfile" (Apache, lighttpd),
+    a aplicação só valida o caminho e o servidor web envia o arquivo.
+    """
+    full_path = resolve_output_file(video_path, ('.mp4',))
+    if full_path is None:
+        abort(404)
+    
+    config = load_config()
+    download = request.args.get('download') == 'true'
+    max_age = config.get("video_cache_max_age", 3600)
+    offload = config.get("video_sendfile", "")
+    
+    if offload in ("x-accel", "x-sendfile"):
+        response = Response(mimetype='video/mp4')
+        if offload == "x-accel":
+            prefix = config.get("video_accel_prefix", "/protected-videos/")
+            relative = os.path.relpath(full_path, os.path.realpath(app.root_path))
+            response.headers['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + urllib.parse.quote(relative)
+        else:
+            response.headers['X-Sendfile'] = full_path
+        if download:
+            response.headers['Content-Disposition'] = f'attachment; filename="{os.path.basename(full_path)}"'
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+        return response
     
-    return send_from_directory(directory, filename, as_attachment=request.args.get('download') == 'true')
+    response = send_file(full_path, mimetype='video/mp4', as_attachment=download,
+                         conditional=True, etag=True, max_age=max_age)
+    response.cache_control.public = True
+    
+    if response.status_code == 206 and ranged_sendfile_supported(request.environ):
+        # Troca a leitura em Python do trecho pedido por um arquivo já posicionado nele
+        response.close()
+        video_file = open(full_path, 'rb')
+        video_file.seek(response.content_range.start)
+        response.response = wrap_file(request.environ, video_file)
+    return response
+
+@app.route('/poster/<path:poster_path>')
+def serve_poster(poster_path):
+    """
+    Serve o poster de um vídeo
+    
+    Cada poster é gerado uma única vez junto com o vídeo e nunca muda, então pode
+    ficar em cache no navegador indefinidamente.
+    """
+    full_path = resolve_output_file(poster_path, ('.jpg',))
+    if full_path is None:
+        abort(404)
+    response = send_file(full_path, mimetype='image/jpeg', conditional=True, etag=True,
+                         max_age=365 * 24 * 3600)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/hls/<path:hls_path>')
+def serve_hls(hls_path):
+    """
+    Serve as playlists (.m3u8) e os segmentos (.ts) do pacote HLS de um vídeo
+    
+    Os segmentos nunca mudam depois de gerados e ficam em cache indefinidamente;
+    as playlists usam o mesmo cache dos vídeos ("video_cache_max_age"), exceto a
+    da prévia ao vivo (<nome>_live/), que muda a cada imagem codificada.
+    """
+    full_path = resolve_output_file(hls_path, ('.m3u8', '.ts'))
+    if full_path is None:
+        abort(404)
+    if full_path.endswith('.ts'):
+        response = send_file(full_path, mimetype='video/mp2t', conditional=True, etag=True,
+                             max_age=365 * 24 * 3600)
+        response.cache_control.immutable = True
+    elif os.path.basename(os.path.dirname(full_path)).endswith('_live'):
+        response = send_file(full_path, mimetype='application/vnd.apple.mpegurl', conditional=True,
+                             etag=True, max_age=0)
+        response.cache_control.no_cache = True
+    else:
+        response = send_file(full_path, mimetype='application/vnd.apple.mpegurl', conditional=True,
+                             etag=True, max_age=load_config().get("video_cache_max_age", 3600))
+    response.cache_control.public = True
+    return response
 
 @app.route('/run', methods=['POST'])
 def run_generation():
-    """Executa o gerador de vídeos com as configurações especificadas"""
-    import subprocess
-    import json
+    """
+    Coloca na fila um job de geração de vídeos com as configurações especificadas
     
+    Retorna imediatamente: o job é executado pelo worker (python run.py --worker).
+    Pedidos iguais a um job que ainda não terminou são agrupados nele. Clientes que
+    pedem JSON recebem o id do job; o formulário é redirecionado para o índice.
+    """
     # Obtém os parâmetros do formulário
     subreddit = request.form.get('subreddit', '')
     limit = request.form.get('limit', '10')
     feed_type = request.form.get('feed_type', 'hot')
     duration = request.form.get('duration', '3')
     
-    # Se o subreddit foi especificado, atualiza o arquivo de configuração
+    # As configurações do formulário valem apenas para este job
+    config = {}
     if subreddit:
         try:
-            # Carrega a configuração atual
-            config = load_config()
-            
             # Verifica se este é um subreddit válido
             if subreddit.startswith('@'):
                 # Usando um subreddit da biblioteca pré-definida
@@ -154,22 +275,136 @@ def run_generation():
             config['feed_types'] = [feed_type]
             config['image_duration'] = int(duration)
             
-            # Salva a configuração de volta ao arquivo
-            with open("config.json", "w") as f:
-                json.dump(config, f, indent=4)
-                
             # Adiciona mensagem de log
-            print(f"Configuração atualizada com subreddits: {config['subreddits']}")
+            print(f"Job com subreddits: {config['subreddits']}")
+        except Exception as e:
+            print(f"Erro ao ler configurações do formulário: {str(e)}")
+            config = {}
+    
+    job, created = enqueue(config, source='web')
+    
+    if request.is_json or request.accept_mimetypes.best == 'application/json':
+        return jsonify({"job_id": job.id, "status": job.status, "coalesced": not created}), 202
+    return redirect(url_for('index', job=job.id))
+
+@app.route('/api/jobs/<int:job_id>')
+def get_job(job_id):
+    """API com o estado de um job e o resumo do seu progresso"""
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return jsonify({"error": "Job não encontrado"}), 404
+    
+    result = job.to_dict()
+    events, _ = read_events(job_id)
+    result["progress"] = summarize(event for _, event in events)
+    return jsonify(result)
+
+@app.route('/api/jobs/<int:job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """
+    Cancela um job
+    
+    Um job pendente é cancelado na hora (200). Um job em execução recebe o pedido
+    de cancelamento (202): o vídeo em andamento é descartado e o job termina como
+    'cancelled' logo depois.
+    """
+    job = cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Job não encontrado"}), 404
+    return jsonify(job.to_dict()), 202 if job.status == 'running' else 200
+
+@app.route('/api/jobs/<int:job_id>/events')
+def stream_job_events(job_id):
+    """
+    Transmite os eventos de progresso de um job via Server-Sent Events
+    
+    Os eventos são lidos do arquivo progress/<job_id>.jsonl, sem consultar o banco
+    a cada atualização. O id de cada mensagem é a posição no arquivo, então um
+    cliente que reconecta (cabeçalho Last-Event-ID) continua de onde parou. A
+    transmissão termina com o evento job_finished.
+    
+    O status do job é relido do banco a cada EVENTS_STATUS_INTERVAL segundos: se
+    o job terminou sem registrar job_finished (worker encerrado à força), o
+    evento é sintetizado a partir do banco. Sem eventos por EVENTS_IDLE_TIMEOUT
+    segundos (worker travado ou job pendente sem worker), ou depois de
+    EVENTS_MAX_DURATION segundos, a transmissão termina com o evento
+    stream_timeout, para não ocupar a thread do servidor indefinidamente.
+    """
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return jsonify({"error": "Job não encontrado"}), 404
+    job_info = job.to_dict()
+    # O stream pode durar minutos: não segurar a conexão com o banco
+    db.session.close()
+    
+    try:
+        offset = int(request.headers.get('Last-Event-ID') or request.args.get('offset', 0))
+    except ValueError:
+        offset = 0
+    
+    def read_job():
+        """Relê o status do job sem manter a conexão com o banco aberta"""
+        try:
+            job = db.session.get(Job, job_id, populate_existing=True)
+            return job.to_dict() if job is not None else None
         except Exception as e:
-            print(f"Erro ao atualizar configuração: {str(e)}")
+            app.logger.warning(f"Erro ao ler o status do job {job_id}: {str(e)}")
+            return job_info
+        finally:
+            db.session.close()
     
-    # Executar o script run.py --once com os novos parâmetros
-    cmd = ["python", "run.py", "--once"]
+    def message(event):
+        return f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
     
-    # Executa o comando em segundo plano
-    subprocess.Popen(cmd)
+    def generate():
+        nonlocal job_info
+        position = offset
+        started = last_event = last_sent = last_checked = time.time()
+        while True:
+            events, position = read_events(job_id, position)
+            for end, event in events:
+                yield f"id: {end}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+                if event.get("event") == FINISHED_EVENT:
+                    return
+            
+            now = time.time()
+            if events:
+                last_event = last_sent = now
+            if not events and (job_info is None or job_info["status"] in FINISHED_STATUSES):
+                # Job finalizado sem job_finished no arquivo (worker encerrado à força ou job
+                # anterior à fila de eventos): o evento final vem do banco
+                finished = {"event": FINISHED_EVENT, "job_id": job_id,
+                            "status": job_info["status"] if job_info else 'failed',
+                            "video_count": job_info["video_count"] if job_info else None,
+                            "error": job_info["error"] if job_info else "Job removido"}
+                yield message(finished)
+                return
+            if now - started > EVENTS_MAX_DURATION or now - last_event > EVENTS_IDLE_TIMEOUT:
+                reason = 'max_duration' if now - started > EVENTS_MAX_DURATION else 'idle'
+                yield message({"event": 'stream_timeout', "job_id": job_id,
+                               "status": job_info["status"], "reason": reason})
+                return
+            if now - last_sent > 15:
+                # Comentário para manter a conexão aberta em proxies
+                yield ": keep-alive\n\n"
+                last_sent = now
+            
+            if not events and now - last_checked >= EVENTS_STATUS_INTERVAL:
+                job_info = read_job()
+                last_checked = now
+            time.sleep(0.5)
     
-    return redirect(url_for('index'))
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/schedule')
+def get_schedule():
+    """API com a agenda do scheduler: próxima e última execução de cada item"""
+    config = load_config()
+    state = read_state(config.get("scheduler_state_file", "scheduler_state.json"))
+    if state is None:
+        return jsonify({"error": "Scheduler não iniciado"}), 404
+    return jsonify(state)
 
 def get_file_size(file_path):
     """Obtém o tamanho do arquivo em formato legível"""
@@ -188,11 +423,100 @@ def get_file_size(file_path):
     except:
         return "Desconhecido"
 
+# Tamanho de página da API de vídeos
+VIDEOS_PAGE_SIZE = 100
+VIDEOS_MAX_PAGE_SIZE = 500
+
+def encode_cursor(video):
+    """Cursor opaco com a posição (created_at, id) do último vídeo da página"""
+    position = json.dumps([video.created_at.isoformat(), video.id])
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    created_at, video_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    return datetime.fromisoformat(created_at), int(video_id)
+
+def query_video_page(filters, position, limit):
+    """
+    Uma página de vídeos em ordem (created_at, id) decrescente, a partir do cursor
+    
+    Returns:
+        tuple: (lista de Video, cursor da próxima página ou None)
+    """
+    query = Video.query.filter(*filters)
+    if position:
+        created_at, video_id = position
+        query = query.filter(or_(Video.created_at < created_at,
+                                 and_(Video.created_at == created_at, Video.id < video_id)))
+    db_videos = query.order_by(Video.created_at.desc(), Video.id.desc()).limit(limit + 1).all()
+    if len(db_videos) > limit:
+        return db_videos[:limit], encode_cursor(db_videos[limit - 1])
+    return db_videos, None
+
+def parse_date_param(value, end=False):
+    """Data (AAAA-MM-DD) ou data e hora ISO; uma data final sem hora inclui o dia inteiro"""
+    moment = datetime.fromisoformat(value)
+    if end and len(value) == 10:
+        moment += timedelta(days=1)
+    return moment
+
+def video_filters(args):
+    """Condições SQL dos filtros subreddit, feed_type, since e until da query string"""
+    filters = []
+    subreddits = [s.strip() for s in args.get('subreddit', '').split(',') if s.strip()]
+    if subreddits:
+        filters.append(Video.subreddit.in_(subreddits))
+    if args.get('feed_type'):
+        filters.append(Video.feed_type == args['feed_type'])
+    if args.get('since'):
+        filters.append(Video.created_at >= parse_date_param(args['since']))
+    if args.get('until'):
+        filters.append(Video.created_at < parse_date_param(args['until'], end=True))
+    return filters
+
 @app.route('/api/videos')
 def get_videos():
-    """API para obter a lista de vídeos em formato JSON"""
-    # Busca vídeos do banco de dados
-    db_videos = Video.query.order_by(Video.created_at.desc()).all()
+    """
+    API para obter a lista de vídeos em formato JSON
+    
+    Paginada por cursor (keyset): os vídeos vêm em ordem (created_at, id)
+    decrescente e a próxima página começa depois do último vídeo da atual, então
+    o custo não cresce com a profundidade da página. O cursor da próxima página
+    vem nos cabeçalhos Link (rel="next") e X-Next-Cursor. A resposta tem ETag e
+    Last-Modified calculados a partir do conjunto filtrado; se nada mudou, a
+    resposta é 304 sem consultar nem serializar a página.
+    """
+    try:
+        filters = video_filters(request.args)
+        limit = min(max(int(request.args.get('limit', VIDEOS_PAGE_SIZE)), 1), VIDEOS_MAX_PAGE_SIZE)
+        cursor = request.args.get('cursor')
+        position = decode_cursor(cursor) if cursor else None
+    except (ValueError, TypeError):
+        return jsonify({"error": "Parâmetros inválidos"}), 400
+    
+    # Versão do conjunto filtrado: muda quando um vídeo é adicionado, removido ou
+    # alterado (registros anteriores ao updated_at usam o created_at)
+    count, last_id, last_updated = (db.session.query(func.count(Video.id), func.max(Video.id),
+                                                     func.max(func.coalesce(Video.updated_at, Video.created_at)))
+                                    .filter(*filters).one())
+    version = f"{count}:{last_id}:{last_updated}:{request.query_string.decode()}"
+    etag = hashlib.sha1(version.encode()).hexdigest()
+    
+    response = Response(mimetype='application/json')
+    response.set_etag(etag)
+    if last_updated:
+        response.last_modified = last_updated
+    response.cache_control.no_cache = True
+    if response.make_conditional(request).status_code == 304:
+        return response
+    
+    db_videos, next_cursor = query_video_page(filters, position, limit)
+    if next_cursor:
+        args = request.args.to_dict()
+        args['cursor'] = next_cursor
+        response.headers['Link'] = f'<{url_for("get_videos", **args)}>; rel="next"'
+        response.headers['X-Next-Cursor'] = next_cursor
     videos = []
     
     for video in db_videos:
@@ -204,11 +528,16 @@ def get_videos():
             "date": video.creation_date_formatted(),
             "size": video.size_format(),
             "feed_type": video.feed_type or "desconhecido",
-            "post_count": video.post_count or 0
+            "post_count": video.post_count or 0,
+            "poster_path": video.poster_path,
+            "preview_path": video.preview_path,
+            "hls_path": video.hls_path,
+            "output_format": video.output_format
         }
         videos.append(video_info)
     
-    return jsonify(videos)
+    response.set_data(json.dumps(videos))
+    return response
 
 @app.route('/api/subreddits')
 def get_subreddits():
@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from app import app
+import jobs
+import meme_generator
+from progress import ProgressReporter, FINISHED_EVENT, progress_path, clear_cancel
+
+logger = logging.getLogger(__name__)
+
+# Tentativas de registrar o fim de um job no banco antes de deixar para o próximo heartbeat
+FINISH_ATTEMPTS = 4
+
+def _warm_up(config):
+    """Inicializa cada processo do pool: bibliotecas já importadas e bot do Reddit pronto"""
+    if config.get("render_engine", "moviepy") == "moviepy":
+        import moviepy.editor
+    meme_generator.get_reddit_bot(config)
+
+def _ready():
+    return os.getpid()
+
+class Worker:
+    """
+    Executa os jobs da fila de geração de vídeos
+
+    Processo de longa duração com um pool de processos iniciado uma única vez
+    (já com o moviepy, o Pillow e o bot do Reddit carregados), compartilhado por
+    todos os jobs. No máximo ``max_concurrent_jobs`` jobs rodam ao mesmo tempo; os
+    demais esperam na tabela de jobs.
+
+    Os jobs reservados ficam em nome do worker (host:pid), que renova o seu
+    heartbeat a cada ``job_heartbeat_seconds``. Jobs de workers encerrados ou com
+    o heartbeat parado há mais de ``job_stale_seconds`` voltam para a fila, então
+    vários workers podem usar o mesmo banco.
+    """
+
+    def __init__(self, config=None):
+        self.config = config or meme_generator.load_config()
+        self.max_jobs = max(1, self.config.get("max_concurrent_jobs", 1))
+        self.poll_seconds = self.config.get("job_poll_seconds", 2)
+        self.heartbeat_seconds = self.config.get("job_heartbeat_seconds", 30)
+        self.stale_seconds = self.config.get("job_stale_seconds", 300)
+        self.worker_id = jobs.worker_id()
+        self._last_heartbeat = 0
+        # Jobs terminados cujo resultado ainda não foi gravado no banco
+        self._unfinished = {}
+        self._unfinished_lock = threading.Lock()
+
+        pool_size = self.config.get("subreddit_workers") or os.cpu_count() or 1
+        self.pool_size = max(1, pool_size)
+        self.pool = ProcessPoolExecutor(max_workers=self.pool_size,
+                                        initializer=_warm_up, initargs=(self.config,))
+        self.runner = ThreadPoolExecutor(max_workers=self.max_jobs, thread_name_prefix='job')
+        self.running = {}
+        self._stop = threading.Event()
+
+    def prewarm(self):
+        """Inicia todos os processos do pool antes do primeiro job"""
+        pids = set(f.result() for f in [self.pool.submit(_ready) for _ in range(self.pool_size)])
+        logger.info(f"Pool de {self.pool_size} processo(s) pronto: {sorted(pids)}")
+
+    def _run_job(self, job_id, params):
+        """Executa um job em uma thread do worker e registra o resultado"""
+        logger.info(f"Iniciando job {job_id}: {params}")
+
+        # Um job devolvido para a fila recomeça com um arquivo de progresso novo
+        if os.path.exists(progress_path(job_id)):
+            os.remove(progress_path(job_id))
+        progress = ProgressReporter(job_id)
+        progress.emit('job_started', params=params)
+
+        video_count, error = None, None
+        try:
+            video_count = meme_generator.main(overrides=params, executor=self.pool, progress=progress)
+            if not video_count and not progress.cancelled():
+                error = "Nenhum vídeo foi gerado"
+        except Exception as e:
+            logger.error(f"Erro no job {job_id}: {str(e)}")
+            error = str(e)
+        cancelled = progress.cancelled()
+        status = 'cancelled' if cancelled else 'failed' if error else 'done'
+        try:
+            self._finish(job_id, dict(video_count=video_count, error=error, cancelled=cancelled))
+        finally:
+            clear_cancel(job_id)
+            progress.emit(FINISHED_EVENT, status=status, video_count=video_count, error=error)
+            logger.info(f"Job {job_id} finalizado ({status}): {video_count or 0} vídeo(s)")
+
+    def _finish(self, job_id, result, attempts=FINISH_ATTEMPTS):
+        """
+        Grava o fim de um job no banco, com novas tentativas
+
+        Se o banco continuar falhando, o job fica na lista de pendentes: o heartbeat
+        o mantém vivo (para que não volte para a fila e rode de novo) e tenta
+        gravar o resultado outra vez.
+
+        Returns:
+            bool: True se o resultado foi gravado
+        """
+        for attempt in range(attempts):
+            try:
+                with app.app_context():
+                    jobs.finish(job_id, **result)
+            except Exception as e:
+                logger.warning(f"Erro ao registrar o fim do job {job_id} "
+                               f"(tentativa {attempt + 1} de {attempts}): {str(e)}")
+                if attempt + 1 < attempts:
+                    time.sleep(2 ** attempt)
+                continue
+            with self._unfinished_lock:
+                self._unfinished.pop(job_id, None)
+            return True
+        logger.error(f"Fim do job {job_id} não registrado no banco; nova tentativa no próximo heartbeat")
+        with self._unfinished_lock:
+            self._unfinished[job_id] = result
+        return False
+
+    def poll(self):
+        """Inicia jobs pendentes enquanto houver vagas; retorna quantos foram iniciados"""
+        for job_id, future in list(self.running.items()):
+            if future.done():
+                del self.running[job_id]
+
+        started = 0
+        with app.app_context():
+            while len(self.running) < self.max_jobs:
+                job = jobs.claim_next(self.worker_id)
+                if job is None:
+                    break
+                params = json.loads(job.params or '{}')
+                self.running[job.id] = self.runner.submit(self._run_job, job.id, params)
+                started += 1
+        return started
+
+    def heartbeat(self):
+        """Renova o heartbeat dos jobs em execução e devolve para a fila os de workers parados"""
+        if time.time() - self._last_heartbeat < self.heartbeat_seconds:
+            return
+        self._last_heartbeat = time.time()
+        with self._unfinished_lock:
+            unfinished = dict(self._unfinished)
+        for job_id, result in unfinished.items():
+            self._finish(job_id, result, attempts=1)
+        try:
+            with app.app_context():
+                running = [job_id for job_id, future in self.running.items() if not future.done()]
+                with self._unfinished_lock:
+                    running += list(self._unfinished)
+                if jobs.heartbeat(running, self.worker_id) < len(running):
+                    logger.warning("Algum job em execução foi devolvido para a fila por outro worker")
+                jobs.requeue_running(self.stale_seconds, keep=running)
+        except Exception as e:
+            logger.error(f"Erro ao renovar o heartbeat dos jobs: {str(e)}")
+
+    def stop(self):
+        """Pede o fim do loop principal; os jobs em andamento terminam normalmente"""
+        self._stop.set()
+
+    def run_forever(self):
+        """Loop principal: busca jobs na fila até ser interrompido"""
+        with app.app_context():
+            jobs.requeue_running(self.stale_seconds)
+        self.prewarm()
+        logger.info(f"Worker aguardando jobs (até {self.max_jobs} ao mesmo tempo)")
+        try:
+            while not self._stop.is_set():
+                self.heartbeat()
+                if not self.poll():
+                    self._stop.wait(self.poll_seconds)
+        finally:
+            # Os jobs em andamento continuam com heartbeat até terminarem
+            while wait(list(self.running.values()), timeout=self.poll_seconds).not_done:
+                self.heartbeat()
+            for job_id, result in list(self._unfinished.items()):
+                self._finish(job_id, result)
+            self.runner.shutdown()
+            self.pool.shutdown()
+
+def main():
+    Worker().run_forever()
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        logger.info("Worker interrompido pelo usuário")